@@ -1,27 +1,54 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import pandas as pd
 import os
 import re
+import time
+import threading
 from datetime import datetime
 import traceback
 import math
+import bisect
 from dotenv import load_dotenv
 import logging
+from data_store import (DatasetStore, DatasetError, OUTPUT_COLUMNS, FILTER_FIELDS, FILTER_MATCH_MODES, frame_bounds,
+                        point_records, EVENT_TYPES, DEFAULT_EVENT_PARAMS, encode_page_cursor, decode_page_cursor,
+                        merge_tracks, downsample_positions, kinematics_summary, naive_utc,
+                        HEATMAP_MIN_RESOLUTION, HEATMAP_TIME_BUCKETS, HEATMAP_GROUP_FIELDS)
+from live_updates import LiveBroker, GLOBAL_CHANNEL, format_event
+import metrics
+from metrics import registry, stage
+from profiling import RequestProfiler
+from log_config import configure_logging
+from lazy_imports import lazy_import, load_all
 
-# 配置详细的日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# pandas 在首次使用时才导入，健康检查等接口不需要等待其加载
+pd = lazy_import('pandas', globals(), 'pd')
 
 # 加载环境变量
 load_dotenv()
 
+# 配置日志：级别由 LOG_LEVEL 控制，通过后台线程异步输出
+configure_logging()
+
+# 每个请求一条汇总日志，替代处理过程中的逐行、逐船日志
+request_logger = logging.getLogger('ship-requests')
+
+
+
+class ShipJSONProvider(DefaultJSONProvider):
+    """缺失的时间(NaT)输出为null，其余类型沿用Flask默认的序列化"""
+
+    @staticmethod
+    def default(o):
+        # 只有pandas的对象才可能是NaT，其他类型不触发pandas导入
+        if type(o).__module__.startswith('pandas') and o is pd.NaT:
+            return None
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = ShipJSONProvider(app)
 
 # 配置 CORS，明确允许 Vercel 域名和其他来源
 CORS(app, resources={
@@ -44,18 +71,226 @@ CORS(app, resources={
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'data/uploads')
 PROCESSED_FOLDER = os.path.join(BASE_DIR, 'data/processed')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+# 目录在第一次写入时创建：事件检测的进程池（spawn）会在子进程中重新导入启动脚本，导入时不做任何写操作
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB限制
 app.config['DEBUG'] = os.environ.get('DEBUG', 'False').lower() == 'true'
 
+# 上传新文件时默认删除旧文件；为True时保留，便于跨多个文件查询（上传请求也可用 keep_existing 参数指定）
+UPLOAD_KEEP_FILES = os.environ.get('UPLOAD_KEEP_FILES', 'False').lower() == 'true'
+
+# 支持的数据文件扩展名
+DATA_FILE_EXTENSIONS = ('.csv', '.xlsx', '.xls', '.txt')
+
 # 存储上传的文件信息
 # 注意：这是内存存储，服务器重启后数据会丢失
 # 生产环境建议使用数据库存储
 uploaded_files = []
 
+# 已读取文件的标准化数据缓存，文件追加写入时只解析新增行
+# 读取时去掉完全重复的点；INGEST_THIN_SECONDS 大于0时按时间桶抽稀，INGEST_THIN_METERS 为桶内保留点的最小距离(米)
+# 最多缓存 MAX_CACHED_DATASETS 个数据集、合计约 MAX_CACHE_MB 兆字节，超出时丢弃最久未用的，为0时不限制
+dataset_store = DatasetStore(
+    cache_dir=PROCESSED_FOLDER,
+    thin_seconds=float(os.environ.get('INGEST_THIN_SECONDS', '0')),
+    thin_meters=float(os.environ.get('INGEST_THIN_METERS', '0')),
+    max_datasets=int(os.environ.get('MAX_CACHED_DATASETS', '64')),
+    max_bytes=int(float(os.environ.get('MAX_CACHE_MB', '2048')) * 1024 * 1024)
+)
+
+
+def _poll_live_file(filename):
+    """实时推送的后台检查：文件有变化时读取，增量由数据集存储回调发布"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(filepath):
+        dataset_store.get(filename, filepath)
+
+
+# 实时推送订阅管理，使用Flask的JSON序列化保证与接口返回格式一致
+live_broker = LiveBroker(
+    _poll_live_file,
+    poll_interval=float(os.environ.get('LIVE_POLL_INTERVAL', '2')),
+    dumps=app.json.dumps
+)
+
+
+def _publish_dataset_changes(dataset, new_rows):
+    """数据集有新数据时向订阅者推送按MMSI分组的增量船位"""
+    if not live_broker.has_subscribers(dataset.filename):
+        return
+    
+    if dataset.last_ingest == 'append':
+        if len(new_rows) == 0:
+            return
+        live_broker.publish(dataset.filename, 'positions', {
+            'filename': dataset.filename,
+            'version': dataset.version,
+            'cursor': dataset.cursor,
+            'new_points': len(new_rows),
+            'ships': dataset.group_by_ship(new_rows)
+        }, event_id=dataset.version)
+    else:
+        # 文件被整体改写，通知客户端重新获取全量数据
+        live_broker.publish(dataset.filename, 'reload', {
+            'filename': dataset.filename,
+            'version': dataset.version,
+            'cursor': dataset.cursor,
+            'total_rows': len(dataset.frame),
+            'total_ships': len(dataset.ships)
+        }, event_id=dataset.version)
+
+
+dataset_store.add_listener(_publish_dataset_changes)
+
+
+# 启动预热：后台线程先导入数据处理依赖，再按最近使用顺序恢复最多 WARMUP_DATASETS 个数据集
+# （Excel读取磁盘上的转换缓存，CSV重新读取，索引和密度网格随读取重建），进度在 /api/health 的 warmup 中返回；
+# 只由服务启动入口调用 start_warmup() 启动，导入本模块（工具脚本、进程池子进程）时不预热
+STARTUP_WARMUP = os.environ.get('STARTUP_WARMUP', 'True').lower() == 'true'
+WARMUP_DATASETS = int(os.environ.get('WARMUP_DATASETS', '3'))
+
+warmup_state = {
+    'status': 'pending' if STARTUP_WARMUP else 'disabled',
+    'datasets': 0,
+    'loaded': 0,
+    'failed': 0,
+    'seconds': None
+}
+
+
+def _warm_up():
+    """后台预热，单个数据集读取失败只记录日志"""
+    started = time.perf_counter()
+    warmup_state['status'] = 'warming'
+    try:
+        load_all()
+        filenames = dataset_store.recent_files(max(WARMUP_DATASETS, 0))
+        warmup_state['datasets'] = len(filenames)
+        # 从其中最久未用的开始读取，读取后最近使用记录和内存中数据集的先后顺序与预热前一致
+        for filename in reversed(filenames):
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            if not os.path.exists(filepath):
+                continue
+            try:
+                dataset_store.get(filename, filepath)
+                warmup_state['loaded'] += 1
+            except Exception as e:
+                warmup_state['failed'] += 1
+                app.logger.warning("预热数据集 %s 失败: %s", filename, e)
+    except Exception as e:
+        app.logger.error("启动预热失败: %s", e)
+        app.logger.debug(traceback.format_exc())
+    finally:
+        warmup_state['seconds'] = round(time.perf_counter() - started, 3)
+        warmup_state['status'] = 'ready'
+        app.logger.info("启动预热完成，恢复 %d 个数据集，用时 %.2f 秒", warmup_state['loaded'], warmup_state['seconds'])
+
+
+def start_warmup():
+    """
+    启动后台预热线程，只启动一次；STARTUP_WARMUP 关闭时不启动
+    调试模式的自动重载由父进程监视文件、子进程(WERKZEUG_RUN_MAIN)处理请求，父进程中不预热
+    """
+    if warmup_state['status'] != 'pending':
+        return
+    if app.debug and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    warmup_state['status'] = 'starting'
+    threading.Thread(target=_warm_up, name='startup-warmup', daemon=True).start()
+
+
+registry.describe('ship_datasets_loaded', 'gauge', '已缓存的数据集数量')
+registry.describe('ship_dataset_rows', 'gauge', '已缓存数据集的有效行数')
+registry.describe('ship_dataset_ships', 'gauge', '已缓存数据集的船只数')
+registry.describe('ship_dataset_bytes', 'gauge', '已缓存数据集占用内存（不含字符串内容）')
+registry.describe('ship_live_subscribers', 'gauge', '实时推送订阅数')
+
+
+def _collect_app_metrics(metrics_registry):
+    """输出指标前刷新数据集缓存和实时订阅相关的仪表"""
+    store_stats = dataset_store.stats()
+    metrics_registry.set_gauge('ship_datasets_loaded', store_stats['datasets'])
+    metrics_registry.set_gauge('ship_dataset_rows', store_stats['rows'])
+    metrics_registry.set_gauge('ship_dataset_ships', store_stats['ships'])
+    metrics_registry.set_gauge('ship_dataset_bytes', store_stats['bytes'])
+    metrics_registry.set_gauge('ship_live_subscribers', live_broker.subscriber_count())
+
+
+registry.add_collector(_collect_app_metrics)
+
+
+@app.before_request
+def _begin_request_metrics():
+    metrics.begin_request()
+    registry.add_gauge('ship_http_requests_in_flight', 1)
+
+
+@app.after_request
+def _finish_request_metrics(response):
+    """记录请求耗时、状态和响应大小，并通过Server-Timing头返回各阶段耗时"""
+    stages, total = metrics.end_request()
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.inc('ship_http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    registry.observe('ship_http_request_duration_seconds', total, endpoint=endpoint)
+    if not response.is_streamed:
+        registry.inc('ship_http_response_bytes_total', response.calculate_content_length() or 0, endpoint=endpoint)
+    timing = metrics.server_timing_header(stages, total)
+    response.headers['Server-Timing'] = timing
+    request_logger.info("%s %s %s %.1fms %s", request.method, request.path, response.status_code,
+                        total * 1000, timing)
+    # 允许跨域页面通过Performance API读取Server-Timing
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+
+@app.teardown_request
+def _end_request_in_flight(exc):
+    registry.add_gauge('ship_http_requests_in_flight', -1)
+
+
+# 请求性能分析：PROFILE_REQUESTS=true 时分析所有请求；
+# 配置 PROFILE_TOKEN 后可对单个请求加 ?profile=1 并携带令牌开启
+request_profiler = RequestProfiler(
+    os.environ.get('PROFILE_DIR', os.path.join(BASE_DIR, 'data/profiles')),
+    enabled=os.environ.get('PROFILE_REQUESTS', 'False').lower() == 'true',
+    token=os.environ.get('PROFILE_TOKEN', ''),
+    max_profiles=int(os.environ.get('PROFILE_MAX_FILES', '50'))
+)
+
+# 不分析查看分析结果本身的请求
+PROFILE_EXCLUDED_ENDPOINTS = {'list_profiles', 'get_profile'}
+
+
+@app.before_request
+def _begin_request_profile():
+    if request.endpoint in PROFILE_EXCLUDED_ENDPOINTS:
+        return
+    if request_profiler.wants_profile(request.args, request.headers):
+        g.profile_session = request_profiler.start()
+
+
+@app.after_request
+def _finish_request_profile(response):
+    session = g.pop('profile_session', None)
+    if session is None:
+        return response
+    try:
+        # 记录的路径中去掉令牌
+        args = {k: v for k, v in request.args.items() if k != 'profile_token'}
+        profile_id = request_profiler.finish(session, {
+            'method': request.method,
+            'path': request.path,
+            'args': args,
+            'endpoint': request.url_rule.rule if request.url_rule else request.path,
+            'status': response.status_code,
+            'content_length': response.calculate_content_length()
+        })
+        response.headers['X-Profile-Id'] = profile_id
+    except Exception as e:
+        app.logger.warning("保存请求分析失败: %s", e)
+    return response
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """上传CSV文件"""
@@ -72,12 +307,15 @@ def upload_file():
         if re.search(r'[\\/:*?"<>|]', file.filename):
             return jsonify({'error': '文件名包含非法字符（不能包含 \\/:*?"<>|）'}), 400
         
+        # 是否保留之前上传的文件
+        keep_existing = request.form.get('keep_existing', str(UPLOAD_KEEP_FILES)).lower() == 'true'
+        
         # 支持CSV、Excel和TXT文件上传
-        if file and file.filename.lower().endswith(('.csv', '.xlsx', '.xls', '.txt')):
-            # 在保存新文件之前，删除uploads目录中的所有旧文件
+        if file and file.filename.lower().endswith(DATA_FILE_EXTENSIONS):
+            # 在保存新文件之前，删除uploads目录中的所有旧文件（keep_existing 时保留）
             try:
                 upload_folder = app.config['UPLOAD_FOLDER']
-                if os.path.exists(upload_folder):
+                if os.path.exists(upload_folder) and not keep_existing:
                     deleted_count = 0
                     for old_file in os.listdir(upload_folder):
                         old_file_path = os.path.join(upload_folder, old_file)
@@ -85,15 +323,16 @@ def upload_file():
                             if os.path.isfile(old_file_path):
                                 os.remove(old_file_path)
                                 deleted_count += 1
-                                app.logger.info(f"已删除旧文件: {old_file}")
+                                app.logger.debug("已删除旧文件: %s", old_file)
                         except Exception as e:
-                            app.logger.warning(f"删除旧文件失败 {old_file}: {str(e)}")
+                            app.logger.warning("删除旧文件失败 %s: %s", old_file, e)
                     
-                    # 清空已上传文件列表
+                    # 清空已上传文件列表和对应的数据缓存
                     uploaded_files.clear()
-                    app.logger.info(f"已清理 {deleted_count} 个旧文件")
+                    dataset_store.clear(remove_cache=True)
+                    app.logger.info("已清理 %d 个旧文件", deleted_count)
             except Exception as e:
-                app.logger.warning(f"清理旧文件时出错: {str(e)}")
+                app.logger.warning("清理旧文件时出错: %s", e)
                 # 继续执行，不阻止新文件上传
             
             # 生成唯一文件名
@@ -104,6 +343,7 @@ def upload_file():
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
             
             # 检查目标目录是否可写
+            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
             if not os.access(app.config['UPLOAD_FOLDER'], os.W_OK):
                 return jsonify({'error': '文件目录无写入权限'}), 500
             
@@ -121,6 +361,16 @@ def upload_file():
             }
             uploaded_files.append(file_info)
             
+            # Excel文件在上传时转换一次，之后所有接口都读取转换后的数据
+            if filename.lower().endswith(('.xlsx', '.xls')):
+                try:
+                    dataset_store.get(filename, filepath)
+                except Exception as e:
+                    app.logger.warning("转换Excel文件 %s 失败: %s", filename, e)
+            
+            # 通知订阅了上传事件的客户端
+            live_broker.publish(GLOBAL_CHANNEL, 'upload', file_info)
+            
             return jsonify({
                 'message': '文件上传成功',
                 'filename': filename,
@@ -130,7 +380,7 @@ def upload_file():
             return jsonify({'error': '只支持CSV、Excel和TXT文件(.csv, .xlsx, .xls, .txt)'}), 400
             
     except Exception as e:
-            app.logger.error(f"上传错误: {str(e)}")
+            app.logger.error("上传错误: %s", e)
             app.logger.debug(traceback.format_exc())
             # 不向用户暴露详细错误信息
             return jsonify({'error': '上传过程中发生错误'}), 500
@@ -157,253 +407,80 @@ def get_csv_data(filename):
         if not os.path.exists(filepath):
             return jsonify({'error': '文件不存在', 'filepath': filepath}), 404
         
-        # 添加文件修改时间到日志，用于调试实时更新
-        file_mtime = os.path.getmtime(filepath)
-        file_mtime_str = datetime.fromtimestamp(file_mtime).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
-        app.logger.info(f"读取文件: {filename}, 最后修改时间: {file_mtime_str}")
-        
-        # 尝试读取文件，支持CSV和Excel格式
-        df = None
-        
-        # 检查文件扩展名
-        file_ext = os.path.splitext(filename)[1].lower()
+        # 添加文件修改时间到日志，用于调试实时更新（仅DEBUG级别时计算）
+        if app.logger.isEnabledFor(logging.DEBUG):
+            file_mtime_str = datetime.fromtimestamp(os.path.getmtime(filepath)).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            app.logger.debug("读取文件: %s, 最后修改时间: %s", filename, file_mtime_str)
         
+        # 按船只属性筛选
         try:
-            # 如果是Excel文件，使用read_excel读取
-            if file_ext in ['.xlsx', '.xls']:
-                print(f"尝试读取Excel文件: {filepath}")
-                df = pd.read_excel(filepath)
-                print("成功读取Excel文件")
-            # 对于CSV和TXT文件，作为CSV格式读取，支持多种编码格式
-            else:
-                encodings = ['utf-8-sig', 'utf-8', 'gbk', 'gb2312', 'gb18030', 'latin-1', 'cp1252', 
-                         'utf-16', 'utf-16-le', 'utf-16-be', 'cp936', 'cp437']
-                
-                for encoding in encodings:
-                    try:
-                        print(f"尝试使用 {encoding} 编码读取文件: {filepath}")
-                        df = pd.read_csv(filepath, encoding=encoding)
-                        print(f"成功使用 {encoding} 编码读取文件")
-                        break
-                    except UnicodeDecodeError:
-                        print(f"{encoding} 编码解析失败，尝试下一种编码")
-                        continue
-                    except Exception as e:
-                        print(f"读取CSV/TXT文件时出错: {str(e)}")
-                        continue
-        except Exception as e:
-            print(f"读取文件时发生错误: {str(e)}")
-        
-        if df is None:
-            return jsonify({'error': '文件格式错误，无法解析', 'file_type': file_ext}), 400
-        
-        # ========== 数据预处理 ==========
-        # 只获取指定的字段：mmsi, lon, lat, dest, vessel_type
-        # 1. 转换列名到小写，方便后续处理
-        df.columns = df.columns.str.lower()
-        
-        # 2. 识别并标准化字段
-        # 识别MMSI字段（船只标识符）
-        mmsi_columns = ['mmsi', 'mmsi_number', 'ship_mmsi']
-        mmsi_column = None
-        for col in mmsi_columns:
-            if col in df.columns:
-                mmsi_column = col
-                break
-        
-        # 识别经度字段
-        lon_columns = ['lon', 'longitude', 'long', 'lng']
-        lon_column = None
-        for col in lon_columns:
-            if col in df.columns:
-                lon_column = col
-                break
-        
-        # 识别纬度字段
-        lat_columns = ['lat', 'latitude', 'latitude_']
-        lat_column = None
-        for col in lat_columns:
-            if col in df.columns:
-                lat_column = col
-                break
-        
-        # 识别目的地字段
-        dest_columns = ['dest', 'destination', 'port', 'dest_port']
-        dest_column = None
-        for col in dest_columns:
-            if col in df.columns:
-                dest_column = col
-                break
-        
-        # 识别船舶类型字段
-        vessel_type_columns = ['vessel_type', 'vesseltype', 'vessel-type', 'type', 'ship_type']
-        vessel_type_column = None
-        for col in vessel_type_columns:
-            if col in df.columns:
-                vessel_type_column = col
-                break
-        
-        # 识别时间字段
-        time_columns = ['postime', 'timestamp', 'time', 'datetime', 'date', 'record_time', 'update_time', 'time_stamp']
-        time_column = None
-        for col in time_columns:
-            if col in df.columns:
-                time_column = col
-                break
-        
-        # 识别国旗国家字段
-        flag_ctry_columns = ['flag_ctry', 'flag_country', 'country', 'flag']
-        flag_ctry_column = None
-        for col in flag_ctry_columns:
-            if col in df.columns:
-                flag_ctry_column = col
-                break
-        
-        # 构建新的DataFrame，只包含需要的字段
-        new_df_data = {}
-        
-        # 处理MMSI字段
-        if mmsi_column:
-            if pd.api.types.is_numeric_dtype(df[mmsi_column]):
-                new_df_data['mmsi'] = df[mmsi_column].astype(str)
-            else:
-                new_df_data['mmsi'] = df[mmsi_column].astype(str)
-        else:
-            # 如果没有mmsi字段，使用索引作为标识
-            new_df_data['mmsi'] = df.index.astype(str)
+            filters, match = _parse_filters()
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
         
-        # 处理经度字段
-        if lon_column:
-            new_df_data['lon'] = pd.to_numeric(df[lon_column], errors='coerce')
-        else:
-            app.logger.warning("未找到经度字段")
-            return jsonify({'error': 'CSV文件中未找到经度字段(lon/longitude)'}), 400
-        
-        # 处理纬度字段
-        if lat_column:
-            new_df_data['lat'] = pd.to_numeric(df[lat_column], errors='coerce')
-        else:
-            app.logger.warning("未找到纬度字段")
-            return jsonify({'error': 'CSV文件中未找到纬度字段(lat/latitude)'}), 400
-        
-        # 处理目的地字段
-        if dest_column:
-            new_df_data['dest'] = df[dest_column].astype(str)
-            # 将空值和'nan'字符串替换为空字符串
-            new_df_data['dest'] = new_df_data['dest'].replace(['nan', 'None', 'null', 'NaN', 'NAN'], '')
-            new_df_data['dest'] = new_df_data['dest'].fillna('')
-        else:
-            new_df_data['dest'] = ''
-        
-        # 处理船舶类型字段
-        if vessel_type_column:
-            new_df_data['vessel_type'] = df[vessel_type_column].astype(str)
-            # 将空值和'nan'字符串替换为空字符串
-            new_df_data['vessel_type'] = new_df_data['vessel_type'].replace(['nan', 'None', 'null', 'NaN', 'NAN'], '')
-            new_df_data['vessel_type'] = new_df_data['vessel_type'].fillna('')
-        else:
-            new_df_data['vessel_type'] = ''
-        
-        # 处理国旗国家字段
-        if flag_ctry_column:
-            new_df_data['flag_ctry'] = df[flag_ctry_column].astype(str)
-            # 将空值和'nan'字符串替换为空字符串
-            new_df_data['flag_ctry'] = new_df_data['flag_ctry'].replace(['nan', 'None', 'null', 'NaN', 'NAN'], '')
-            new_df_data['flag_ctry'] = new_df_data['flag_ctry'].fillna('')
-        else:
-            new_df_data['flag_ctry'] = ''
-        
-        # 处理时间字段(postime)
-        if time_column:
-            # 尝试将时间字段转换为datetime类型
-            try:
-                new_df_data['postime'] = pd.to_datetime(df[time_column], errors='coerce')
-            except:
-                new_df_data['postime'] = df[time_column].astype(str)
-        else:
-            # 如果没有时间字段，创建一个空的postime列
-            app.logger.warning("未找到时间字段(postime/timestamp)")
-            new_df_data['postime'] = pd.NaT
-        
-        # 创建新的DataFrame
-        df = pd.DataFrame(new_df_data)
-        
-        # 4. 过滤无效的经纬度数据
-        original_rows = len(df)
-        df = df[(pd.notna(df['lon'])) & (pd.notna(df['lat']))]
-        df = df[(df['lon'] >= -180) & (df['lon'] <= 180)]
-        df = df[(df['lat'] >= -90) & (df['lat'] <= 90)]
-        
-        # 记录过滤后的行数
-        filtered_rows = len(df)
-        if original_rows > filtered_rows:
-            app.logger.info(f"文件 {filename}: 过滤了 {original_rows - filtered_rows} 行无效经纬度数据，剩余 {filtered_rows} 行有效数据")
-        
-        if len(df) == 0:
-            return jsonify({'error': '没有有效的经纬度数据'}), 400
+        # 从数据集存储获取数据，文件只追加时仅解析新增的行
+        try:
+            dataset = dataset_store.get(filename, filepath)
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
         
-        # 5. 按MMSI分组
-        ship_groups = {}
-        max_rows = 200000  # 提高单个船只轨迹点数限制到20万
-        global_start_time = None
-        global_end_time = None
-        
-        if 'mmsi' in df.columns:
-            df_with_mmsi = df[pd.notna(df['mmsi'])]
-            for mmsi_id, ship_data in df_with_mmsi.groupby('mmsi'):
-                # 确保轨迹点按postime排序
-                if 'postime' in ship_data.columns and pd.api.types.is_datetime64_any_dtype(ship_data['postime']):
-                    ship_data_sorted = ship_data.sort_values('postime')
-                    app.logger.info(f"船只 {mmsi_id} 已按时间排序，共 {len(ship_data_sorted)} 个点")
-                    
-                    # 计算该船只的时间范围，用于全局时间范围计算
-                    ship_valid_times = ship_data_sorted['postime'].dropna()
-                    if len(ship_valid_times) > 0:
-                        ship_start_time = ship_valid_times.min()
-                        ship_end_time = ship_valid_times.max()
-                        
-                        # 更新全局时间范围
-                        if global_start_time is None or ship_start_time < global_start_time:
-                            global_start_time = ship_start_time
-                        if global_end_time is None or ship_end_time > global_end_time:
-                            global_end_time = ship_end_time
-                else:
-                    ship_data_sorted = ship_data
-                    if 'postime' in ship_data.columns:
-                        app.logger.info(f"船只 {mmsi_id} 存在时间字段但非datetime类型，未排序")
+        with dataset.lock, stage('build_response'):
+            if filters:
+                # 由读取时建立的行号集合得到筛选结果，开销与结果大小成正比
+                filtered = dataset.filter_rows(filters, match)
+                ship_frames = dataset.ship_frames(filtered)
+                df = filtered[OUTPUT_COLUMNS]
+            else:
+                ship_frames = dataset.ships
+                df = dataset.frame[OUTPUT_COLUMNS]
                 
-                ship_data_limit = ship_data_sorted.head(max_rows)
-                ship_groups[str(mmsi_id)] = {
+                if len(df) == 0:
+                    return jsonify({'error': '没有有效的经纬度数据'}), 400
+            
+            # 5. 按MMSI分组，各船只轨迹在存储中已按postime排序
+            ship_groups = {}
+            max_rows = 200000  # 提高单个船只轨迹点数限制到20万
+            is_sorted_by_time = dataset.time_is_datetime
+            
+            for mmsi_id in sorted(ship_frames):
+                ship_data = ship_frames[mmsi_id]
+                ship_data_limit = ship_data.head(max_rows)
+                ship_groups[mmsi_id] = {
                     'point_count': len(ship_data),
                     'returned_points': len(ship_data_limit),
-                    'data': ship_data_limit.to_dict('records'),
-                    'bounds': {
-                        'min_lon': ship_data['lon'].min(),
-                        'max_lon': ship_data['lon'].max(),
-                        'min_lat': ship_data['lat'].min(),
-                        'max_lat': ship_data['lat'].max()
-                    },
-                    'has_dest': 'dest' in ship_data.columns,
-                    'has_vessel_type': 'vessel_type' in ship_data.columns,
-                    'has_flag_ctry': 'flag_ctry' in ship_data.columns,
-                    'has_timestamp': 'postime' in ship_data.columns,
-                    'is_sorted_by_time': 'postime' in ship_data.columns and pd.api.types.is_datetime64_any_dtype(ship_data['postime'])
+                    'data': point_records(ship_data_limit),
+                    'bounds': frame_bounds(ship_data) if filters else dataset.ship_bounds(mmsi_id),
+                    # 整条轨迹的距离、航次数和航速，每个点另带 segment_km/sog/cog/voyage
+                    'kinematics': dataset.ship_kinematics(mmsi_id),
+                    'has_dest': True,
+                    'has_vessel_type': True,
+                    'has_flag_ctry': True,
+                    'has_timestamp': True,
+                    'is_sorted_by_time': is_sorted_by_time,
+                    # 超出限制的轨迹点可通过分页接口继续获取（分页接口不支持筛选）
+                    'next_cursor': (dataset.point_cursor(ship_data, max_rows - 1)
+                                    if len(ship_data) > max_rows and not filters else None)
                 }
-        
-        # 计算全局时间范围
-        global_time_range = None
-        if global_start_time is not None and global_end_time is not None:
-            global_time_range = {
-                'start_time': global_start_time.isoformat() if pd.notna(global_start_time) else None,
-                'end_time': global_end_time.isoformat() if pd.notna(global_end_time) else None
-            }
-        
-        # 6. 限制返回数据量，防止内存溢出和RangeError
-        # 如果有postime字段且是datetime类型，按时间排序后再限制数据量
-        if 'postime' in df.columns and pd.api.types.is_datetime64_any_dtype(df['postime']):
-            data = df.sort_values('postime').head(5000).to_dict('records')
-        else:
-            data = df.head(5000).to_dict('records')  # 提高总体数据限制到5000行
+            
+            # 计算全局时间范围
+            global_time_range = None
+            if dataset.time_start is not None and dataset.time_end is not None:
+                global_time_range = {
+                    'start_time': dataset.time_start.isoformat(),
+                    'end_time': dataset.time_end.isoformat()
+                }
+            
+            # 6. 限制返回数据量，防止内存溢出和RangeError
+            # 如果有postime字段且是datetime类型，按时间排序后再限制数据量
+            if is_sorted_by_time:
+                data = df.sort_values('postime', kind='mergesort').head(5000).to_dict('records')
+            else:
+                data = df.head(5000).to_dict('records')  # 提高总体数据限制到5000行
+            
+            # 客户端保存游标后可通过增量接口只获取之后新增的数据
+            version = dataset.version
+            cursor = dataset.cursor
+            removed_rows = dataset.removed_rows()
         
         # 返回数据统计信息
         stats = {
@@ -422,177 +499,776 @@ def get_csv_data(filename):
             'coordinate_columns': {'lon': 'lon', 'lat': 'lat'},
             'ship_id_column': 'mmsi' if 'mmsi' in df.columns else None,
             'timestamp_column': 'postime' if 'postime' in df.columns else None,
-            'total_ships': len(ship_groups) if 'mmsi' in df.columns else 0
+            'total_ships': len(ship_groups) if 'mmsi' in df.columns else 0,
+            'removed_rows': removed_rows
         }
         
-        return jsonify({
-            'filename': filename,
-            'data': data,
-            'stats': stats,
-            'ship_groups': ship_groups if 'mmsi' in df.columns else {},
-            'global_time_range': global_time_range,
-            'message': '数据读取成功',
-            'has_multiple_ships': len(ship_groups) > 1 if 'mmsi' in df.columns else False
-        })
+        with stage('serialize'):
+            return jsonify({
+                'filename': filename,
+                'data': data,
+                'stats': stats,
+                'ship_groups': ship_groups if 'mmsi' in df.columns else {},
+                'global_time_range': global_time_range,
+                'message': '数据读取成功',
+                'has_multiple_ships': len(ship_groups) > 1 if 'mmsi' in df.columns else False,
+                'filters': {'fields': filters, 'match': match} if filters else None,
+                'version': version,
+                'cursor': cursor
+            })
         
     except Exception as e:
-            app.logger.error(f"读取CSV错误: {str(e)}")
+            app.logger.error("读取CSV错误: %s", e)
             app.logger.debug(traceback.format_exc())
             # 不向用户暴露详细错误信息
             return jsonify({'error': '读取CSV文件失败'}), 500
 
 
 
-@app.route('/api/data/<filename>/ship/<ship_id>', methods=['GET'])
-def get_ship_data(filename, ship_id):
-    """获取指定文件中特定船只的数据"""
+def _parse_list_arg(name):
+    """解析可重复或用逗号分隔多个取值的参数，去掉空值和重复值并保持顺序"""
+    values = []
+    for raw in request.args.getlist(name):
+        values.extend(value.strip() for value in raw.split(',') if value.strip())
+    return list(dict.fromkeys(values))
+
+
+def _parse_filters():
+    """
+    解析筛选参数 mmsi, vessel_type, flag_ctry, dest，参数可重复或用逗号分隔多个取值；
+    match=all 时各字段同时满足，match=any 时满足任意一个
+    返回 ({字段: [取值, ...]}, match)
+    """
+    filters = {}
+    for field in FILTER_FIELDS:
+        values = _parse_list_arg(field)
+        if values:
+            filters[field] = values
+    match = request.args.get('match', 'all')
+    if match not in FILTER_MATCH_MODES:
+        raise DatasetError('不支持的筛选组合方式', match=match, supported=FILTER_MATCH_MODES)
+    return filters, match
+
+
+def _parse_limit(default, maximum, name='limit'):
+    """解析分页参数limit（或name指定的其他上限参数），非法时返回None"""
+    try:
+        limit = int(request.args.get(name, default))
+    except ValueError:
+        return None
+    if limit <= 0:
+        return None
+    return min(limit, maximum)
+
+
+@app.route('/api/data/<filename>/delta', methods=['GET'])
+def get_data_delta(filename):
+    """获取游标之后新增的数据，可按船只过滤，结构与ship_groups一致"""
     try:
         # 安全检查，防止路径遍历攻击
         if '..' in filename or '/' in filename or '\\' in filename:
             return jsonify({'error': '文件名不合法'}), 400
-            
+        
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        cursor = request.args.get('cursor', '')
+        ship_id = request.args.get('ship_id') or None
+        limit = _parse_limit(5000, 50000)
+        if limit is None:
+            return jsonify({'error': '参数limit必须是正整数'}), 400
+        
+        try:
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock:
+                start_row, reset = dataset.parse_cursor(cursor)
+                rows, next_row, has_more = dataset.rows_since(start_row, ship_id=ship_id, limit=limit)
+                ship_groups = dataset.group_by_ship(rows)
+                version = dataset.version
+                next_cursor = f"{dataset.generation}.{next_row}"
+                total_rows = len(dataset.frame)
+                total_ships = len(dataset.ships)
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        return jsonify({
+            'filename': filename,
+            'version': version,
+            'cursor': next_cursor,
+            'reset': reset,
+            'has_more': has_more,
+            'new_points': len(rows),
+            'ship_groups': ship_groups,
+            'total_rows': total_rows,
+            'total_ships': total_ships,
+            'message': '增量数据获取成功'
+        })
+        
+    except Exception as e:
+        app.logger.error("获取增量数据错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '获取增量数据失败'}), 500
+
+
+@app.route('/api/data/<filename>/summary', methods=['GET'])
+def get_data_summary(filename):
+    """获取数据集摘要：各船只的点数、范围和时间范围以及全局统计，不含轨迹点"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
+        
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        try:
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock:
+                summary = dataset.summary()
+                version = dataset.version
+                cursor = dataset.cursor
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        if summary['total_ships'] == 0:
+            return jsonify({'error': '没有有效的经纬度数据'}), 400
+        
+        result = {
+            'filename': filename,
+            'version': version,
+            'cursor': cursor,
+            'has_multiple_ships': summary['total_ships'] > 1,
+            'message': '数据摘要获取成功'
+        }
+        result.update(summary)
+        return jsonify(result)
+        
+    except Exception as e:
+        app.logger.error("获取数据摘要错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '获取数据摘要失败'}), 500
+
+
+@app.route('/api/data/<filename>/viewport', methods=['GET'])
+def get_viewport_data(filename):
+    """按经纬度范围获取轨迹点，结构与ship_groups一致"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
         
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
         if not os.path.exists(filepath):
             return jsonify({'error': '文件不存在'}), 404
         
-        # 读取CSV文件
         try:
-            df = pd.read_csv(filepath, encoding='utf-8')
-        except UnicodeDecodeError:
+            min_lon = float(request.args.get('min_lon', -180))
+            max_lon = float(request.args.get('max_lon', 180))
+            min_lat = float(request.args.get('min_lat', -90))
+            max_lat = float(request.args.get('max_lat', 90))
+        except ValueError:
+            return jsonify({'error': '经纬度范围参数必须是数字'}), 400
+        if min_lon > max_lon or min_lat > max_lat:
+            return jsonify({'error': '经纬度范围参数不合法'}), 400
+        
+        limit = _parse_limit(50000, 200000)
+        if limit is None:
+            return jsonify({'error': '参数limit必须是正整数'}), 400
+        
+        try:
+            filters, match = _parse_filters()
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock:
+                rows, truncated = dataset.viewport_points(min_lon, max_lon, min_lat, max_lat, limit=limit,
+                                                          filters=filters, match=match)
+                ship_groups = dataset.group_by_ship(rows, cumulative=not filters)
+                version = dataset.version
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        return jsonify({
+            'filename': filename,
+            'viewport': {
+                'min_lon': min_lon,
+                'max_lon': max_lon,
+                'min_lat': min_lat,
+                'max_lat': max_lat
+            },
+            'returned_points': len(rows),
+            'truncated': truncated,
+            'filters': {'fields': filters, 'match': match} if filters else None,
+            'ship_groups': ship_groups,
+            'version': version,
+            'message': '范围数据获取成功'
+        })
+        
+    except Exception as e:
+        app.logger.error("获取范围数据错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '获取范围数据失败'}), 500
+
+
+@app.route('/api/data/<filename>/heatmap', methods=['GET'])
+def get_heatmap_data(filename):
+    """按经纬度网格统计点密度，可按时间桶和船舶类型等字段细分，只返回非空网格"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
+        
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        try:
+            resolution = float(request.args.get('resolution', 1.0))
+        except ValueError:
+            return jsonify({'error': '参数resolution必须是数字'}), 400
+        if not HEATMAP_MIN_RESOLUTION <= resolution <= 180:
+            return jsonify({'error': f'参数resolution必须在{HEATMAP_MIN_RESOLUTION}到180之间'}), 400
+        
+        bbox = None
+        bbox_params = ('min_lon', 'max_lon', 'min_lat', 'max_lat')
+        if any(name in request.args for name in bbox_params):
             try:
-                df = pd.read_csv(filepath, encoding='gbk')
-            except Exception:
-                return jsonify({'error': '文件编码错误，无法解析'}), 400
-        
-        # 数据预处理，只获取指定的字段：mmsi, lon, lat, dest, vessel_type
-        df.columns = df.columns.str.lower()
-        
-        # 识别并标准化字段（与get_csv_data相同的逻辑）
-        mmsi_columns = ['mmsi', 'mmsi_number', 'ship_mmsi']
-        mmsi_column = None
-        for col in mmsi_columns:
-            if col in df.columns:
-                mmsi_column = col
-                break
-        
-        if not mmsi_column:
-            return jsonify({'error': '文件中没有找到MMSI字段'}), 404
-        
-        lon_columns = ['lon', 'longitude', 'long', 'lng']
-        lon_column = None
-        for col in lon_columns:
-            if col in df.columns:
-                lon_column = col
-                break
-        
-        lat_columns = ['lat', 'latitude', 'latitude_']
-        lat_column = None
-        for col in lat_columns:
-            if col in df.columns:
-                lat_column = col
-                break
-        
-        dest_columns = ['dest', 'destination', 'port', 'dest_port']
-        dest_column = None
-        for col in dest_columns:
-            if col in df.columns:
-                dest_column = col
-                break
-        
-        vessel_type_columns = ['vessel_type', 'vesseltype', 'vessel-type', 'type', 'ship_type']
-        vessel_type_column = None
-        for col in vessel_type_columns:
-            if col in df.columns:
-                vessel_type_column = col
-                break
-        
-        # 构建新的DataFrame，只包含需要的字段
-        new_df_data = {}
-        
-        if pd.api.types.is_numeric_dtype(df[mmsi_column]):
-            new_df_data['mmsi'] = df[mmsi_column].astype(str)
-        else:
-            new_df_data['mmsi'] = df[mmsi_column].astype(str)
+                min_lon = float(request.args.get('min_lon', -180))
+                max_lon = float(request.args.get('max_lon', 180))
+                min_lat = float(request.args.get('min_lat', -90))
+                max_lat = float(request.args.get('max_lat', 90))
+            except ValueError:
+                return jsonify({'error': '经纬度范围参数必须是数字'}), 400
+            if min_lon > max_lon or min_lat > max_lat:
+                return jsonify({'error': '经纬度范围参数不合法'}), 400
+            bbox = (min_lon, max_lon, min_lat, max_lat)
         
-        if lon_column:
-            new_df_data['lon'] = pd.to_numeric(df[lon_column], errors='coerce')
-        else:
-            return jsonify({'error': 'CSV文件中未找到经度字段(lon/longitude)'}), 400
+        time_bucket = request.args.get('time_bucket') or None
+        if time_bucket is not None and time_bucket not in HEATMAP_TIME_BUCKETS:
+            return jsonify({'error': '不支持的时间分桶', 'supported': list(HEATMAP_TIME_BUCKETS)}), 400
+        group_by = request.args.get('group_by') or None
+        if group_by is not None and group_by not in HEATMAP_GROUP_FIELDS:
+            return jsonify({'error': '不支持的分组字段', 'supported': HEATMAP_GROUP_FIELDS}), 400
         
-        if lat_column:
-            new_df_data['lat'] = pd.to_numeric(df[lat_column], errors='coerce')
-        else:
-            return jsonify({'error': 'CSV文件中未找到纬度字段(lat/latitude)'}), 400
+        # 网格过细时结果可能接近原始点数，要求缩小范围或降低分辨率
+        max_cells = _parse_limit(200000, 1000000, name='max_cells')
+        if max_cells is None:
+            return jsonify({'error': '参数max_cells必须是正整数'}), 400
         
-        if dest_column:
-            new_df_data['dest'] = df[dest_column].astype(str)
-            new_df_data['dest'] = new_df_data['dest'].replace(['nan', 'None', 'null', 'NaN', 'NAN'], '')
-            new_df_data['dest'] = new_df_data['dest'].fillna('')
-        else:
-            new_df_data['dest'] = ''
+        try:
+            filters, match = _parse_filters()
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock, stage('build_response'):
+                heatmap = dataset.heatmap(resolution, bbox=bbox, time_bucket=time_bucket, group_by=group_by,
+                                          filters=filters, match=match)
+                total_points = len(dataset.frame)
+                version = dataset.version
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
         
-        if vessel_type_column:
-            new_df_data['vessel_type'] = df[vessel_type_column].astype(str)
-            new_df_data['vessel_type'] = new_df_data['vessel_type'].replace(['nan', 'None', 'null', 'NaN', 'NAN'], '')
-            new_df_data['vessel_type'] = new_df_data['vessel_type'].fillna('')
-        else:
-            new_df_data['vessel_type'] = ''
+        cell_count = len(heatmap['cells']['count'])
+        if cell_count > max_cells:
+            return jsonify({
+                'error': '网格数量过多，请降低分辨率或缩小范围',
+                'cell_count': cell_count,
+                'max_cells': max_cells
+            }), 400
+        
+        return jsonify({
+            'filename': filename,
+            'resolution': resolution,
+            'bounds': {
+                'min_lon': bbox[0], 'max_lon': bbox[1], 'min_lat': bbox[2], 'max_lat': bbox[3]
+            } if bbox else None,
+            'time_bucket': time_bucket,
+            'group_by': group_by,
+            'source': heatmap['source'],
+            'cell_count': cell_count,
+            'total_points': total_points,
+            'cells': heatmap['cells'],
+            'filters': {'fields': filters, 'match': match} if filters else None,
+            'version': version,
+            'message': '热力图数据获取成功'
+        })
         
-        df = pd.DataFrame(new_df_data)
+    except Exception as e:
+        app.logger.error("获取热力图数据错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '获取热力图数据失败'}), 500
+
+
+# 事件检测参数：请求参数名 -> (检测参数名, 换算为检测参数单位的倍数)
+EVENT_PARAM_ARGS = {
+    'stop_speed': ('stop_speed', 1.0),
+    'stop_minutes': ('stop_seconds', 60.0),
+    'stop_radius_km': ('stop_radius_km', 1.0),
+    'jump_speed': ('jump_speed', 1.0),
+    'jump_min_km': ('jump_min_km', 1.0),
+    'gap_minutes': ('gap_seconds', 60.0),
+}
+
+
+@app.route('/api/data/<filename>/events', methods=['GET'])
+def get_events_data(filename):
+    """检测各船只的停泊/靠港、位置跳变和信号中断事件，按船只返回事件列表"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
         
-        # 筛选指定MMSI的数据
-        ship_data = df[df['mmsi'] == ship_id]
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
         
-        if len(ship_data) == 0:
-            return jsonify({'error': '未找到指定MMSI的船只数据'}), 404
+        types = [value.strip() for value in request.args.get('types', ','.join(EVENT_TYPES)).split(',') if value.strip()]
+        if not types or any(event_type not in EVENT_TYPES for event_type in types):
+            return jsonify({'error': '不支持的事件类型', 'supported': EVENT_TYPES}), 400
         
-        # 过滤无效的经纬度数据
-        ship_data = ship_data[(pd.notna(ship_data['lon'])) & (pd.notna(ship_data['lat']))]
-        ship_data = ship_data[(ship_data['lon'] >= -180) & (ship_data['lon'] <= 180)]
-        ship_data = ship_data[(ship_data['lat'] >= -90) & (ship_data['lat'] <= 90)]
+        params = {}
+        for name, (param, scale) in EVENT_PARAM_ARGS.items():
+            if name not in request.args:
+                continue
+            try:
+                value = float(request.args[name])
+            except ValueError:
+                return jsonify({'error': f'参数{name}必须是数字'}), 400
+            if not value > 0 or math.isinf(value):
+                return jsonify({'error': f'参数{name}必须是正数'}), 400
+            params[param] = value * scale
         
-        # 按时间排序
-        if 'postime' in ship_data.columns and pd.api.types.is_datetime64_any_dtype(ship_data['postime']):
-            ship_data_sorted = ship_data.sort_values('postime')
-            app.logger.info(f"船只 {ship_id} 已按时间排序")
-        else:
-            ship_data_sorted = ship_data
+        try:
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock, stage('build_response'):
+                ships = dataset.events(types=types, params=params)
+                total_ships = len(dataset.ships)
+                version = dataset.version
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        counts = {event_type: sum(len(events[f'{event_type}s']) for events in ships.values()) for event_type in types}
+        return jsonify({
+            'filename': filename,
+            'types': types,
+            'params': dict(DEFAULT_EVENT_PARAMS, **params),
+            'counts': counts,
+            'ship_count': len(ships),
+            'total_ships': total_ships,
+            'ships': ships,
+            'version': version,
+            'message': '事件检测完成'
+        })
         
-        # 限制返回数据量
-        max_rows = 50000  # 提高单船数据限制到5万轨迹点
-        ship_data_limit = ship_data_sorted.head(max_rows)
+    except Exception as e:
+        app.logger.error("事件检测错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '事件检测失败'}), 500
+
+
+@app.route('/api/data/<filename>/ships', methods=['GET'])
+def get_ships_page(filename):
+    """分页获取船只列表（只含元数据），可按MMSI或轨迹点数排序"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
+        
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        limit = _parse_limit(100, 1000)
+        if limit is None:
+            return jsonify({'error': '参数limit必须是正整数'}), 400
+        sort = request.args.get('sort', 'mmsi')
+        
+        try:
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock:
+                ships, next_cursor = dataset.ships_page(sort=sort, cursor=request.args.get('cursor'), limit=limit)
+                total_ships = len(dataset.ships)
+                version = dataset.version
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        return jsonify({
+            'filename': filename,
+            'sort': sort,
+            'ships': ships,
+            'returned_ships': len(ships),
+            'total_ships': total_ships,
+            'next_cursor': next_cursor,
+            'version': version,
+            'message': '船只列表获取成功'
+        })
+        
+    except Exception as e:
+        app.logger.error("获取船只列表错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '获取船只列表失败'}), 500
+
+
+@app.route('/api/data/<filename>/ship/<ship_id>/points', methods=['GET'])
+def get_ship_points_page(filename, ship_id):
+    """按时间顺序分页获取指定船只的轨迹点"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
+        
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        limit = _parse_limit(5000, 50000)
+        if limit is None:
+            return jsonify({'error': '参数limit必须是正整数'}), 400
+        
+        try:
+            dataset = dataset_store.get(filename, filepath)
+            with dataset.lock:
+                if ship_id not in dataset.ships:
+                    return jsonify({'error': '未找到指定MMSI的船只数据'}), 404
+                page, next_cursor = dataset.ship_points_page(ship_id, cursor=request.args.get('cursor'), limit=limit)
+                summary = dataset.ship_summary(ship_id)
+                is_sorted_by_time = dataset.time_is_datetime
+                data = point_records(page)
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
         
-        # 返回数据
         return jsonify({
             'filename': filename,
             'ship_id': ship_id,
             'mmsi': ship_id,
-            'point_count': len(ship_data),
-            'returned_points': len(ship_data_limit),
-            'data': ship_data_limit.to_dict('records'),
-            'bounds': {
-                'min_lon': ship_data['lon'].min(),
-                'max_lon': ship_data['lon'].max(),
-                'min_lat': ship_data['lat'].min(),
-                'max_lat': ship_data['lat'].max()
-            },
-            'has_timestamp': 'postime' in ship_data.columns,
-            'is_sorted_by_time': 'postime' in ship_data.columns and pd.api.types.is_datetime64_any_dtype(ship_data['postime']),
-            'message': '船只数据获取成功'
+            'point_count': summary['point_count'],
+            'returned_points': len(data),
+            'data': data,
+            'bounds': summary['bounds'],
+            'is_sorted_by_time': is_sorted_by_time,
+            'next_cursor': next_cursor,
+            'message': '船只轨迹点获取成功'
         })
         
     except Exception as e:
-        app.logger.error(f"获取船只数据错误: {str(e)}")
+        app.logger.error("获取船只轨迹点错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '获取船只轨迹点失败'}), 500
+
+
+@app.route('/api/data/<filename>/ship/<ship_id>', methods=['GET'])
+def get_ship_data(filename, ship_id):
+    """获取指定文件中特定船只的数据"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
+            
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        try:
+            dataset = dataset_store.get(filename, filepath)
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        with dataset.lock, stage('build_response'):
+            if not dataset.mapping.has('mmsi'):
+                return jsonify({'error': '文件中没有找到MMSI字段'}), 404
+            
+            # 船只轨迹在数据集中已按时间排序
+            ship_data = dataset.ships.get(ship_id)
+            if ship_data is None or len(ship_data) == 0:
+                return jsonify({'error': '未找到指定MMSI的船只数据'}), 404
+            
+            # 限制返回数据量
+            max_rows = 50000  # 提高单船数据限制到5万轨迹点
+            ship_data_limit = ship_data.head(max_rows)
+            has_timestamp = dataset.mapping.has('postime')
+            
+            # 返回数据
+            body = {
+                'filename': filename,
+                'ship_id': ship_id,
+                'mmsi': ship_id,
+                'point_count': len(ship_data),
+                'returned_points': len(ship_data_limit),
+                'data': point_records(ship_data_limit),
+                'bounds': dataset.ship_bounds(ship_id),
+                'kinematics': dataset.ship_kinematics(ship_id),
+                'has_timestamp': has_timestamp,
+                'is_sorted_by_time': has_timestamp and dataset.time_is_datetime,
+                'message': '船只数据获取成功'
+            }
+        
+        with stage('serialize'):
+            return jsonify(body)
+        
+    except Exception as e:
+        app.logger.error("获取船只数据错误: %s", e)
         app.logger.debug(traceback.format_exc())
         return jsonify({'error': '获取船只数据失败'}), 500
 
 
 
+# 跨文件查询最多同时查询的文件数
+MAX_QUERY_FILES = 50
+
+
+def _catalog_files():
+    """上传目录中的全部数据文件，按文件名排序（文件名以上传时间开头）"""
+    upload_folder = app.config['UPLOAD_FOLDER']
+    if not os.path.isdir(upload_folder):
+        return []
+    return sorted(name for name in os.listdir(upload_folder)
+                  if name.lower().endswith(DATA_FILE_EXTENSIONS) and os.path.isfile(os.path.join(upload_folder, name)))
+
+
+def _may_overlap(filename, filepath, start, end):
+    """文件上次读取时的时间范围与查询时间相交，或没有可用的记录时返回True"""
+    span = dataset_store.time_span(filename, filepath)
+    if span is None:
+        return True
+    time_start, time_end = span
+    if time_start is None or time_end is None:
+        return False
+    return not ((start is not None and time_end < start) or (end is not None and time_start > end))
+
+
+def _parse_time_arg(name):
+    """
+    解析时间参数，带时区时转换为UTC后去掉时区，与带时区数据集的比较统一按UTC进行；
+    未提供时返回None，格式错误时抛出ValueError
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    timestamp = pd.Timestamp(value)
+    if timestamp is pd.NaT:
+        raise ValueError(value)
+    return naive_utc(timestamp)
+
+
+@app.route('/api/query/tracks', methods=['GET'])
+def query_tracks():
+    """
+    跨多个数据文件查询船只轨迹：按MMSI把各文件中按时间排序的轨迹合并为一条，
+    船只按MMSI分页，单船轨迹点过多时均匀抽样
+    """
+    try:
+        upload_folder = app.config['UPLOAD_FOLDER']
+        filenames = _parse_list_arg('files')
+        for filename in filenames:
+            # 安全检查，防止路径遍历攻击
+            if '..' in filename or '/' in filename or '\\' in filename:
+                return jsonify({'error': '文件名不合法', 'filename': filename}), 400
+            if not os.path.exists(os.path.join(upload_folder, filename)):
+                return jsonify({'error': '文件不存在', 'filename': filename}), 404
+        
+        try:
+            start = _parse_time_arg('start_time')
+            end = _parse_time_arg('end_time')
+        except ValueError:
+            return jsonify({'error': '时间参数格式不正确'}), 400
+        if start is not None and end is not None and start > end:
+            return jsonify({'error': '时间范围不合法'}), 400
+        has_time_range = start is not None or end is not None
+        
+        if not filenames:
+            # 未指定文件时查询上传目录中的全部数据文件，先按记录的时间范围排除不相交的文件，不必逐个读取
+            filenames = _catalog_files()
+            if has_time_range:
+                filenames = [filename for filename in filenames
+                             if _may_overlap(filename, os.path.join(upload_folder, filename), start, end)]
+        if len(filenames) > MAX_QUERY_FILES:
+            return jsonify({'error': f'一次最多查询{MAX_QUERY_FILES}个文件'}), 400
+        
+        limit = _parse_limit(100, 1000)
+        if limit is None:
+            return jsonify({'error': '参数limit必须是正整数'}), 400
+        max_points = _parse_limit(50000, 200000, name='max_points')
+        if max_points is None:
+            return jsonify({'error': '参数max_points必须是正整数'}), 400
+        mmsi_filter = set(_parse_list_arg('mmsi'))
+        cursor = request.args.get('cursor')
+        
+        # 选出与时间范围相交的数据集
+        datasets = []
+        versions = {}
+        for filename in filenames:
+            try:
+                dataset = dataset_store.get(filename, os.path.join(upload_folder, filename))
+            except DatasetError as e:
+                result = e.to_dict()
+                result['filename'] = filename
+                return jsonify(result), e.status
+            with dataset.lock:
+                if has_time_range:
+                    if dataset.time_start is None or dataset.time_end is None:
+                        continue
+                    time_start, time_end = naive_utc(dataset.time_start), naive_utc(dataset.time_end)
+                    if (start is not None and time_end < start) or (end is not None and time_start > end):
+                        continue
+                ship_ids = list(dataset.ships)
+                versions[filename] = dataset.version
+            datasets.append((filename, dataset, ship_ids))
+        
+        # 所有数据集中船只的并集，按MMSI分页
+        all_ships = set()
+        for _, _, ship_ids in datasets:
+            all_ships.update(ship_ids)
+        if mmsi_filter:
+            all_ships &= mmsi_filter
+        all_ships = sorted(all_ships)
+        try:
+            position = bisect.bisect_right(all_ships, str(decode_page_cursor(cursor))) if cursor else 0
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        page = all_ships[position:position + limit]
+        next_cursor = encode_page_cursor(page[-1]) if position + limit < len(all_ships) else None
+        
+        with stage('build_response'):
+            # 每个数据集只加一次锁，取出本页各船只在时间范围内的轨迹切片
+            slices = {mmsi_id: [] for mmsi_id in page}
+            for filename, dataset, _ in datasets:
+                with dataset.lock:
+                    for mmsi_id in page:
+                        slices[mmsi_id].append((filename, dataset.track_slice(mmsi_id, start, end)))
+            
+            ship_groups = {}
+            for mmsi_id in page:
+                merged, sources, totals = merge_tracks(slices[mmsi_id])
+                if merged is None:
+                    continue
+                track = merged.iloc[downsample_positions(len(merged), max_points)]
+                ship_groups[mmsi_id] = {
+                    'point_count': len(merged),
+                    'returned_points': len(track),
+                    'downsampled': len(track) < len(merged),
+                    'sources': sources,
+                    'data': point_records(track),
+                    'bounds': frame_bounds(merged),
+                    'kinematics': kinematics_summary(totals)
+                }
+        
+        with stage('serialize'):
+            return jsonify({
+                'files': [filename for filename, _, _ in datasets],
+                'time_range': {
+                    'start_time': start.isoformat() if start is not None else None,
+                    'end_time': end.isoformat() if end is not None else None
+                } if has_time_range else None,
+                'ship_groups': ship_groups,
+                'returned_ships': len(ship_groups),
+                'total_ships': len(all_ships),
+                'next_cursor': next_cursor,
+                'versions': versions,
+                'message': '跨文件轨迹查询成功'
+            })
+        
+    except Exception as e:
+        app.logger.error("跨文件查询错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '跨文件查询失败'}), 500
+
+
+@app.route('/api/stream', methods=['GET'])
+def stream_uploads():
+    """订阅新文件上传事件（Server-Sent Events）"""
+    subscription = live_broker.subscribe(GLOBAL_CHANNEL)
+    initial = format_event('subscribed', {'channel': 'uploads'}, dumps=app.json.dumps)
+    return _event_stream_response(subscription, initial)
+
+
+@app.route('/api/stream/<filename>', methods=['GET'])
+def stream_file_updates(filename):
+    """订阅指定文件的增量船位推送（Server-Sent Events）"""
+    try:
+        # 安全检查，防止路径遍历攻击
+        if '..' in filename or '/' in filename or '\\' in filename:
+            return jsonify({'error': '文件名不合法'}), 400
+        
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not os.path.exists(filepath):
+            return jsonify({'error': '文件不存在'}), 404
+        
+        try:
+            dataset = dataset_store.get(filename, filepath)
+        except DatasetError as e:
+            return jsonify(e.to_dict()), e.status
+        
+        # 先订阅再读取版本号，避免订阅前后的增量丢失
+        subscription = live_broker.subscribe(filename)
+        with dataset.lock:
+            initial = format_event('subscribed', {
+                'filename': filename,
+                'version': dataset.version,
+                'cursor': dataset.cursor,
+                'total_rows': len(dataset.frame),
+                'total_ships': len(dataset.ships)
+            }, event_id=dataset.version, dumps=app.json.dumps)
+        return _event_stream_response(subscription, initial)
+        
+    except Exception as e:
+        app.logger.error("订阅文件更新错误: %s", e)
+        app.logger.debug(traceback.format_exc())
+        return jsonify({'error': '订阅文件更新失败'}), 500
+
+
+def _event_stream_response(subscription, initial):
+    return Response(
+        live_broker.stream(subscription, initial),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """列出已保存的请求分析结果"""
+    if not request_profiler.authorized(request.args, request.headers):
+        return jsonify({'error': '未开启请求分析或令牌不正确'}), 403
+    profiles = request_profiler.list_profiles()
+    return jsonify({
+        'profiles': profiles,
+        'count': len(profiles),
+        'max_profiles': request_profiler.max_profiles
+    })
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """获取请求分析报告，format=prof 时下载cProfile原始数据"""
+    if not request_profiler.authorized(request.args, request.headers):
+        return jsonify({'error': '未开启请求分析或令牌不正确'}), 403
+    if request.args.get('format') == 'prof':
+        path = request_profiler.profile_path(profile_id, '.prof')
+        if path is None:
+            return jsonify({'error': '分析结果不存在'}), 404
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f"{profile_id}.prof")
+    path = request_profiler.profile_path(profile_id, '.txt')
+    if path is None:
+        return jsonify({'error': '分析结果不存在'}), 404
+    with open(path, encoding='utf-8') as f:
+        return Response(f.read(), mimetype='text/plain; charset=utf-8')
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus格式的运行指标"""
+    return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    logging.info("接收到健康检查请求")
+    app.logger.debug("接收到健康检查请求")
+    memory_rss, _ = metrics.memory_usage()
+    store_stats = dataset_store.stats()
     return jsonify({
         "status": "healthy",
         "message": "船舶可视化后端服务运行正常",
@@ -604,7 +1280,17 @@ def health_check():
             "直接文件读取功能已启用"
         ],
         "debug_mode": True,
-        "timestamp": pd.Timestamp.now().isoformat()
+        "load": {
+            "uptime_seconds": round(datetime.now().timestamp() - registry.started_at, 1),
+            "requests_in_flight": registry.get_gauge('ship_http_requests_in_flight'),
+            "datasets_loaded": store_stats['datasets'],
+            "dataset_rows": store_stats['rows'],
+            "live_subscribers": live_broker.subscriber_count(),
+            "memory_rss_mb": round(memory_rss / 1024 / 1024, 1) if memory_rss is not None else None
+        },
+        "warmup": dict(warmup_state, ready=warmup_state['status'] not in ('starting', 'warming'),
+                       datasets_loading=store_stats['loading']),
+        "timestamp": datetime.now().isoformat()
     })
 
 @app.route('/api/health-check', methods=['GET'])
@@ -615,7 +1301,7 @@ def health_check_alias():
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
     """简单测试端点，用于验证服务是否正常响应"""
-    logging.info("接收到测试请求")
+    app.logger.debug("接收到测试请求")
     return jsonify({
         "status": "success",
         "message": "测试端点正常响应",
@@ -636,12 +1322,22 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/api/health",
+            "metrics": "/api/metrics",
             "upload": "/api/upload",
             "files": "/api/files",
-            "data": "/api/data/<filename>",
+            "data": "/api/data/<filename>?vessel_type=&flag_ctry=&dest=&mmsi=&match=all|any",
+            "summary": "/api/data/<filename>/summary",
+            "viewport": "/api/data/<filename>/viewport?min_lon=&max_lon=&min_lat=&max_lat=",
+            "heatmap": "/api/data/<filename>/heatmap?resolution=&time_bucket=hour|day&group_by=vessel_type|flag_ctry",
+            "events": "/api/data/<filename>/events?types=stop,jump,gap",
+            "delta": "/api/data/<filename>/delta?cursor=<cursor>",
+            "ships": "/api/data/<filename>/ships?sort=mmsi|point_count&cursor=<cursor>",
+            "ship_points": "/api/data/<filename>/ship/<ship_id>/points?cursor=<cursor>",
+            "query_tracks": "/api/query/tracks?files=&start_time=&end_time=&mmsi=&cursor=&max_points=",
+            "stream": "/api/stream/<filename>",
             "test": "/api/test"
         },
-        "timestamp": pd.Timestamp.now().isoformat()
+        "timestamp": datetime.now().isoformat()
     })
 
 if __name__ == '__main__':
@@ -659,5 +1355,7 @@ if __name__ == '__main__':
     print(f"调试模式: {DEBUG}")
     print("=== 后端服务已启动，正在监听请求 ===")
     
+    start_warmup()
+    
     # 生产环境不应该开启debug模式
     app.run(host=host, port=port, debug=DEBUG)
\ No newline at end of file
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+HTTP压力测试
+多线程并发驱动正在运行的后端服务，按权重混合上传、全量读取、单船读取和健康检查请求，
+统计各类请求的p50/p95/p99延迟、错误率和吞吐量，不依赖外部服务
+
+示例:
+    python benchmarks/load_test.py --start-server stable --concurrency 16 --duration 30
+    python benchmarks/load_test.py --host localhost --port 5000 --mix data=5,ship=3,summary=2,health=1,upload=1
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+import urllib.parse
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_ais import generate_ais_frame, write_dataset  # noqa: E402
+
+# 可启动的服务脚本
+SERVER_SCRIPTS = {
+    'start': 'start_server.py',
+    'stable': 'run_server_stable.py'
+}
+
+DEFAULT_MIX = 'data=4,ship=4,summary=2,health=2,upload=1'
+
+
+class LoadStats:
+    """线程安全地收集每类请求的延迟和状态"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+        self.errors = {}
+        self.stale = {}
+        self.bytes_received = 0
+
+    def record(self, op, latency, status, size, error=None, stale=False):
+        with self._lock:
+            self.latencies.setdefault(op, []).append(latency)
+            status_counts = self.statuses.setdefault(op, {})
+            status_counts[status] = status_counts.get(status, 0) + 1
+            if stale:
+                self.stale[op] = self.stale.get(op, 0) + 1
+            elif error:
+                self.errors.setdefault(op, []).append(error)
+            self.bytes_received += size
+
+
+class SharedState:
+    """当前可读取的文件名和船只列表，上传后更新；记录上传进度用于识别被替换的文件"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.filename = None
+        self.ship_ids = []
+        self.upload_generation = 0
+        self.uploads_in_flight = 0
+
+    def snapshot(self):
+        with self._lock:
+            return self.filename, self.ship_ids
+
+    def update(self, filename, ship_ids):
+        with self._lock:
+            self.filename = filename
+            self.ship_ids = ship_ids
+
+    def begin_upload(self):
+        with self._lock:
+            self.uploads_in_flight += 1
+            self.upload_generation += 1
+
+    def end_upload(self):
+        with self._lock:
+            self.uploads_in_flight -= 1
+            self.upload_generation += 1
+
+    def upload_marker(self):
+        with self._lock:
+            return self.upload_generation, self.uploads_in_flight
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class LoadClient:
+    """基于http.client的简单客户端，每个请求使用独立连接"""
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, headers=None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            conn.request(method, path, body, headers or {})
+            response = conn.getresponse()
+            data = response.read()
+            return response.status, data
+        finally:
+            conn.close()
+
+    def upload(self, file_name, content):
+        boundary = '----ShipLoadTestBoundary7MA4YWxkTrZu0gW'
+        body = (f'--{boundary}\r\n' +
+                f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n' +
+                'Content-Type: application/octet-stream\r\n\r\n').encode()
+        body += content + f'\r\n--{boundary}--\r\n'.encode()
+        headers = {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+        return self.request('POST', '/api/upload', body, headers)
+
+
+def refresh_state(client, state, upload_name, content):
+    """上传数据文件并读取船只列表，返回 (状态码, 响应字节数)"""
+    status, data = client.upload(upload_name, content)
+    if status != 200:
+        return status, len(data)
+    filename = json.loads(data)['filename']
+    quoted = urllib.parse.quote(filename)
+    summary_status, summary = client.request('GET', f'/api/data/{quoted}/summary')
+    ship_ids = list(json.loads(summary).get('ships', {}).keys()) if summary_status == 200 else []
+    state.update(filename, ship_ids)
+    return status, len(data)
+
+
+def run_operation(op, client, state, stats, upload_name, content):
+    filename, ship_ids = state.snapshot()
+    quoted = urllib.parse.quote(filename or '')
+    marker = state.upload_marker()
+    started = time.perf_counter()
+    status, size, error = None, 0, None
+    try:
+        if op == 'upload':
+            state.begin_upload()
+            try:
+                status, size = refresh_state(client, state, upload_name, content)
+            finally:
+                state.end_upload()
+        elif op == 'health':
+            status, data = client.request('GET', '/api/health')
+            size = len(data)
+        elif op == 'data':
+            status, data = client.request('GET', f'/api/data/{quoted}')
+            size = len(data)
+        elif op == 'summary':
+            status, data = client.request('GET', f'/api/data/{quoted}/summary')
+            size = len(data)
+        elif op == 'ship':
+            ship_id = urllib.parse.quote(random.choice(ship_ids)) if ship_ids else '0'
+            status, data = client.request('GET', f'/api/data/{quoted}/ship/{ship_id}')
+            size = len(data)
+        else:
+            raise ValueError(f"未知的请求类型: {op}")
+        if status >= 400:
+            error = f"HTTP {status}"
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)}"
+    latency = time.perf_counter() - started
+
+    # 上传会删除旧文件，与上传重叠的读取返回404时不计为错误，单独统计
+    overlapped = marker[1] > 0 or state.upload_marker()[0] != marker[0]
+    stale = status == 404 and op != 'upload' and overlapped
+    stats.record(op, latency, status, size, error=error, stale=stale)
+
+
+def worker(client, state, stats, ops, weights, deadline, remaining, upload_name, content):
+    while True:
+        if deadline is not None and time.perf_counter() >= deadline:
+            return
+        if remaining is not None:
+            with remaining['lock']:
+                if remaining['count'] <= 0:
+                    return
+                remaining['count'] -= 1
+        op = random.choices(ops, weights=weights)[0]
+        run_operation(op, client, state, stats, upload_name, content)
+
+
+def parse_mix(mix):
+    ops, weights = [], []
+    for item in mix.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        ops.append(name.strip())
+        weights.append(float(weight or 1))
+    return ops, weights
+
+
+def start_server(name, client, timeout=60):
+    """启动服务脚本并等待健康检查通过"""
+    script = os.path.join(ROOT_DIR, SERVER_SCRIPTS[name])
+    print(f"启动服务: {script}")
+    process = subprocess.Popen([sys.executable, script], cwd=ROOT_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程已退出，返回码 {process.returncode}")
+        try:
+            status, _ = client.request('GET', '/api/health')
+            if status == 200:
+                return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("等待服务启动超时")
+
+
+def build_report(stats, elapsed, args):
+    operations = {}
+    total_requests = 0
+    total_errors = 0
+    all_latencies = []
+    for op, latencies in sorted(stats.latencies.items()):
+        errors = len(stats.errors.get(op, []))
+        total_requests += len(latencies)
+        total_errors += errors
+        all_latencies.extend(latencies)
+        operations[op] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'stale': stats.stale.get(op, 0),
+            'error_rate': round(errors / len(latencies), 4),
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 2),
+            'max_ms': round(max(latencies) * 1000, 2),
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'statuses': {str(k): v for k, v in stats.statuses.get(op, {}).items()},
+            'sample_errors': stats.errors.get(op, [])[:5]
+        }
+    overall = {
+        'requests': total_requests,
+        'errors': total_errors,
+        'error_rate': round(total_errors / total_requests, 4) if total_requests else 0,
+        'throughput_rps': round(total_requests / elapsed, 2) if elapsed else 0,
+        'mb_per_s': round(stats.bytes_received / 1024 / 1024 / elapsed, 3) if elapsed else 0,
+        'elapsed_s': round(elapsed, 2)
+    }
+    if all_latencies:
+        overall.update({
+            'p50_ms': round(_percentile(all_latencies, 50) * 1000, 2),
+            'p95_ms': round(_percentile(all_latencies, 95) * 1000, 2),
+            'p99_ms': round(_percentile(all_latencies, 99) * 1000, 2)
+        })
+    return {
+        'meta': {'timestamp': datetime.now().isoformat(), 'args': vars(args)},
+        'overall': overall,
+        'operations': operations
+    }
+
+
+def print_report(report):
+    overall = report['overall']
+    print("\n===== 压力测试结果 =====")
+    print(f"总请求 {overall['requests']}，错误 {overall['errors']}（{overall['error_rate'] * 100:.2f}%），"
+          f"吞吐 {overall['throughput_rps']} 请求/秒，{overall['mb_per_s']} MB/秒，用时 {overall['elapsed_s']} 秒")
+    if 'p50_ms' in overall:
+        print(f"整体延迟 p50 {overall['p50_ms']} ms，p95 {overall['p95_ms']} ms，p99 {overall['p99_ms']} ms")
+    print(f"\n  {'请求类型':<10} {'次数':>8} {'错误率':>8} {'文件已替换':>6} {'p50 ms':>10} {'p95 ms':>10} "
+          f"{'p99 ms':>10} {'请求/秒':>10}")
+    for op, result in report['operations'].items():
+        print(f"  {op:<12} {result['requests']:>8} {result['error_rate'] * 100:>7.2f}% {result['stale']:>10} "
+              f"{result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+              f"{result['throughput_rps']:>10.2f}")
+        for error in result['sample_errors']:
+            print(f"      错误示例: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='船舶可视化后端HTTP压力测试')
+    parser.add_argument('--host', default='localhost', help='服务地址')
+    parser.add_argument('--port', type=int, default=5000, help='服务端口')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=30, help='持续时间(秒)，指定--requests时忽略')
+    parser.add_argument('--requests', type=int, default=0, help='总请求数')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='请求类型权重: data,ship,summary,health,upload')
+    parser.add_argument('--file', default='', help='上传的数据文件，默认生成合成数据')
+    parser.add_argument('--rows', type=int, default=20000, help='合成数据行数')
+    parser.add_argument('--ships', type=int, default=200, help='合成数据船只数')
+    parser.add_argument('--timeout', type=float, default=120, help='单个请求超时(秒)')
+    parser.add_argument('--start-server', choices=sorted(SERVER_SCRIPTS), default='',
+                        help='先启动指定的服务脚本再测试')
+    parser.add_argument('--output', default='', help='结果JSON保存路径')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    ops, weights = parse_mix(args.mix)
+    client = LoadClient(args.host, args.port, args.timeout)
+
+    if args.file:
+        upload_name = os.path.basename(args.file)
+        with open(args.file, 'rb') as f:
+            content = f.read()
+    else:
+        tmp_path = os.path.join(tempfile.mkdtemp(prefix='ship-load-'), f'synthetic_{args.rows}r.csv')
+        write_dataset(generate_ais_frame(args.rows, args.ships, seed=args.seed), tmp_path)
+        upload_name = os.path.basename(tmp_path)
+        with open(tmp_path, 'rb') as f:
+            content = f.read()
+
+    server = start_server(args.start_server, client) if args.start_server else None
+    try:
+        print("===== 船舶可视化后端HTTP压力测试 =====")
+        print(f"目标: http://{args.host}:{args.port}，并发 {args.concurrency}，请求组合 {args.mix}")
+
+        # 预热：上传数据文件并完成一次全量读取
+        state = SharedState()
+        status, _ = refresh_state(client, state, upload_name, content)
+        if status != 200:
+            print(f"预热上传失败，状态码 {status}")
+            sys.exit(1)
+        client.request('GET', f'/api/data/{urllib.parse.quote(state.filename)}')
+
+        stats = LoadStats()
+        remaining = {'count': args.requests, 'lock': threading.Lock()} if args.requests else None
+        started = time.perf_counter()
+        deadline = None if remaining else started + args.duration
+        threads = [
+            threading.Thread(target=worker, args=(client, state, stats, ops, weights, deadline, remaining,
+                                                  upload_name, content), daemon=True)
+            for _ in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        report = build_report(stats, elapsed, args)
+        print_report(report)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n结果已保存: {args.output}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    main()
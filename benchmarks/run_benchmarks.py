@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+后端性能基准测试
+用合成AIS数据通过Flask测试客户端测量上传、解析和查询接口的延迟、吞吐量和内存占用，
+结果保存为JSON，可与之前的结果对比发现性能回退
+
+示例:
+    python benchmarks/run_benchmarks.py --rows 100000 --ships 1000 --formats csv,xlsx --encodings utf-8,gbk
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/bench_20240101_120000.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_ais import generate_ais_frame, write_dataset, dataset_filename  # noqa: E402
+
+
+def _peak_rss_mb():
+    """进程峰值常驻内存(MB)，不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(percent / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def measure(request_fn, repeat, setup=None, rows=None, input_bytes=None):
+    """
+    重复执行请求并统计延迟，最后单独执行一次用tracemalloc测量分配峰值
+    request_fn 返回Flask测试响应
+    """
+    latencies = []
+    response_bytes = 0
+    status = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        response = request_fn()
+        latencies.append(time.perf_counter() - started)
+        status = response.status_code
+        response_bytes = len(response.get_data())
+        if status >= 400:
+            break
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    request_fn()
+    peak_alloc = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    median = _percentile(latencies, 50)
+    result = {
+        'status': status,
+        'repeat': len(latencies),
+        'min_ms': round(min(latencies) * 1000, 3),
+        'median_ms': round(median * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'response_bytes': response_bytes,
+        'peak_alloc_mb': round(peak_alloc / 1024 / 1024, 3)
+    }
+    if status < 400 and rows and median > 0:
+        result['rows_per_s'] = round(rows / median, 1)
+    if status < 400 and input_bytes and median > 0:
+        result['mb_per_s'] = round(input_bytes / 1024 / 1024 / median, 3)
+    return result
+
+
+class BenchContext:
+    """单个测试用例共享的状态：Flask客户端、上传后的文件名和采样的船只"""
+
+    def __init__(self, app_module, client, path, rows):
+        self.app_module = app_module
+        self.client = client
+        self.path = path
+        self.rows = rows
+        self.input_bytes = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            self.content = f.read()
+        self.filename = None
+        self.ship_id = None
+
+    def upload(self):
+        response = self.client.post(
+            '/api/upload',
+            data={'file': (io.BytesIO(self.content), os.path.basename(self.path))},
+            content_type='multipart/form-data'
+        )
+        if response.status_code == 200:
+            self.filename = response.get_json()['filename']
+        return response
+
+    def clear_cache(self):
+        self.app_module.dataset_store.clear()
+
+
+def _bench_upload(ctx, repeat):
+    return measure(ctx.upload, repeat, input_bytes=ctx.input_bytes)
+
+
+def _bench_data_cold(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}'), repeat,
+                   setup=ctx.clear_cache, rows=ctx.rows, input_bytes=ctx.input_bytes)
+
+
+def _bench_data_warm(ctx, repeat):
+    ctx.client.get(f'/api/data/{ctx.filename}')
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}'), repeat, rows=ctx.rows)
+
+
+def _bench_ship_legacy(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}/ship/{ctx.ship_id}'), repeat,
+                   rows=ctx.rows, input_bytes=ctx.input_bytes)
+
+
+def _bench_summary(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}/summary'), repeat)
+
+
+def _bench_ships_page(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}/ships?sort=point_count&limit=100'), repeat)
+
+
+def _bench_ship_points(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}/ship/{ctx.ship_id}/points?limit=5000'), repeat)
+
+
+def _bench_delta(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}/delta?limit=5000'), repeat)
+
+
+def _bench_viewport(ctx, repeat):
+    return measure(lambda: ctx.client.get(
+        f'/api/data/{ctx.filename}/viewport?min_lon=115&max_lon=125&min_lat=15&max_lat=25&limit=50000'), repeat)
+
+
+def _bench_filtered_data(ctx, repeat):
+    return measure(lambda: ctx.client.get(
+        f'/api/data/{ctx.filename}?vessel_type=Tanker&flag_ctry=PA'), repeat)
+
+
+def _bench_heatmap(ctx, repeat):
+    return measure(lambda: ctx.client.get(
+        f'/api/data/{ctx.filename}/heatmap?resolution=0.1&group_by=vessel_type'), repeat)
+
+
+def _bench_events(ctx, repeat):
+    return measure(lambda: ctx.client.get(f'/api/data/{ctx.filename}/events'), repeat)
+
+
+def _bench_query_tracks(ctx, repeat):
+    return measure(lambda: ctx.client.get(
+        f'/api/query/tracks?files={ctx.filename}&limit=100&max_points=5000'), repeat)
+
+
+# 基准场景，按顺序执行；新增查询接口时在此登记
+SCENARIOS = [
+    ('upload_file', _bench_upload),
+    ('get_csv_data_cold', _bench_data_cold),
+    ('get_csv_data_warm', _bench_data_warm),
+    ('get_ship_data', _bench_ship_legacy),
+    ('summary', _bench_summary),
+    ('ships_page', _bench_ships_page),
+    ('ship_points_page', _bench_ship_points),
+    ('delta', _bench_delta),
+    ('viewport', _bench_viewport),
+    ('filtered_data', _bench_filtered_data),
+    ('heatmap', _bench_heatmap),
+    ('events', _bench_events),
+    ('query_tracks', _bench_query_tracks),
+]
+
+
+def run_case(case):
+    """在当前进程执行一个测试用例（文件格式 x 编码），返回各场景结果"""
+    streams = sys.stdout, sys.stderr
+    if not case.get('show_logs'):
+        # 在导入app之前重定向输出，避免日志刷屏影响计时；
+        # 日志处理器可能已绑定该文件，用完不关闭，只恢复原来的输出
+        devnull = open(os.devnull, 'w')
+        sys.stdout = devnull
+        sys.stderr = devnull
+    try:
+        return _run_case(case)
+    finally:
+        sys.stdout, sys.stderr = streams
+
+
+def _run_case(case):
+    import app as app_module
+    from data_store import DatasetStore
+
+    work_dir = tempfile.mkdtemp(prefix='ship-bench-')
+    original_store = app_module.dataset_store
+    try:
+        upload_dir = os.path.join(work_dir, 'uploads')
+        os.makedirs(upload_dir)
+        app_module.app.config['UPLOAD_FOLDER'] = upload_dir
+        # 使用临时目录作为转换缓存，上传时清理缓存不会删除仓库 data/processed 中的文件
+        store = DatasetStore(cache_dir=os.path.join(work_dir, 'processed'),
+                             thin_seconds=original_store.thin_seconds, thin_meters=original_store.thin_meters,
+                             max_datasets=original_store.max_datasets, max_bytes=original_store.max_bytes)
+        store.add_listener(app_module._publish_dataset_changes)
+        app_module.dataset_store = store
+        # 基准数据可能超过上传大小限制
+        app_module.app.config['MAX_CONTENT_LENGTH'] = None
+
+        df = generate_ais_frame(case['rows'], case['ships'], seed=case['seed'])
+        path = os.path.join(work_dir, dataset_filename(case['rows'], case['ships'], case['format'], case['encoding']))
+        write_dataset(df, path, case['format'], case['encoding'])
+        ship_id = str(df['mmsi'].value_counts().idxmax())
+        del df
+
+        ctx = BenchContext(app_module, app_module.app.test_client(), path, case['rows'])
+        ctx.ship_id = ship_id
+        results = {}
+        selected = case.get('scenarios')
+        for name, bench in SCENARIOS:
+            if selected and name not in selected and name != 'upload_file':
+                continue
+            if name != 'upload_file' and ctx.filename is None:
+                results[name] = {'status': None, 'skipped': '上传失败'}
+                continue
+            results[name] = bench(ctx, case['repeat'])
+
+        return {
+            'case': case,
+            'file_bytes': ctx.input_bytes,
+            'results': results,
+            'peak_rss_mb': _peak_rss_mb()
+        }
+    finally:
+        app_module.dataset_store = original_store
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _run_isolated(case):
+    """每个用例在独立的子进程中执行，峰值内存互不影响"""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_case, case).result()
+
+
+def compare_results(current, baseline, threshold):
+    """对比两次结果的中位延迟，返回回退项列表"""
+    def key(entry):
+        case = entry['case']
+        return (case['rows'], case['ships'], case['format'], case['encoding'])
+
+    baseline_cases = {key(entry): entry for entry in baseline.get('cases', [])}
+    regressions = []
+    print("\n===== 与基线对比（中位延迟） =====")
+    for entry in current['cases']:
+        old = baseline_cases.get(key(entry))
+        if old is None:
+            continue
+        print(f"\n用例 {key(entry)}")
+        for name, result in entry['results'].items():
+            old_result = old['results'].get(name)
+            if not old_result or 'median_ms' not in result or 'median_ms' not in old_result:
+                continue
+            before, after = old_result['median_ms'], result['median_ms']
+            change = (after - before) / before * 100 if before else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  <-- 回退'
+                regressions.append((key(entry), name, before, after, change))
+            print(f"  {name:<22} {before:>10.2f} ms -> {after:>10.2f} ms  ({change:+.1f}%){flag}")
+    return regressions
+
+
+def print_report(entry):
+    case = entry['case']
+    print(f"\n用例: {case['format']} / {case['encoding']}，{case['rows']} 行，{case['ships']} 条船，"
+          f"文件 {entry['file_bytes'] / 1024 / 1024:.2f} MB，峰值RSS {entry['peak_rss_mb'] or 0:.1f} MB")
+    print(f"  {'场景':<20} {'状态':>4} {'中位ms':>10} {'p95 ms':>10} {'行/秒':>12} {'响应KB':>10} {'分配MB':>8}")
+    for name, result in entry['results'].items():
+        if 'median_ms' not in result:
+            print(f"  {name:<22} 跳过: {result.get('skipped')}")
+            continue
+        print(f"  {name:<22} {result['status']:>4} {result['median_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+              f"{result.get('rows_per_s', 0):>12.0f} {result['response_bytes'] / 1024:>10.1f} "
+              f"{result['peak_alloc_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='船舶可视化后端性能基准测试')
+    parser.add_argument('--rows', type=int, default=50000, help='每个数据集的行数')
+    parser.add_argument('--ships', type=int, default=500, help='船只数量')
+    parser.add_argument('--formats', default='csv', help='文件格式，逗号分隔: csv,txt,xlsx')
+    parser.add_argument('--encodings', default='utf-8', help='CSV/TXT编码，逗号分隔: utf-8,utf-8-sig,gbk,utf-16')
+    parser.add_argument('--repeat', type=int, default=5, help='每个场景的重复次数')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--scenarios', default='', help='只运行指定场景，逗号分隔（上传总会执行）')
+    parser.add_argument('--output', default='', help='结果文件路径，默认写入 benchmarks/results/')
+    parser.add_argument('--compare', default='', help='对比的基线结果文件')
+    parser.add_argument('--threshold', type=float, default=10.0, help='判定回退的中位延迟增幅(%%)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='存在回退时以非零状态退出')
+    parser.add_argument('--no-isolate', action='store_true', help='在当前进程中运行所有用例')
+    parser.add_argument('--show-logs', action='store_true', help='显示服务端日志输出')
+    args = parser.parse_args()
+
+    cases = []
+    for file_format in [f.strip() for f in args.formats.split(',') if f.strip()]:
+        # Excel不区分编码
+        encodings = ['utf-8'] if file_format == 'xlsx' else [e.strip() for e in args.encodings.split(',') if e.strip()]
+        for encoding in encodings:
+            cases.append({
+                'rows': args.rows,
+                'ships': args.ships,
+                'format': file_format,
+                'encoding': encoding,
+                'repeat': args.repeat,
+                'seed': args.seed,
+                'scenarios': [s.strip() for s in args.scenarios.split(',') if s.strip()],
+                'show_logs': args.show_logs
+            })
+
+    print("===== 船舶可视化后端性能基准测试 =====")
+    entries = []
+    for case in cases:
+        entry = run_case(case) if args.no_isolate else _run_isolated(case)
+        print_report(entry)
+        entries.append(entry)
+
+    import pandas
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'pandas': pandas.__version__,
+            'platform': platform.platform(),
+            'args': vars(args)
+        },
+        'cases': entries
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n发现 {len(regressions)} 项性能回退（阈值 {args.threshold}%）")
+            if args.fail_on_regression:
+                sys.exit(1)
+        else:
+            print("\n未发现性能回退")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+合成AIS数据生成器
+按给定行数和船只数量生成可复现的轨迹数据，并写出为不同编码的CSV/TXT或Excel文件
+"""
+
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# 含中文的目的港，用于覆盖GBK/UTF-16等编码的解析路径
+DESTINATIONS = ['上海', '宁波', '青岛', '天津', '广州', '深圳', '厦门', 'Singapore', 'Busan', 'Rotterdam']
+VESSEL_TYPES = ['Cargo', 'Tanker', 'Passenger', 'Fishing', 'Tug', '货船', '油轮']
+FLAG_COUNTRIES = ['CN', 'PA', 'LR', 'MH', 'SG', 'HK', 'JP', 'KR']
+
+SUPPORTED_FORMATS = ['csv', 'txt', 'xlsx']
+SUPPORTED_ENCODINGS = ['utf-8', 'utf-8-sig', 'gbk', 'utf-16']
+
+
+def generate_ais_frame(rows, ships, seed=42, start_time='2024-01-01 00:00:00', interval_seconds=60,
+                       shuffle=True):
+    """
+    生成合成AIS数据
+    每条船从随机位置出发做随机游走，报告时间按 interval_seconds 递增，
+    shuffle 为True时打乱行顺序以模拟多船交错上报
+    """
+    rng = np.random.default_rng(seed)
+    ships = max(1, min(ships, rows))
+
+    ship_index = rng.integers(0, ships, size=rows)
+    ship_index[:ships] = np.arange(ships)
+    order = np.argsort(ship_index, kind='stable')
+    sorted_ships = ship_index[order]
+
+    # 每条船内的序号，用于生成递增的时间和累积的位移
+    counts = np.bincount(sorted_ships, minlength=ships)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    step = np.arange(rows) - np.repeat(starts, counts)
+
+    base_lon = rng.uniform(100, 140, size=ships)
+    base_lat = rng.uniform(0, 40, size=ships)
+    drift_lon = rng.normal(0, 0.01, size=rows)
+    drift_lat = rng.normal(0, 0.01, size=rows)
+    # 各船内累加位移
+    cum_lon = np.cumsum(drift_lon)
+    cum_lat = np.cumsum(drift_lat)
+    cum_lon -= np.repeat(cum_lon[starts] - drift_lon[starts], counts)
+    cum_lat -= np.repeat(cum_lat[starts] - drift_lat[starts], counts)
+
+    mmsi = 412000000 + sorted_ships
+    base = pd.Timestamp(start_time)
+    offsets = rng.integers(0, interval_seconds * 10, size=ships)
+    seconds = np.repeat(offsets, counts) + step * interval_seconds
+
+    df = pd.DataFrame({
+        'mmsi': mmsi,
+        'lon': np.round(np.clip(base_lon[sorted_ships] + cum_lon, -180, 180), 6),
+        'lat': np.round(np.clip(base_lat[sorted_ships] + cum_lat, -90, 90), 6),
+        'postime': (base + pd.to_timedelta(seconds, unit='s')).strftime('%Y-%m-%d %H:%M:%S'),
+        'speed': np.round(rng.uniform(0, 20, size=rows), 1),
+        'heading': np.round(rng.uniform(0, 360, size=rows), 1),
+        'dest': np.array(DESTINATIONS)[sorted_ships % len(DESTINATIONS)],
+        'vessel_type': np.array(VESSEL_TYPES)[sorted_ships % len(VESSEL_TYPES)],
+        'flag_ctry': np.array(FLAG_COUNTRIES)[sorted_ships % len(FLAG_COUNTRIES)]
+    })
+
+    if shuffle:
+        df = df.iloc[rng.permutation(rows)].reset_index(drop=True)
+    return df
+
+
+def write_dataset(df, path, file_format='csv', encoding='utf-8'):
+    """按格式和编码写出数据文件，返回文件路径"""
+    if file_format not in SUPPORTED_FORMATS:
+        raise ValueError(f"不支持的文件格式: {file_format}")
+    if file_format == 'xlsx':
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False, encoding=encoding)
+    return path
+
+
+def dataset_filename(rows, ships, file_format, encoding):
+    encoding_tag = 'native' if file_format == 'xlsx' else encoding.replace('-', '')
+    return f"synthetic_{rows}r_{ships}s_{encoding_tag}.{file_format}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成AIS数据文件')
+    parser.add_argument('--rows', type=int, default=100000, help='数据行数')
+    parser.add_argument('--ships', type=int, default=1000, help='船只数量')
+    parser.add_argument('--format', default='csv', choices=SUPPORTED_FORMATS, help='文件格式')
+    parser.add_argument('--encoding', default='utf-8', choices=SUPPORTED_ENCODINGS, help='CSV/TXT编码')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--output', default='.', help='输出目录')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    df = generate_ais_frame(args.rows, args.ships, seed=args.seed)
+    path = os.path.join(args.output, dataset_filename(args.rows, args.ships, args.format, args.encoding))
+    write_dataset(df, path, args.format, args.encoding)
+    print(f"已生成 {path}，共 {len(df)} 行，{args.ships} 条船，大小 {os.path.getsize(path) / 1024 / 1024:.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
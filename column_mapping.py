@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+字段映射
+所有接口和服务共用的字段别名，只根据表头解析出每个标准字段对应的原始列，
+同一表头的解析结果会被缓存；读取时只解析需要的列，文本字段直接按字符串读取，
+避免对宽表做逐列类型推断
+"""
+
+import functools
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas', globals(), 'pd')
+
+# 字段别名（均为小写，匹配时忽略原始表头的大小写）
+MMSI_COLUMNS = ['mmsi', 'mmsi_number', 'ship_mmsi']
+LON_COLUMNS = ['lon', 'longitude', 'long', 'lng']
+LAT_COLUMNS = ['lat', 'latitude', 'latitude_']
+DEST_COLUMNS = ['dest', 'destination', 'port', 'dest_port']
+VESSEL_TYPE_COLUMNS = ['vessel_type', 'vesseltype', 'vessel-type', 'type', 'ship_type']
+TIME_COLUMNS = ['postime', 'timestamp', 'time', 'datetime', 'date', 'record_time', 'update_time', 'time_stamp',
+                'basedatetime']
+FLAG_CTRY_COLUMNS = ['flag_ctry', 'flag_country', 'country', 'flag']
+
+# 标准字段及其别名，顺序即输出字段顺序
+FIELD_ALIASES = [
+    ('mmsi', MMSI_COLUMNS),
+    ('lon', LON_COLUMNS),
+    ('lat', LAT_COLUMNS),
+    ('dest', DEST_COLUMNS),
+    ('vessel_type', VESSEL_TYPE_COLUMNS),
+    ('flag_ctry', FLAG_CTRY_COLUMNS),
+    ('postime', TIME_COLUMNS),
+]
+
+# 按字符串读取的字段
+TEXT_FIELDS = ['mmsi', 'dest', 'vessel_type', 'flag_ctry']
+
+
+def find_column(columns, candidates):
+    """按别名顺序查找第一个存在的字段"""
+    for col in candidates:
+        if col in columns:
+            return col
+    return None
+
+
+class ColumnMapping:
+    """一个表头对应的标准字段映射"""
+
+    def __init__(self, header):
+        self.header = list(header)
+        # 小写名 -> 原始列名，重名时取第一个
+        lowered = {}
+        for name in self.header:
+            lowered.setdefault(str(name).lower(), name)
+        self.columns = {}
+        for field, aliases in FIELD_ALIASES:
+            alias = find_column(lowered, aliases)
+            if alias is not None:
+                self.columns[field] = lowered[alias]
+
+    def get(self, field):
+        """标准字段对应的原始列名，不存在时为None"""
+        return self.columns.get(field)
+
+    def has(self, field):
+        return field in self.columns
+
+    @property
+    def has_coordinates(self):
+        return 'lon' in self.columns and 'lat' in self.columns
+
+    @property
+    def usecols(self):
+        """需要读取的原始列，按表头顺序"""
+        wanted = set(self.columns.values())
+        return [name for name in self.header if name in wanted]
+
+    @property
+    def dtype(self):
+        """read_csv使用的字段类型，文本字段不做类型推断"""
+        return {self.columns[field]: str for field in TEXT_FIELDS if field in self.columns}
+
+    @property
+    def rename(self):
+        """原始列名 -> 标准字段名"""
+        return {column: field for field, column in self.columns.items()}
+
+
+@functools.lru_cache(maxsize=256)
+def _resolve(header):
+    return ColumnMapping(header)
+
+
+def resolve_mapping(header):
+    """解析表头对应的字段映射，相同表头直接返回缓存结果"""
+    return _resolve(tuple(header))
+
+
+def read_csv_header(source, encoding):
+    """只读取表头"""
+    return list(pd.read_csv(source, encoding=encoding, nrows=0).columns)
+
+
+def read_csv_mapped(source, encoding, mapping, **kwargs):
+    """按映射只读取需要的列"""
+    return pd.read_csv(source, encoding=encoding, usecols=mapping.usecols, dtype=mapping.dtype, **kwargs)
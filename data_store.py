@@ -0,0 +1,1732 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+船舶数据集存储
+按文件维护标准化后的轨迹数据和按船只分组、按时间排序的存储，
+对持续增长的CSV/TXT文件只解析新追加的行；
+Excel文件只流式读取需要的列，转换结果缓存到磁盘
+"""
+
+import io
+import os
+import sys
+import json
+import pickle
+import base64
+import bisect
+import hashlib
+import threading
+import time
+import logging
+from operator import itemgetter
+from collections import OrderedDict
+
+from lazy_imports import lazy_import
+from metrics import registry, stage
+from column_mapping import resolve_mapping, read_csv_header, read_csv_mapped
+from time_parsing import detect_time_format, parse_times
+from kinematics import KINEMATIC_COLUMNS, KM_PER_NAUTICAL_MILE, empty_seed, track_kinematics, time_seconds, haversine_km
+from events import EVENT_TYPES, DEFAULT_EVENT_PARAMS, detect_events
+
+# pandas/numpy 在首次使用时才导入，见 lazy_imports
+np = lazy_import('numpy', globals(), 'np')
+pd = lazy_import('pandas', globals(), 'pd')
+
+logger = logging.getLogger('ship-data-store')
+
+# CSV/TXT文件尝试的编码顺序
+CSV_ENCODINGS = ['utf-8-sig', 'utf-8', 'gbk', 'gb2312', 'gb18030', 'latin-1', 'cp1252',
+                 'utf-16', 'utf-16-le', 'utf-16-be', 'cp936', 'cp437']
+
+EXCEL_EXTENSIONS = ['.xlsx', '.xls']
+
+# Excel转换结果缓存文件的后缀和格式版本，格式变化时旧缓存自动失效
+CACHE_SUFFIX = '.dataset.pkl'
+CACHE_FORMAT_VERSION = 3
+
+# 缓存目录中记录最近读取过的文件，服务启动时据此预热；最多记录 RECENT_LIMIT 个
+RECENT_FILENAME = 'recent_datasets.json'
+RECENT_LIMIT = 50
+# 缓存目录中记录各文件数据的时间范围（UTC），跨文件查询时据此跳过与查询时间不相交的文件，不必逐个读取
+SPANS_FILENAME = 'dataset_spans.json'
+# 已记录的文件只是顺序变化时，最近使用记录最多每隔这么多秒写一次磁盘
+RECENT_SAVE_SECONDS = 30.0
+
+# 视为空值的字符串
+NULL_STRINGS = ['nan', 'None', 'null', 'NaN', 'NAN']
+
+# 返回给前端的字段，内部的行号列不对外输出
+OUTPUT_COLUMNS = ['mmsi', 'lon', 'lat', 'dest', 'vessel_type', 'flag_ctry', 'postime']
+ROW_COLUMN = '_row'
+# 各船轨迹点额外输出读取时计算的航行指标
+POINT_COLUMNS = OUTPUT_COLUMNS + KINEMATIC_COLUMNS
+# 可能缺失的航行指标，输出为null
+NULLABLE_KINEMATIC_COLUMNS = ['sog', 'cog']
+
+# 用于判断文件是否只是追加写入的头部指纹长度
+HEAD_DIGEST_BYTES = 64 * 1024
+# 从文件末尾向前查找最后一个换行时每次读取的字节数
+TAIL_SCAN_BYTES = 64 * 1024
+# 文件末尾没有换行的最后一行视为写入方还没写完，文件超过该时间(秒)没有变化后才当作完整行读取
+TAIL_SETTLE_SECONDS = 5.0
+
+
+# 船只列表支持的排序方式
+SHIP_SORT_KEYS = ['mmsi', 'point_count']
+
+# 支持按值筛选的字段，读取时为每个取值建立行号集合
+FILTER_FIELDS = ['mmsi', 'vessel_type', 'flag_ctry', 'dest']
+# 多个字段之间的组合方式：all 同时满足，any 满足任意一个
+FILTER_MATCH_MODES = ['all', 'any']
+
+# 读取时预先统计的全球密度网格分辨率(度)，其整数倍的分辨率直接由这些网格合并得到
+HEATMAP_LEVELS = [1.0, 0.25]
+# 支持的最小分辨率(度)
+HEATMAP_MIN_RESOLUTION = 0.001
+# 热力图可按时间分桶和按字段分组
+HEATMAP_TIME_BUCKETS = {'hour': 'datetime64[h]', 'day': 'datetime64[D]'}
+HEATMAP_GROUP_FIELDS = ['vessel_type', 'flag_ctry']
+# 按需计算的热力图缓存数量，数据变化后清空
+HEATMAP_CACHE_SIZE = 32
+
+# 估算数据集内存时的固定开销(字节)：每条船的DataFrame、每个筛选取值的列表和数组、密度统计的每个网格（键值两个int）
+SHIP_FRAME_OVERHEAD_BYTES = 4096
+ROW_SET_OVERHEAD_BYTES = 200
+DENSITY_ITEM_BYTES = 120
+
+# 按检测参数缓存的事件检测结果数量，数据变化后清空
+EVENTS_CACHE_SIZE = 8
+
+
+class DatasetError(Exception):
+    """数据集无法解析时抛出，携带返回给客户端的错误信息和状态码"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+    def to_dict(self):
+        result = {'error': self.message}
+        result.update(self.extra)
+        return result
+
+
+def encode_page_cursor(value):
+    """把分页位置编码为不透明的游标字符串"""
+    raw = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_page_cursor(cursor):
+    """解析分页游标，格式错误时抛出DatasetError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise DatasetError('分页游标格式不正确', cursor=cursor)
+
+
+def _time_to_iso(value):
+    return value.isoformat() if value is not None and pd.notna(value) else None
+
+
+def point_records(rows):
+    """轨迹点转换为字典列表，带航行指标时一并输出，缺失的航速和航向为None"""
+    if KINEMATIC_COLUMNS[0] not in rows.columns:
+        return rows[OUTPUT_COLUMNS].to_dict('records')
+    nullable = {column: rows[column].astype(object).where(rows[column].notna(), None)
+                for column in NULLABLE_KINEMATIC_COLUMNS if rows[column].isna().any()}
+    return rows[POINT_COLUMNS].assign(**nullable).to_dict('records')
+
+
+def _clean_text(series):
+    """转换为字符串并把各种空值统一为空字符串"""
+    series = series.astype(str)
+    series = series.replace(NULL_STRINGS, '')
+    return series.fillna('')
+
+
+def read_excel_columns(filepath):
+    """
+    读取Excel第一个工作表中映射到标准字段的列，返回 (DataFrame, 完整表头, 字段映射)
+    .xlsx 使用openpyxl只读模式逐行流式读取，只保留需要的列；
+    .xls 由pandas读取（需要xlrd），同样只解析需要的列
+    """
+    if filepath.lower().endswith('.xls'):
+        header = [str(name) for name in pd.read_excel(filepath, nrows=0).columns]
+        mapping = resolve_mapping(header)
+        df = pd.read_excel(filepath, usecols=mapping.usecols, dtype=mapping.dtype)
+        return df, header, mapping
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        header = [str(name) if name is not None else f'Unnamed: {index}' for index, name in enumerate(header)]
+        mapping = resolve_mapping(header)
+        usecols = mapping.usecols
+        if not usecols:
+            return pd.DataFrame(), header, mapping
+
+        # 只读模式下的行可能短于表头，补齐后再按列取值
+        indices = [header.index(name) for name in usecols]
+        width = max(indices) + 1
+        getter = itemgetter(*indices)
+        records = []
+        for row in rows:
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            records.append(getter(row) if len(indices) > 1 else (getter(row),))
+    finally:
+        workbook.close()
+
+    # 去掉末尾的空行，与pandas读取结果保持一致
+    while records and all(value is None for value in records[-1]):
+        records.pop()
+    return pd.DataFrame.from_records(records, columns=usecols), header, mapping
+
+
+def normalize_frame(df, row_offset=0, mapping=None, time_format=None):
+    """
+    把原始数据转换为标准字段：mmsi, lon, lat, dest, vessel_type, flag_ctry, postime
+    row_offset 为这批数据第一行在整个文件中的行号，用于生成连续的内部行号
+    mapping 为文件表头解析出的字段映射，未提供时按df的列名解析
+    time_format 为已识别的时间格式，未提供时在本批数据上识别
+    返回 (标准化并过滤无效经纬度后的DataFrame, 原始行数)
+    """
+    if mapping is None:
+        mapping = resolve_mapping(df.columns)
+    df.index = pd.RangeIndex(row_offset, row_offset + len(df))
+
+    mmsi_column = mapping.get('mmsi')
+    lon_column = mapping.get('lon')
+    lat_column = mapping.get('lat')
+    dest_column = mapping.get('dest')
+    vessel_type_column = mapping.get('vessel_type')
+    time_column = mapping.get('postime')
+    flag_ctry_column = mapping.get('flag_ctry')
+
+    if not lon_column:
+        logger.warning("未找到经度字段")
+        raise DatasetError('CSV文件中未找到经度字段(lon/longitude)')
+    if not lat_column:
+        logger.warning("未找到纬度字段")
+        raise DatasetError('CSV文件中未找到纬度字段(lat/latitude)')
+
+    new_df_data = {}
+
+    # 没有mmsi字段时使用行号作为标识
+    if mmsi_column:
+        new_df_data['mmsi'] = df[mmsi_column].astype(str)
+    else:
+        new_df_data['mmsi'] = df.index.astype(str)
+
+    new_df_data['lon'] = pd.to_numeric(df[lon_column], errors='coerce')
+    new_df_data['lat'] = pd.to_numeric(df[lat_column], errors='coerce')
+    new_df_data['dest'] = _clean_text(df[dest_column]) if dest_column else ''
+    new_df_data['vessel_type'] = _clean_text(df[vessel_type_column]) if vessel_type_column else ''
+    new_df_data['flag_ctry'] = _clean_text(df[flag_ctry_column]) if flag_ctry_column else ''
+
+    if time_column:
+        try:
+            if time_format is None:
+                time_format = detect_time_format(df[time_column])
+            new_df_data['postime'] = parse_times(df[time_column], time_format)
+        except Exception:
+            new_df_data['postime'] = df[time_column].astype(str)
+    else:
+        new_df_data['postime'] = pd.NaT
+
+    new_df_data[ROW_COLUMN] = df.index.values
+    result = pd.DataFrame(new_df_data, index=df.index)
+
+    # 过滤无效的经纬度数据
+    result = result[pd.notna(result['lon']) & pd.notna(result['lat'])]
+    result = result[(result['lon'] >= -180) & (result['lon'] <= 180)]
+    result = result[(result['lat'] >= -90) & (result['lat'] <= 90)]
+    return result.reset_index(drop=True), len(df)
+
+
+def _order_by_ship(rows, is_datetime):
+    """
+    按MMSI、时间、行号排序（无效时间排在船内最后），与逐船稳定排序的结果一致
+    返回 (排序后的数据, 每条船第一个点的下标)
+    """
+    order, starts = _ship_sort_order(rows, is_datetime)
+    return rows.iloc[order], starts
+
+
+def _ship_sort_order(rows, is_datetime):
+    """按MMSI、时间、行号排序的位置，返回 (排序位置, 排序后每条船第一个点的下标)"""
+    codes, _ = pd.factorize(rows['mmsi'].values, sort=True)
+    keys = [rows[ROW_COLUMN].values]
+    if is_datetime:
+        times = rows['postime'].values.astype('datetime64[ns]')
+        time_keys = times.view(np.int64).copy()
+        time_keys[np.isnat(times)] = np.iinfo(np.int64).max
+        keys.append(time_keys)
+    keys.append(codes)
+    order = np.lexsort(keys)
+    starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+    return order, starts
+
+
+def _with_kinematics(ship_data):
+    """对单条按时间排序的船只轨迹整条计算航行指标，返回 (带指标的轨迹, 合计)"""
+    is_datetime = pd.api.types.is_datetime64_any_dtype(ship_data['postime'])
+    seconds = time_seconds(ship_data['postime'].values) if is_datetime else None
+    columns, totals = track_kinematics(ship_data['lon'].to_numpy(dtype='float64'),
+                                       ship_data['lat'].to_numpy(dtype='float64'),
+                                       seconds, [0])
+    return ship_data.assign(**columns), {
+        'distance_km': float(totals['distance_km'][0]),
+        'moving_seconds': float(totals['moving_seconds'][0]),
+        'max_sog': float(totals['max_sog'][0]),
+        'voyage_count': int(totals['voyage_count'][0])
+    }
+
+
+class Dataset:
+    """单个文件对应的数据集：全部有效数据、按船只排序的轨迹和增量读取位置"""
+
+    def __init__(self, filename, filepath, cache_path=None, thin_seconds=0, thin_meters=0):
+        self.filename = filename
+        self.filepath = filepath
+        # Excel文件转换后的标准化数据缓存，服务重启或缓存失效后无需重新解析Excel
+        self.cache_path = cache_path
+        # 读取时抽稀：同一船只在 thin_seconds 秒的时间桶内、与桶内第一个点相距不足 thin_meters 米的点被丢弃；
+        # thin_seconds 为0时不抽稀，thin_meters 为0时不限距离
+        self.thin_seconds = thin_seconds
+        self.thin_meters = thin_meters
+        self.file_ext = os.path.splitext(filename)[1].lower()
+        self.lock = threading.RLock()
+        # 版本号在整个数据集生命周期内单调递增，全量重新读取也不会重置
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self.loaded = False
+        # 数据、按船只排序的存储、筛选索引和密度统计大致占用的内存，用于数据集缓存的容量控制；
+        # 数据部分含字符串内容，全量读取时整体统计一次，之后按追加的数据累加
+        self.memory_bytes = 0
+        self._frame_bytes = 0
+        self.encoding = None
+        # 完整表头和解析出的字段映射
+        self.raw_columns = None
+        self.mapping = None
+        # 识别出的时间格式，增量读取时直接使用
+        self.time_format = None
+        self.byte_offset = 0
+        self.head_digest = None
+        self.head_digest_length = 0
+        self.file_size = 0
+        self.file_mtime = None
+        self.raw_rows = 0
+        # 最近一次读取方式：'full' 全量读取，'append' 增量读取
+        self.last_ingest = None
+        # 每次全量读取生成新的代号，旧代号的游标需要客户端重新同步
+        self.generation = None
+        self._chunks = []
+        self._frame = None
+        self.ships = {}
+        # 船只列表的排序结果和摘要缓存，数据变化后失效
+        self._ship_order = {}
+        self._summary = None
+        self.ship_stats = {}
+        self.time_start = None
+        self.time_end = None
+        # 筛选索引：字段 -> 取值 -> 行号数组列表（行号为在 frame 中的位置，升序）
+        self.valid_rows = 0
+        # 读取时去掉的完全重复（MMSI、时间、位置都相同）和被抽稀的行数
+        self.duplicate_rows = 0
+        self.thinned_rows = 0
+        self._row_sets = {field: {} for field in FILTER_FIELDS}
+        # 预先统计的密度：分辨率 -> {网格编号(纬度格*经度格数+经度格): 点数}，只记录有数据的网格
+        self._density = {level: {} for level in HEATMAP_LEVELS}
+        self._heatmap_cache = OrderedDict()
+        # 全部船只轨迹按MMSI拼接后的结果和事件检测结果，数据变化后失效
+        self._tracks = None
+        self._events_cache = OrderedDict()
+
+    # ---------- 对外只读属性 ----------
+
+    @property
+    def frame(self):
+        """全部有效数据，按读取顺序拼接，追加后惰性重建"""
+        if self._frame is None:
+            if self._chunks:
+                self._frame = pd.concat(self._chunks, ignore_index=True)
+                self._chunks = [self._frame]
+            else:
+                self._frame = pd.DataFrame(columns=OUTPUT_COLUMNS + [ROW_COLUMN])
+        return self._frame
+
+    @property
+    def time_is_datetime(self):
+        for chunk in self._chunks:
+            return pd.api.types.is_datetime64_any_dtype(chunk['postime'])
+        return False
+
+    # ---------- 读取 ----------
+
+    def refresh(self):
+        """
+        确保内存中的数据与磁盘文件一致
+        文件未变化时直接返回；只在末尾追加时解析新增行；其他情况全量重新读取
+        返回本次新增的标准化数据（无变化时为None）
+        """
+        stat = os.stat(self.filepath)
+        if self.loaded and stat.st_size == self.file_size and stat.st_mtime == self.file_mtime:
+            # 文件未变化，但末尾还有未读取的行且已超过等待时间时，把它作为完整行读取
+            if not (self.byte_offset < stat.st_size and self._settled(stat)):
+                return None
+
+        if self.loaded and self._can_append(stat):
+            new_rows = self._ingest_append(stat)
+        else:
+            new_rows = self._ingest_full(stat)
+
+        self.file_size = stat.st_size
+        self.file_mtime = stat.st_mtime
+        if self.last_ingest == 'full' and self._frame_bytes == 0:
+            self._frame_bytes = frame_memory(self.frame)
+        elif new_rows is not None and len(new_rows) > 0:
+            self._frame_bytes += frame_memory(new_rows)
+        self.memory_bytes = self._estimate_bytes()
+        return new_rows
+
+    def _estimate_bytes(self):
+        """
+        全部数据（含字符串内容）加上：按船只排序的存储（与全部数据共用字符串对象，按其中一条船的列类型估算每行大小）、
+        各筛选字段每行一个int64行号及每个取值的列表和数组对象、密度统计字典的每个网格
+        """
+        total = self._frame_bytes
+        if self.ships:
+            sample = next(iter(self.ships.values()))
+            total += len(self.frame) * sum(dtype.itemsize for dtype in sample.dtypes)
+            total += len(self.ships) * SHIP_FRAME_OVERHEAD_BYTES
+        total += len(self.frame) * len(FILTER_FIELDS) * 8
+        total += sum(len(row_sets) for row_sets in self._row_sets.values()) * ROW_SET_OVERHEAD_BYTES
+        total += sum(sys.getsizeof(density) + len(density) * DENSITY_ITEM_BYTES for density in self._density.values())
+        return total
+
+    def _read_head_digest(self, length):
+        with open(self.filepath, 'rb') as f:
+            return hashlib.md5(f.read(length)).hexdigest()
+
+    def _can_append(self, stat):
+        """只有CSV/TXT、按字节可切分的编码、文件变长且头部未改变时才按追加处理"""
+        if self.file_ext in EXCEL_EXTENSIONS:
+            return False
+        if self.encoding is None or self.encoding.startswith('utf-16'):
+            return False
+        if stat.st_size < self.byte_offset:
+            return False
+        return self._read_head_digest(self.head_digest_length) == self.head_digest
+
+    def _settled(self, stat):
+        return time.time() - stat.st_mtime >= TAIL_SETTLE_SECONDS
+
+    def _complete_length(self, size):
+        """文件前 size 字节中最后一个换行之后的位置，写入方可能还没写完最后一行；没有换行时返回 size"""
+        with open(self.filepath, 'rb') as f:
+            position = size
+            while position > 0:
+                start = max(position - TAIL_SCAN_BYTES, 0)
+                f.seek(start)
+                index = f.read(position - start).rfind(b'\n')
+                if index >= 0:
+                    return start + index + 1
+                position = start
+        return size
+
+    def _read_raw_full(self, stat):
+        """
+        读取整个文件中需要的列，返回 (原始DataFrame, 编码, 完整表头, 字段映射, 已解析的字节数)
+        CSV/TXT按编码顺序先只解析表头，能找到经纬度字段的编码才做完整读取；
+        所有编码都找不到经纬度时返回第一个能解析表头的结果，由标准化给出缺少字段的错误
+        与增量读取一致，只解析到最后一个换行，未写完的最后一行留到下次追加读取
+        """
+        if self.file_ext in EXCEL_EXTENSIONS:
+            logger.debug("读取Excel文件: %s", self.filepath)
+            with stage('parse'):
+                df, header, mapping = read_excel_columns(self.filepath)
+            return df, None, header, mapping, stat.st_size
+
+        complete = stat.st_size if self._settled(stat) else self._complete_length(stat.st_size)
+        prefix = None
+        fallback = None
+        for encoding in CSV_ENCODINGS:
+            try:
+                header = read_csv_header(self.filepath, encoding)
+                mapping = resolve_mapping(header)
+                if not mapping.has_coordinates:
+                    registry.inc('ship_encoding_attempts_total', encoding=encoding, result='no_coordinates')
+                    logger.debug("%s 编码的表头中没有经纬度字段，尝试下一种编码", encoding)
+                    if fallback is None:
+                        fallback = (pd.DataFrame(columns=header), encoding, header, mapping, stat.st_size)
+                    continue
+                # utf-16 的换行不是单字节，这类文件也不做追加读取，整体解析
+                length = stat.st_size if encoding.startswith('utf-16') else complete
+                source = self.filepath
+                if length < stat.st_size or os.path.getsize(self.filepath) != stat.st_size:
+                    if prefix is None:
+                        with open(self.filepath, 'rb') as f:
+                            prefix = f.read(length)
+                    source = io.BytesIO(prefix[:length])
+                with stage('parse'):
+                    df = read_csv_mapped(source, encoding, mapping)
+                registry.inc('ship_encoding_attempts_total', encoding=encoding, result='ok')
+                logger.debug("使用 %s 编码读取文件: %s", encoding, self.filepath)
+                return df, encoding, header, mapping, length
+            except UnicodeDecodeError:
+                registry.inc('ship_encoding_attempts_total', encoding=encoding, result='decode_error')
+                logger.debug("%s 编码解析失败，尝试下一种编码", encoding)
+                continue
+            except Exception as e:
+                registry.inc('ship_encoding_attempts_total', encoding=encoding, result='error')
+                logger.debug("使用 %s 编码读取CSV/TXT文件时出错: %s", encoding, e)
+                continue
+        if fallback is not None:
+            return fallback
+        return None, None, None, None, stat.st_size
+
+    def _load_cache(self, stat):
+        """读取与当前文件大小和修改时间一致的转换缓存，不存在或已失效时返回None"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with stage('cache_load'), open(self.cache_path, 'rb') as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            logger.warning("读取缓存 %s 失败: %s", self.cache_path, e)
+            return None
+        if (cached.get('format') != CACHE_FORMAT_VERSION or cached.get('size') != stat.st_size
+                or cached.get('mtime_ns') != stat.st_mtime_ns):
+            return None
+        return cached
+
+    def _write_cache(self, stat, normalized, raw_rows, meta):
+        """先写临时文件再替换，避免并发读取到不完整的缓存"""
+        cached = {
+            'format': CACHE_FORMAT_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'raw_rows': raw_rows,
+            'meta': meta,
+            'frame': normalized
+        }
+        temp_path = f"{self.cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("写入缓存 %s 失败: %s", self.cache_path, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _read_normalized(self, stat):
+        """
+        读取并标准化整个文件，返回 (标准化数据, 原始行数, 元数据)
+        元数据包括完整表头 raw_columns、编码 encoding 和时间格式 time_format
+        """
+        use_cache = self.cache_path and self.file_ext in EXCEL_EXTENSIONS
+        if use_cache:
+            cached = self._load_cache(stat)
+            if cached is not None:
+                return cached['frame'], cached['raw_rows'], cached['meta']
+
+        try:
+            df, encoding, raw_columns, mapping, length = self._read_raw_full(stat)
+        except Exception as e:
+            logger.warning("读取文件 %s 时发生错误: %s", self.filename, e)
+            df, encoding, raw_columns, mapping, length = None, None, None, None, None
+
+        if df is None:
+            raise DatasetError('文件格式错误，无法解析', file_type=self.file_ext)
+
+        time_format = None
+        if mapping.has('postime'):
+            # 重新读取时优先沿用上次识别出的格式
+            with stage('time_format'):
+                time_format = detect_time_format(df[mapping.get('postime')], preferred=self.time_format)
+            logger.debug("文件 %s 的时间格式: %s", self.filename, time_format)
+        else:
+            logger.warning("文件 %s 未找到时间字段(postime/timestamp)", self.filename)
+
+        with stage('normalize'):
+            normalized, raw_rows = normalize_frame(df, mapping=mapping, time_format=time_format)
+        meta = {'raw_columns': raw_columns, 'encoding': encoding, 'time_format': time_format, 'length': length}
+        if use_cache:
+            self._write_cache(stat, normalized, raw_rows, meta)
+        return normalized, raw_rows, meta
+
+    def _ingest_full(self, stat):
+        normalized, raw_rows, meta = self._read_normalized(stat)
+
+        self._reset()
+        self.generation = f"{int(time.time() * 1000):x}"
+        self.encoding = meta['encoding']
+        self.raw_columns = meta['raw_columns']
+        self.mapping = resolve_mapping(self.raw_columns)
+        self.time_format = meta['time_format']
+        # 后续追加从已解析的最后一个换行之后开始，文件末尾未写完的行在写完后按追加读取
+        self.byte_offset = meta.get('length', stat.st_size)
+        self.head_digest_length = min(self.byte_offset, HEAD_DIGEST_BYTES)
+        self.head_digest = self._read_head_digest(self.head_digest_length)
+        valid_rows = len(normalized)
+        normalized = self._merge(normalized, raw_rows)
+        self.loaded = True
+        self.last_ingest = 'full'
+
+        filtered_rows = raw_rows - valid_rows
+        if filtered_rows > 0:
+            logger.info("文件 %s: 过滤了 %d 行无效经纬度数据，剩余 %d 行有效数据",
+                        self.filename, filtered_rows, valid_rows)
+        if self.duplicate_rows or self.thinned_rows:
+            logger.info("文件 %s: 去掉 %d 行重复数据，抽稀 %d 行", self.filename, self.duplicate_rows, self.thinned_rows)
+        return normalized
+
+    def _ingest_append(self, stat):
+        """只解析上次读取位置之后新追加的完整行"""
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.byte_offset)
+            chunk = f.read(stat.st_size - self.byte_offset)
+
+        # 最后一行可能尚未写完，留到下次读取；文件已有一段时间没有变化时全部读取
+        if not self._settled(stat):
+            last_newline = chunk.rfind(b'\n')
+            if last_newline < 0:
+                return None
+            chunk = chunk[:last_newline + 1]
+
+        try:
+            with stage('parse'):
+                df = read_csv_mapped(io.BytesIO(chunk), self.encoding, self.mapping,
+                                     header=None, names=self.raw_columns)
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame(columns=self.mapping.usecols)
+        except Exception as e:
+            # 追加内容无法按原有表头解析时回退到全量读取
+            logger.warning("增量读取文件 %s 失败，改为全量读取: %s", self.filename, e)
+            return self._ingest_full(stat)
+
+        self.byte_offset += len(chunk)
+        with stage('normalize'):
+            normalized, raw_rows = normalize_frame(df, row_offset=self.raw_rows, mapping=self.mapping,
+                                                   time_format=self.time_format)
+        normalized = self._merge(normalized, raw_rows)
+        self.last_ingest = 'append'
+        logger.debug("文件 %s: 增量读取 %d 行，新增 %d 行有效数据", self.filename, raw_rows, len(normalized))
+        return normalized
+
+    # ---------- 合并到按船只排序的存储 ----------
+
+    def _merge(self, new_rows, raw_rows):
+        """把新数据去重、抽稀后合并到全部数据、各船只有序轨迹和范围统计中，返回实际合并的数据"""
+        with stage('dedup'):
+            new_rows = self._drop_redundant(new_rows)
+        with stage('group'):
+            self._merge_rows(new_rows, raw_rows)
+        return new_rows
+
+    def _drop_redundant(self, new_rows):
+        """去掉与本批或已有数据完全重复的点，配置了抽稀时再丢弃过密的点；只处理时间有效的点"""
+        if len(new_rows) == 0 or not pd.api.types.is_datetime64_any_dtype(new_rows['postime']):
+            return new_rows
+        valid = new_rows['postime'].notna().values
+        duplicate = valid & new_rows.duplicated(['mmsi', 'postime', 'lon', 'lat']).values
+
+        # 与已有数据重复的点时间不会晚于该船已有的最后时间，只检查这些点
+        if self.ship_stats:
+            end_times = pd.Series({mmsi_id: stats['end_time'] for mmsi_id, stats in self.ship_stats.items()})
+            ship_end = new_rows['mmsi'].map(end_times)
+            candidates = np.flatnonzero(valid & ~duplicate & (new_rows['postime'] <= ship_end).values)
+            if len(candidates) > 0:
+                rows = new_rows.iloc[candidates]
+                keys = _point_keys(rows)
+                times = keys[0]
+                for mmsi_id, positions in rows.groupby('mmsi', sort=False).indices.items():
+                    # 只在已有轨迹中与这些点时间范围重叠的一段里查找，按时间排序的存储可二分定位
+                    # （无效时间排在最后，比任何有效时间都大）
+                    existing = self.ships[mmsi_id]
+                    existing_times = existing['postime'].values
+                    group_times = times[positions].view('datetime64[ns]')
+                    left = int(np.searchsorted(existing_times, group_times.min(), side='left'))
+                    right = int(np.searchsorted(existing_times, group_times.max(), side='right'))
+                    known = set(zip(*(column.tolist() for column in _point_keys(existing.iloc[left:right]))))
+                    hits = [key in known for key in zip(*(column[positions].tolist() for column in keys))]
+                    duplicate[candidates[positions[np.array(hits, dtype=bool)]]] = True
+
+        keep = ~duplicate
+        self.duplicate_rows += int(duplicate.sum())
+        if self.thin_seconds > 0:
+            thinned = self._thin_mask(new_rows, keep)
+            self.thinned_rows += int(thinned.sum())
+            keep &= ~thinned
+        if keep.all():
+            return new_rows
+        return new_rows[keep].reset_index(drop=True)
+
+    def _thin_mask(self, new_rows, keep):
+        """
+        按船只、时间排序后把每条船的点划入 thin_seconds 秒的时间桶，
+        桶内与第一个点（新数据接在已有轨迹之后且同桶时为已有的最后一个点）相距不足 thin_meters 的点被抽稀
+        返回按 new_rows 顺序的布尔数组
+        """
+        positions = np.flatnonzero(keep)
+        rows = new_rows.iloc[positions]
+        order, starts = _ship_sort_order(rows, True)
+        rows = rows.iloc[order]
+        count = len(rows)
+        lon = rows['lon'].to_numpy(dtype='float64')
+        lat = rows['lat'].to_numpy(dtype='float64')
+        mmsi_values = rows['mmsi'].values
+        bucket = np.floor(time_seconds(rows['postime'].values) / self.thin_seconds)
+
+        first = np.zeros(count, dtype=bool)
+        first[starts] = True
+        index = np.arange(count)
+        # 时间缺失的点 NaN != NaN，各自成桶，不会被抽稀
+        new_bucket = first | (bucket != np.roll(bucket, 1))
+        bucket_start = np.maximum.accumulate(np.where(new_bucket, index, 0))
+
+        anchor_lon, anchor_lat = lon.copy(), lat.copy()
+        seeded = np.zeros(count, dtype=bool)
+        for start in starts:
+            existing = self.ships.get(str(mmsi_values[start]))
+            if existing is None:
+                continue
+            last_time = existing['postime'].iloc[-1]
+            if pd.isna(last_time) or np.floor(last_time.value / 1e9 / self.thin_seconds) != bucket[start]:
+                continue
+            seeded[start] = True
+            anchor_lon[start] = existing['lon'].iloc[-1]
+            anchor_lat[start] = existing['lat'].iloc[-1]
+
+        thinned = ~new_bucket | seeded[bucket_start]
+        if self.thin_meters > 0:
+            distance = haversine_km(anchor_lon[bucket_start], anchor_lat[bucket_start], lon, lat) * 1000
+            thinned &= distance < self.thin_meters
+        result = np.zeros(len(new_rows), dtype=bool)
+        result[positions[order]] = thinned
+        return result
+
+    def _merge_rows(self, new_rows, raw_rows):
+        self.raw_rows += raw_rows
+        self.version += 1
+        if len(new_rows) == 0:
+            return
+
+        self._chunks.append(new_rows)
+        self._frame = None
+        self._ship_order = {}
+        self._summary = None
+        self._tracks = None
+        self._events_cache.clear()
+        self._index_rows(new_rows, self.valid_rows)
+        self.valid_rows += len(new_rows)
+        self._update_density(new_rows)
+        is_datetime = pd.api.types.is_datetime64_any_dtype(new_rows['postime'])
+
+        ordered, starts = _order_by_ship(new_rows, is_datetime)
+        ends = np.append(starts[1:], len(ordered))
+        ship_ids = [str(mmsi_id) for mmsi_id in ordered['mmsi'].values[starts]]
+        seconds = time_seconds(ordered['postime'].values) if is_datetime else None
+
+        # 已有船只的新数据都晚于已有数据（没有时间字段时按读取顺序）时直接追加，
+        # 航行指标从已有轨迹的最后一个点接续计算；否则合并后重新排序并整条重算
+        seed = empty_seed(len(starts))
+        resort = np.zeros(len(starts), dtype=bool)
+        for index, mmsi_id in enumerate(ship_ids):
+            existing = self.ships.get(mmsi_id)
+            if existing is None:
+                continue
+            if is_datetime:
+                old_end = self.ship_stats[mmsi_id]['end_time']
+                new_start = seconds[starts[index]]
+                # 无效时间排在最后，最后一个点有效即全部有效
+                last_time = existing['postime'].iloc[-1]
+                if old_end is None or np.isnan(new_start) or pd.isna(last_time) or new_start < old_end.value / 1e9:
+                    resort[index] = True
+                    continue
+                seed['seconds'][index] = last_time.value / 1e9
+            seed['lon'][index] = existing['lon'].iloc[-1]
+            seed['lat'][index] = existing['lat'].iloc[-1]
+            seed['voyage'][index] = existing['voyage'].iloc[-1]
+
+        columns, totals = track_kinematics(ordered['lon'].to_numpy(dtype='float64'),
+                                           ordered['lat'].to_numpy(dtype='float64'),
+                                           seconds, starts, seed=seed)
+        ordered = ordered.assign(**columns)
+
+        for index, mmsi_id in enumerate(ship_ids):
+            ship_new = ordered.iloc[starts[index]:ends[index]]
+            existing = self.ships.get(mmsi_id)
+            if existing is None:
+                merged = ship_new
+            elif not resort[index]:
+                merged = pd.concat([existing, ship_new])
+            else:
+                merged = pd.concat([existing, ship_new]).sort_values(['postime', ROW_COLUMN], kind='mergesort')
+                merged, ship_totals = _with_kinematics(merged)
+
+            self.ships[mmsi_id] = merged
+            self._update_ship_stats(mmsi_id, ship_new, is_datetime)
+            stats = self.ship_stats[mmsi_id]
+            if resort[index]:
+                stats.update(ship_totals)
+            else:
+                stats['distance_km'] += float(totals['distance_km'][index])
+                stats['moving_seconds'] += float(totals['moving_seconds'][index])
+                stats['max_sog'] = float(np.fmax(stats['max_sog'], totals['max_sog'][index]))
+                stats['voyage_count'] = int(totals['voyage_count'][index])
+
+    def _update_ship_stats(self, mmsi_id, ship_new, is_datetime):
+        stats = self.ship_stats.get(mmsi_id)
+        if stats is None:
+            stats = {
+                'point_count': 0,
+                'min_lon': None, 'max_lon': None,
+                'min_lat': None, 'max_lat': None,
+                'start_time': None, 'end_time': None,
+                'distance_km': 0.0, 'moving_seconds': 0.0, 'max_sog': np.nan, 'voyage_count': 0
+            }
+            self.ship_stats[mmsi_id] = stats
+
+        stats['point_count'] += len(ship_new)
+        for key, value in (('min_lon', ship_new['lon'].min()), ('min_lat', ship_new['lat'].min())):
+            stats[key] = value if stats[key] is None else min(stats[key], value)
+        for key, value in (('max_lon', ship_new['lon'].max()), ('max_lat', ship_new['lat'].max())):
+            stats[key] = value if stats[key] is None else max(stats[key], value)
+
+        if is_datetime:
+            valid_times = ship_new['postime'].dropna()
+            if len(valid_times) > 0:
+                start, end = valid_times.min(), valid_times.max()
+                if stats['start_time'] is None or start < stats['start_time']:
+                    stats['start_time'] = start
+                if stats['end_time'] is None or end > stats['end_time']:
+                    stats['end_time'] = end
+                if self.time_start is None or start < self.time_start:
+                    self.time_start = start
+                if self.time_end is None or end > self.time_end:
+                    self.time_end = end
+
+    def _index_rows(self, new_rows, base):
+        """把新数据按各筛选字段的取值加入行号集合，base 为这批数据在 frame 中的起始位置"""
+        for field in FILTER_FIELDS:
+            codes, values = pd.factorize(new_rows[field].values)
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes[codes >= 0], minlength=len(values))
+            start = int((codes < 0).sum())
+            row_sets = self._row_sets[field]
+            for code, value in enumerate(values):
+                end = start + int(counts[code])
+                row_sets.setdefault(str(value), []).append(order[start:end].astype(np.int64) + base)
+                start = end
+
+    def row_set(self, field, value):
+        """字段取值为 value 的行号（升序），多次追加的结果在首次查询时合并"""
+        parts = self._row_sets[field].get(value)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        if len(parts) > 1:
+            parts[:] = [np.concatenate(parts)]
+        return parts[0]
+
+    def filter_positions(self, filters, match='all'):
+        """
+        按 {字段: [取值, ...]} 筛选，同一字段的多个取值为“或”，
+        字段之间按 match 组合；返回 frame 中的行号（升序）
+        """
+        field_sets = []
+        for field, values in filters.items():
+            sets = [self.row_set(field, value) for value in values]
+            # 同一字段的不同取值互不重叠，合并后排序即可
+            field_sets.append(sets[0] if len(sets) == 1 else np.sort(np.concatenate(sets)))
+        if not field_sets:
+            return np.arange(self.valid_rows, dtype=np.int64)
+
+        field_sets.sort(key=len)
+        result = field_sets[0]
+        for other in field_sets[1:]:
+            if match == 'all':
+                result = np.intersect1d(result, other, assume_unique=True)
+                if len(result) == 0:
+                    break
+            else:
+                result = np.union1d(result, other)
+        return result
+
+    def filter_rows(self, filters, match='all'):
+        """筛选后的数据，按读取顺序排列"""
+        return self.frame.iloc[self.filter_positions(filters, match)]
+
+    # ---------- 密度热力图 ----------
+
+    def _update_density(self, new_rows):
+        """把新数据累加到预先统计的密度，只处理新数据涉及的网格"""
+        self._heatmap_cache.clear()
+        lon = new_rows['lon'].to_numpy(dtype='float64')
+        lat = new_rows['lat'].to_numpy(dtype='float64')
+        for level, density in self._density.items():
+            cells, counts = np.unique(grid_cells(lon, lat, level), return_counts=True)
+            for cell, count in zip(cells.tolist(), counts.tolist()):
+                density[cell] = density.get(cell, 0) + count
+
+    def _coarse_level(self, resolution):
+        """能合并得到该分辨率的最粗预统计网格，不存在时返回None"""
+        for level in sorted(HEATMAP_LEVELS, reverse=True):
+            factor = resolution / level
+            rounded = int(round(factor))
+            if rounded < 1 or abs(factor - rounded) > 1e-9:
+                continue
+            nx, ny = grid_shape(level)
+            if nx % rounded == 0 and ny % rounded == 0:
+                return level
+        return None
+
+    def heatmap(self, resolution, bbox=None, time_bucket=None, group_by=None, filters=None, match='all'):
+        """
+        按经纬度网格统计点数，bbox 为 (min_lon, max_lon, min_lat, max_lat)，选中与其相交的网格
+        返回列式结果：网格中心 lon/lat、计数 count，以及可选的时间桶 time 和分组 group
+        """
+        filter_key = tuple(sorted((field, tuple(values)) for field, values in (filters or {}).items()))
+        key = (resolution, bbox, time_bucket, group_by, filter_key, match)
+        cached = self._heatmap_cache.get(key)
+        if cached is not None:
+            self._heatmap_cache.move_to_end(key)
+            return cached
+
+        level = None
+        if not time_bucket and not group_by and not filters:
+            level = self._coarse_level(resolution)
+        if level is not None:
+            result = self._heatmap_from_level(level, resolution, bbox)
+        else:
+            result = self._heatmap_from_rows(resolution, bbox, time_bucket, group_by, filters, match)
+
+        self._heatmap_cache[key] = result
+        while len(self._heatmap_cache) > HEATMAP_CACHE_SIZE:
+            self._heatmap_cache.popitem(last=False)
+        return result
+
+    def _heatmap_from_level(self, level, resolution, bbox):
+        """把预统计的网格计数按块合并到目标分辨率，结果按网格编号排列"""
+        density = self._density[level]
+        cells = np.fromiter(density.keys(), dtype=np.int64, count=len(density))
+        counts = np.fromiter(density.values(), dtype=np.int64, count=len(density))
+        nx, _ = grid_shape(level)
+        target_nx, _ = grid_shape(resolution)
+        factor = int(round(resolution / level))
+        target = (cells // nx // factor) * target_nx + (cells % nx) // factor
+        target, inverse = np.unique(target, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(target)).astype(np.int64)
+        ix, iy = target % target_nx, target // target_nx
+        if bbox is not None:
+            x0, x1, y0, y1 = bbox_cells(bbox, resolution)
+            keep = (ix >= x0) & (ix <= x1) & (iy >= y0) & (iy <= y1)
+            ix, iy, counts = ix[keep], iy[keep], counts[keep]
+        return {
+            'source': 'precomputed',
+            'cells': {
+                'lon': cell_centers(ix, resolution, -180.0),
+                'lat': cell_centers(iy, resolution, -90.0),
+                'count': counts.tolist()
+            }
+        }
+
+    def _heatmap_from_rows(self, resolution, bbox, time_bucket, group_by, filters, match):
+        """在（筛选后的）数据上向量化分组计数"""
+        rows = self.filter_rows(filters, match) if filters else self.frame
+        nx, _ = grid_shape(resolution)
+        cells = grid_cells(rows['lon'].to_numpy(dtype='float64'), rows['lat'].to_numpy(dtype='float64'), resolution)
+        if bbox is not None:
+            # 按网格而不是按点筛选，使边缘网格的计数完整
+            x0, x1, y0, y1 = bbox_cells(bbox, resolution)
+            ix, iy = cells % nx, cells // nx
+            keep = (ix >= x0) & (ix <= x1) & (iy >= y0) & (iy <= y1)
+            rows, cells = rows[keep], cells[keep]
+
+        keys = {'cell': cells}
+        tz = None
+        if time_bucket:
+            if not self.time_is_datetime:
+                raise DatasetError('数据没有可用的时间字段，无法按时间分桶')
+            times = rows['postime']
+            tz = times.dt.tz
+            if tz is not None:
+                # 带时区的数据按数据自身时区的本地时间分桶，标签也带该时区，与数据摘要中的时间一致
+                times = times.dt.tz_localize(None)
+            keys['time'] = times.to_numpy().astype(HEATMAP_TIME_BUCKETS[time_bucket])
+        if group_by:
+            keys['group'] = rows[group_by].to_numpy()
+        grouped = pd.DataFrame(keys).groupby(list(keys), sort=True).size()
+
+        cells = grouped.index.get_level_values('cell').to_numpy() if len(keys) > 1 else grouped.index.to_numpy()
+        ix, iy = cells % nx, cells // nx
+        result = {
+            'source': 'computed',
+            'cells': {
+                'lon': cell_centers(ix, resolution, -180.0),
+                'lat': cell_centers(iy, resolution, -90.0),
+                'count': grouped.to_numpy().tolist()
+            }
+        }
+        if time_bucket:
+            times = grouped.index.get_level_values('time')
+            if tz is not None:
+                times = times.tz_localize(tz, ambiguous=np.zeros(len(times), dtype=bool), nonexistent='shift_forward')
+            result['cells']['time'] = [_time_to_iso(value) for value in times]
+        if group_by:
+            result['cells']['group'] = grouped.index.get_level_values('group').astype(str).tolist()
+        return result
+
+    def ship_frames(self, rows):
+        """
+        把一批数据拆分为按MMSI排序的各船轨迹，轨迹点取自按时间排序的存储，
+        带有读取时按整条轨迹计算的航行指标
+        """
+        frames = {}
+        for mmsi_id, ship_rows in rows.groupby('mmsi', sort=True):
+            mmsi_id = str(mmsi_id)
+            ship_data = self.ships[mmsi_id]
+            if len(ship_rows) < len(ship_data):
+                ship_data = ship_data[np.isin(ship_data[ROW_COLUMN].values, ship_rows[ROW_COLUMN].values)]
+            frames[mmsi_id] = ship_data
+        return frames
+
+    # ---------- 增量同步游标 ----------
+
+    @property
+    def cursor(self):
+        """当前游标：全量读取代号 + 已读取的原始行数"""
+        return f"{self.generation}.{self.raw_rows}"
+
+    def parse_cursor(self, cursor):
+        """
+        解析客户端游标，返回 (起始行号, 是否需要重新同步)
+        游标为空时从第0行开始；属于旧的全量读取时也从第0行开始并标记重新同步
+        """
+        if not cursor:
+            return 0, False
+        try:
+            generation, row = cursor.rsplit('.', 1)
+            row = int(row)
+        except ValueError:
+            raise DatasetError('游标格式不正确', cursor=cursor)
+        if generation != self.generation or row < 0 or row > self.raw_rows:
+            return 0, True
+        return row, False
+
+    def rows_since(self, start_row, ship_id=None, limit=None):
+        """
+        返回行号不小于 start_row 的数据，按行号顺序最多截取 limit 行
+        返回 (数据, 下一次请求的起始行号, 是否还有更多)
+        """
+        if ship_id is not None:
+            source = self.ships.get(ship_id)
+            if source is None:
+                return self.frame.iloc[0:0], self.raw_rows, False
+            source = source[source[ROW_COLUMN] >= start_row].sort_values(ROW_COLUMN)
+        else:
+            # 全部数据按读取顺序存放，行号有序，可以二分定位
+            frame = self.frame
+            position = np.searchsorted(frame[ROW_COLUMN].values, start_row, side='left')
+            source = frame.iloc[position:]
+
+        if limit is not None and len(source) > limit:
+            rows = source.iloc[:limit]
+            return rows, int(rows[ROW_COLUMN].iloc[-1]) + 1, True
+        return source, self.raw_rows, False
+
+    def group_by_ship(self, rows, cumulative=True):
+        """
+        把一批标准化数据按船只分组，结构与 ship_groups 一致，
+        cumulative 为True时 point_count 和 bounds 为该船只当前的累计值，否则按这批数据计算
+        """
+        groups = {}
+        for mmsi_id, ship_rows in self.ship_frames(rows).items():
+            groups[mmsi_id] = {
+                'point_count': self.ship_stats[mmsi_id]['point_count'] if cumulative else len(ship_rows),
+                'returned_points': len(ship_rows),
+                'data': point_records(ship_rows),
+                'bounds': self.ship_bounds(mmsi_id) if cumulative else frame_bounds(ship_rows),
+                'kinematics': self.ship_kinematics(mmsi_id)
+            }
+        return groups
+
+    # ---------- 分页 ----------
+
+    def _sorted_ship_keys(self, sort):
+        """按MMSI升序或点数降序排列的船只键列表，结果缓存到下次数据变化"""
+        keys = self._ship_order.get(sort)
+        if keys is None:
+            if sort == 'point_count':
+                keys = sorted((-stats['point_count'], mmsi_id) for mmsi_id, stats in self.ship_stats.items())
+            else:
+                keys = sorted(self.ships)
+            self._ship_order[sort] = keys
+        return keys
+
+    def ship_summary(self, mmsi_id):
+        """单个船只的元数据，不含轨迹点"""
+        stats = self.ship_stats[mmsi_id]
+        return {
+            'mmsi': mmsi_id,
+            'point_count': stats['point_count'],
+            'bounds': self.ship_bounds(mmsi_id),
+            'start_time': _time_to_iso(stats['start_time']),
+            'end_time': _time_to_iso(stats['end_time']),
+            'kinematics': self.ship_kinematics(mmsi_id)
+        }
+
+    def removed_rows(self):
+        """读取时去掉的重复行数和抽稀行数"""
+        return {'duplicates': self.duplicate_rows, 'thinned': self.thinned_rows}
+
+    def ship_kinematics(self, mmsi_id):
+        """单个船只整条轨迹的航行指标合计：距离、航次数、平均和最大对地航速(节)"""
+        return kinematics_summary(self.ship_stats[mmsi_id])
+
+    def track_slice(self, mmsi_id, start=None, end=None):
+        """
+        单个船只在 [start, end] 时间范围内的轨迹（start/end 为pd.Timestamp），直接二分切片按时间排序的存储
+        指定时间范围时不含时间无效的点；船只不存在时返回None
+        """
+        ship_data = self.ships.get(mmsi_id)
+        if ship_data is None or (start is None and end is None):
+            return ship_data
+        if not self.time_is_datetime:
+            return ship_data.iloc[0:0]
+        times = ship_data['postime'].values
+        valid_count = len(times) - int(np.isnat(times).sum())
+        valid_times = times[:valid_count]
+        # 带时区的列 .values 为UTC时间，边界也统一为UTC后比较
+        left = 0 if start is None else int(np.searchsorted(valid_times, naive_utc(start).to_datetime64(), side='left'))
+        right = (valid_count if end is None
+                 else int(np.searchsorted(valid_times, naive_utc(end).to_datetime64(), side='right')))
+        return ship_data.iloc[left:right]
+
+    def summary(self):
+        """
+        数据集摘要：各船只元数据和全局统计，不含轨迹点
+        由增量维护的船只统计汇总而成，结果缓存到下次数据变化
+        """
+        if self._summary is None:
+            ships = {mmsi_id: self.ship_summary(mmsi_id) for mmsi_id in sorted(self.ship_stats)}
+            global_bounds = None
+            if ships:
+                global_bounds = {
+                    'min_lon': min(ship['bounds']['min_lon'] for ship in ships.values()),
+                    'max_lon': max(ship['bounds']['max_lon'] for ship in ships.values()),
+                    'min_lat': min(ship['bounds']['min_lat'] for ship in ships.values()),
+                    'max_lat': max(ship['bounds']['max_lat'] for ship in ships.values())
+                }
+            global_time_range = None
+            if self.time_start is not None and self.time_end is not None:
+                global_time_range = {
+                    'start_time': _time_to_iso(self.time_start),
+                    'end_time': _time_to_iso(self.time_end)
+                }
+            self._summary = {
+                'ships': ships,
+                'total_rows': sum(ship['point_count'] for ship in ships.values()),
+                'total_ships': len(ships),
+                'total_distance_km': round(sum(stats['distance_km'] for stats in self.ship_stats.values()), 3),
+                'removed_rows': self.removed_rows(),
+                'global_bounds': global_bounds,
+                'global_time_range': global_time_range,
+                'is_sorted_by_time': self.time_is_datetime,
+                'time_format': self.time_format
+            }
+        return self._summary
+
+    # ---------- 事件检测 ----------
+
+    def track_arrays(self):
+        """
+        全部船只轨迹按MMSI顺序拼接（船内按时间排序），结果缓存到下次数据变化
+        返回 (MMSI列表, 拼接后的数据, 每条船第一个点的下标)
+        """
+        if self._tracks is None:
+            keys = self._sorted_ship_keys('mmsi')
+            frames = [self.ships[mmsi_id] for mmsi_id in keys]
+            counts = np.array([len(frame) for frame in frames], dtype=np.int64)
+            starts = np.cumsum(counts) - counts
+            tracks = pd.concat(frames, ignore_index=True) if frames else self.frame.iloc[0:0]
+            self._tracks = (keys, tracks, starts)
+        return self._tracks
+
+    def events(self, types=None, params=None, workers=None):
+        """
+        检测各船只的停泊、位置跳变和信号中断事件，只返回有事件的船只
+        返回 {MMSI: {'stops': [...], 'jumps': [...], 'gaps': [...]}}
+        """
+        if not self.time_is_datetime:
+            raise DatasetError('数据没有可用的时间字段，无法检测事件')
+        types = [event_type for event_type in EVENT_TYPES if event_type in (types or EVENT_TYPES)]
+        key = (tuple(types), tuple(sorted((params or {}).items())))
+        cached = self._events_cache.get(key)
+        if cached is not None:
+            self._events_cache.move_to_end(key)
+            return cached
+
+        keys, tracks, starts = self.track_arrays()
+        times = tracks['postime'].values
+        detected = detect_events(tracks['lon'].to_numpy(dtype='float64'), tracks['lat'].to_numpy(dtype='float64'),
+                                 time_seconds(times), starts, params=params, types=types, workers=workers)
+
+        result = {}
+        for event_type, records in _event_records(detected, times):
+            for ship, record in records:
+                ship_events = result.setdefault(keys[ship], {f'{name}s': [] for name in types})
+                ship_events[f'{event_type}s'].append(record)
+
+        self._events_cache[key] = result
+        while len(self._events_cache) > EVENTS_CACHE_SIZE:
+            self._events_cache.popitem(last=False)
+        return result
+
+    def viewport_points(self, min_lon, max_lon, min_lat, max_lat, limit=50000, filters=None, match='all'):
+        """
+        返回落在经纬度范围内的轨迹点，先用船只范围排除不相交的船只再逐船筛选
+        提供 filters 时只在筛选结果中查找
+        返回 (数据, 是否因超过limit被截断)
+        """
+        if filters:
+            rows = self.filter_rows(filters, match)
+            lon = rows['lon'].values
+            lat = rows['lat'].values
+            rows = rows[(lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)]
+            # 与不筛选时一致，按MMSI顺序截断
+            rows = rows.sort_values('mmsi', kind='mergesort')
+            return rows.iloc[:limit], len(rows) > limit
+
+        parts = []
+        remaining = limit
+        truncated = False
+        for mmsi_id in self._sorted_ship_keys('mmsi'):
+            stats = self.ship_stats[mmsi_id]
+            if (stats['max_lon'] < min_lon or stats['min_lon'] > max_lon
+                    or stats['max_lat'] < min_lat or stats['min_lat'] > max_lat):
+                continue
+            ship_data = self.ships[mmsi_id]
+            lon = ship_data['lon'].values
+            lat = ship_data['lat'].values
+            mask = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+            if not mask.any():
+                continue
+            if remaining == 0:
+                truncated = True
+                break
+            selected = ship_data[mask]
+            if len(selected) > remaining:
+                selected = selected.iloc[:remaining]
+                truncated = True
+            parts.append(selected)
+            remaining -= len(selected)
+        if not parts:
+            return self.frame.iloc[0:0], False
+        return pd.concat(parts), truncated
+
+    def ships_page(self, sort='mmsi', cursor=None, limit=100):
+        """
+        船只列表分页，游标记录上一页最后一个船只的排序键
+        返回 (船只元数据列表, 下一页游标或None)
+        """
+        if sort not in SHIP_SORT_KEYS:
+            raise DatasetError('不支持的排序方式', sort=sort, supported=SHIP_SORT_KEYS)
+        keys = self._sorted_ship_keys(sort)
+
+        start = 0
+        if cursor:
+            position = decode_page_cursor(cursor)
+            if sort == 'point_count':
+                try:
+                    position = (int(position[0]), str(position[1]))
+                except (TypeError, ValueError, IndexError, KeyError):
+                    raise DatasetError('分页游标格式不正确', cursor=cursor)
+            else:
+                position = str(position)
+            start = bisect.bisect_right(keys, position)
+
+        page_keys = keys[start:start + limit]
+        mmsi_ids = [key[1] for key in page_keys] if sort == 'point_count' else page_keys
+        next_cursor = None
+        if start + limit < len(keys):
+            last_key = page_keys[-1]
+            next_cursor = encode_page_cursor(list(last_key) if sort == 'point_count' else last_key)
+        return [self.ship_summary(mmsi_id) for mmsi_id in mmsi_ids], next_cursor
+
+    def point_cursor(self, ship_data, position):
+        """生成指向船只轨迹第 position 个点之后的游标"""
+        point = ship_data.iloc[position]
+        postime = point['postime']
+        if self.time_is_datetime and pd.notna(postime):
+            time_key = int(postime.value)
+        else:
+            time_key = None
+        return encode_page_cursor([time_key, int(point[ROW_COLUMN])])
+
+    def _point_start(self, ship_data, cursor):
+        """根据游标在按时间排序的轨迹中二分定位下一页的起始位置"""
+        try:
+            time_key, row = decode_page_cursor(cursor)
+            row = np.int64(row)
+            if time_key is not None:
+                time_key = np.datetime64(int(time_key), 'ns')
+        except (TypeError, ValueError, OverflowError):
+            raise DatasetError('分页游标格式不正确', cursor=cursor)
+        rows = ship_data[ROW_COLUMN].values
+
+        if not self.time_is_datetime:
+            # 没有时间字段时轨迹按读取顺序存放
+            return int(np.searchsorted(rows, row, side='right'))
+
+        times = ship_data['postime'].values
+        valid_count = int(ship_data['postime'].notna().sum())
+        if time_key is None:
+            # 无效时间排在最后，按行号排序
+            return valid_count + int(np.searchsorted(rows[valid_count:], row, side='right'))
+
+        left = int(np.searchsorted(times[:valid_count], time_key, side='left'))
+        right = int(np.searchsorted(times[:valid_count], time_key, side='right'))
+        return left + int(np.searchsorted(rows[left:right], row, side='right'))
+
+    def ship_points_page(self, mmsi_id, cursor=None, limit=5000):
+        """
+        单个船只轨迹点分页，直接切片按时间排序的存储
+        返回 (数据, 下一页游标或None)
+        """
+        ship_data = self.ships[mmsi_id]
+        start = self._point_start(ship_data, cursor) if cursor else 0
+        page = ship_data.iloc[start:start + limit]
+        next_cursor = None
+        if start + limit < len(ship_data):
+            next_cursor = self.point_cursor(ship_data, start + limit - 1)
+        return page, next_cursor
+
+    def ship_bounds(self, mmsi_id):
+        stats = self.ship_stats[mmsi_id]
+        return {
+            'min_lon': float(stats['min_lon']),
+            'max_lon': float(stats['max_lon']),
+            'min_lat': float(stats['min_lat']),
+            'max_lat': float(stats['max_lat'])
+        }
+
+
+def _event_records(detected, times):
+    """把列式的事件检测结果转换为 (事件类型, [(船只序号, 事件), ...])，时间取自轨迹点"""
+    def iso_times(index):
+        return np.datetime_as_string(times[index].astype('datetime64[s]'))
+
+    for event_type, columns in detected.items():
+        if event_type == 'stop':
+            frame = pd.DataFrame({
+                'start_time': iso_times(columns['start']),
+                'end_time': iso_times(columns['end']),
+                'duration_s': columns['duration_s'],
+                'lon': np.round(columns['lon'], 6),
+                'lat': np.round(columns['lat'], 6),
+                'radius_km': np.round(columns['radius_km'], 4),
+                'points': columns['points']
+            })
+        elif event_type == 'jump':
+            speed = np.round(columns['speed_kn'], 2)
+            frame = pd.DataFrame({
+                'time': iso_times(columns['index']),
+                'from_lon': columns['from_lon'],
+                'from_lat': columns['from_lat'],
+                'to_lon': columns['to_lon'],
+                'to_lat': columns['to_lat'],
+                'distance_km': np.round(columns['distance_km'], 4),
+                # 同一时间位置不同时航速为无穷大，输出为None
+                'speed_kn': pd.Series(speed, dtype=object).where(np.isfinite(speed), None)
+            })
+        else:
+            frame = pd.DataFrame({
+                'start_time': iso_times(columns['index'] - 1),
+                'end_time': iso_times(columns['index']),
+                'duration_s': columns['duration_s'],
+                'distance_km': np.round(columns['distance_km'], 4)
+            })
+        yield event_type, zip(columns['ship'].tolist(), frame.to_dict('records'))
+
+
+def grid_shape(resolution):
+    """全球网格的 (经度格数, 纬度格数)"""
+    return int(np.ceil(360.0 / resolution - 1e-9)), int(np.ceil(180.0 / resolution - 1e-9))
+
+
+def grid_cells(lon, lat, resolution):
+    """点所在网格的展开编号 纬度格*经度格数+经度格，经度180和纬度90归入最后一格"""
+    nx, ny = grid_shape(resolution)
+    ix = np.minimum(np.floor((lon + 180.0) / resolution).astype(np.int64), nx - 1)
+    iy = np.minimum(np.floor((lat + 90.0) / resolution).astype(np.int64), ny - 1)
+    return iy * nx + ix
+
+
+def bbox_cells(bbox, resolution):
+    """与经纬度范围相交的网格编号范围 (经度起, 经度止, 纬度起, 纬度止)，均含端点"""
+    min_lon, max_lon, min_lat, max_lat = bbox
+    nx, ny = grid_shape(resolution)
+    x0 = max(int(np.floor((min_lon + 180.0) / resolution)), 0)
+    x1 = min(int(np.floor((max_lon + 180.0) / resolution)), nx - 1)
+    y0 = max(int(np.floor((min_lat + 90.0) / resolution)), 0)
+    y1 = min(int(np.floor((max_lat + 90.0) / resolution)), ny - 1)
+    return x0, x1, y0, y1
+
+
+def cell_centers(index, resolution, origin):
+    """网格编号对应的中心坐标，保留到分辨率以下两位小数"""
+    digits = max(int(np.ceil(-np.log10(resolution))), 0) + 2
+    return np.round(origin + (np.asarray(index) + 0.5) * resolution, digits).tolist()
+
+
+def kinematics_summary(stats):
+    """由距离、航行时间、最大航速和航次数合计得到对外输出的航行指标"""
+    distance_nm = stats['distance_km'] / KM_PER_NAUTICAL_MILE
+    hours = stats['moving_seconds'] / 3600.0
+    return {
+        'distance_km': round(stats['distance_km'], 3),
+        'distance_nm': round(distance_nm, 3),
+        'voyage_count': stats['voyage_count'],
+        'moving_hours': round(hours, 3),
+        'avg_sog': round(distance_nm / hours, 2) if hours > 0 else None,
+        'max_sog': round(stats['max_sog'], 2) if not np.isnan(stats['max_sog']) else None
+    }
+
+
+def merge_tracks(parts):
+    """
+    把来自多个数据集、各自按时间排序的同一船只轨迹 [(文件名, 轨迹), ...] 合并为一条按时间排序的轨迹
+    拼接后做稳定排序，timsort 识别出已有序的各段后只做k路归并；时间相同的点保持数据集顺序，
+    完全重复（时间和位置都相同）的点只保留第一个；合并后整条重算航行指标
+    返回 (合并后的轨迹, 各数据集贡献的点数, 航行指标合计)
+    """
+    parts = [(filename, track) for filename, track in parts if track is not None and len(track) > 0]
+    sources = {filename: len(track) for filename, track in parts}
+    if not parts:
+        return None, sources, None
+    if len(parts) == 1:
+        merged = parts[0][1]
+    else:
+        tracks = [track for _, track in parts]
+        if len({str(track['postime'].dtype) for track in tracks}) > 1:
+            # 各文件时区不一致（或部分不带时区）时统一为UTC并去掉时区，否则拼接后成为object列无法排序
+            tracks = [_naive_utc_times(track) for track in tracks]
+        merged = pd.concat(tracks, ignore_index=True)
+        times = merged['postime'].values
+        if np.issubdtype(times.dtype, np.datetime64):
+            keys = times.astype('datetime64[ns]').view(np.int64).copy()
+            keys[np.isnat(times)] = np.iinfo(np.int64).max
+            merged = merged.iloc[np.argsort(keys, kind='stable')]
+            valid = merged['postime'].notna().values
+            merged = merged[~(valid & merged.duplicated(['postime', 'lon', 'lat']).values)]
+    merged, totals = _with_kinematics(merged)
+    return merged, sources, totals
+
+
+def frame_memory(frame):
+    """
+    DataFrame占用的内存：数值列按数组大小，字符串列按指针加上各不同字符串对象的大小
+    （同一取值在读取时共用同一个对象，memory_usage(deep=True) 会按行重复计算）
+    """
+    total = int(frame.index.memory_usage())
+    for column in frame.columns:
+        values = frame[column].values
+        if values.dtype == object:
+            total += values.nbytes + sum(sys.getsizeof(value) for value in pd.unique(values))
+        else:
+            total += int(frame[column].memory_usage(index=False, deep=True))
+    return total
+
+
+def naive_utc(timestamp):
+    """带时区的时间转换为UTC后去掉时区，与时间列 .values 中的值一致；不带时区的原样返回"""
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.tz_convert(None)
+    return timestamp
+
+
+def _naive_utc_times(track):
+    if isinstance(track['postime'].dtype, pd.DatetimeTZDtype):
+        return track.assign(postime=track['postime'].dt.tz_convert(None))
+    return track
+
+
+def _point_keys(rows):
+    """判断完全重复时比较的 (时间纳秒数, 经度, 纬度) 三列"""
+    return (rows['postime'].values.view(np.int64), rows['lon'].to_numpy(dtype='float64'),
+            rows['lat'].to_numpy(dtype='float64'))
+
+
+def downsample_positions(count, max_points):
+    """从 count 个点中均匀选出不超过 max_points 个点的位置，保留首尾两点"""
+    if count <= max_points:
+        return np.arange(count)
+    return np.unique(np.linspace(0, count - 1, max_points).round().astype(np.int64))
+
+
+def frame_bounds(rows):
+    """一批数据的经纬度范围"""
+    return {
+        'min_lon': float(rows['lon'].min()),
+        'max_lon': float(rows['lon'].max()),
+        'min_lat': float(rows['lat'].min()),
+        'max_lat': float(rows['lat'].max())
+    }
+
+
+class DatasetStore:
+    """按文件名缓存数据集，读取时自动检查文件是否有追加或修改"""
+
+    def __init__(self, cache_dir=None, thin_seconds=0, thin_meters=0, max_datasets=0, max_bytes=0):
+        self._lock = threading.Lock()
+        # 按最近一次获取的顺序排列，超过 max_datasets 个或合计超过 max_bytes 字节时丢弃最久未用的，为0时不限制
+        self._datasets = OrderedDict()
+        self.max_datasets = max_datasets
+        self.max_bytes = max_bytes
+        self._listeners = []
+        # Excel转换结果的缓存目录，为None时不缓存
+        self.cache_dir = cache_dir
+        # 读取时的抽稀参数，见 Dataset
+        self.thin_seconds = thin_seconds
+        self.thin_meters = thin_meters
+        # 最近读取的文件名 -> 读取时间，按时间从旧到新排列；首次使用时才从磁盘读取，创建存储时不做任何IO
+        self._recent_entries = None
+        self._recent_dirty = False
+        self._recent_saved = 0.0
+        # 文件名 -> [文件大小, 修改时间, 最早时间, 最晚时间]，同样在首次使用时读取
+        self._span_entries = None
+
+    def cache_path(self, filename):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, filename + CACHE_SUFFIX)
+
+    def _record_path(self, name):
+        return os.path.join(self.cache_dir, name) if self.cache_dir else None
+
+    @property
+    def _recent(self):
+        """在 self._lock 内使用"""
+        if self._recent_entries is None:
+            self._recent_entries = self._load_recent()
+        return self._recent_entries
+
+    @property
+    def _spans(self):
+        """在 self._lock 内使用"""
+        if self._span_entries is None:
+            self._span_entries = self._load_spans()
+        return self._span_entries
+
+    def _load_record(self, name, description, convert, default):
+        path = self._record_path(name)
+        if path is None or not os.path.exists(path):
+            return default
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return convert(json.load(f))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning("读取%s %s 失败: %s", description, path, e)
+            return default
+
+    def _save_record(self, name, description, entries):
+        """在 self._lock 内调用，先写临时文件再替换"""
+        path = self._record_path(name)
+        if path is None:
+            return
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning("写入%s %s 失败: %s", description, path, e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def _load_recent(self):
+        return self._load_record(
+            RECENT_FILENAME, '最近使用记录',
+            lambda entries: OrderedDict(sorted(((str(name), float(used)) for name, used in entries.items()),
+                                               key=itemgetter(1))),
+            OrderedDict())
+
+    def _save_recent(self):
+        self._save_record(RECENT_FILENAME, '最近使用记录', self._recent)
+        self._recent_dirty = False
+        self._recent_saved = time.time()
+
+    def _load_spans(self):
+        return self._load_record(
+            SPANS_FILENAME, '时间范围记录',
+            lambda entries: {str(name): list(entry) for name, entry in entries.items() if len(entry) == 4},
+            {})
+
+    def _record_span(self, dataset):
+        """在数据集锁内、读取到新数据后调用，记录文件当前的大小、修改时间和数据时间范围"""
+        def text(value):
+            return naive_utc(value).isoformat() if value is not None else None
+        entry = [dataset.file_size, dataset.file_mtime, text(dataset.time_start), text(dataset.time_end)]
+        with self._lock:
+            if self._spans.get(dataset.filename) != entry:
+                self._spans[dataset.filename] = entry
+                self._save_record(SPANS_FILENAME, '时间范围记录', self._spans)
+
+    def time_span(self, filename, filepath):
+        """
+        不读取数据，返回文件上次读取时记录的 (最早时间, 最晚时间)，为不含时区的UTC时间，没有有效时间时为None
+        没有记录或文件此后有变化时返回None，需要读取文件才能确定
+        """
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        with self._lock:
+            entry = self._spans.get(filename)
+        if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime:
+            return None
+        return tuple(pd.Timestamp(value) if value is not None else None for value in entry[2:])
+
+    def _touch_recent(self, filename):
+        """
+        每次读取成功后移到最近的位置；新记录的文件立即写盘，
+        已记录的文件只是顺序变化时最多每隔 RECENT_SAVE_SECONDS 秒写一次，避免每个请求都写磁盘
+        """
+        now = time.time()
+        with self._lock:
+            known = filename in self._recent
+            if not known or next(reversed(self._recent)) != filename:
+                self._recent.pop(filename, None)
+                self._recent_dirty = True
+            self._recent[filename] = now
+            while len(self._recent) > RECENT_LIMIT:
+                self._recent.popitem(last=False)
+            if self._recent_dirty and (not known or now - self._recent_saved >= RECENT_SAVE_SECONDS):
+                self._save_recent()
+
+    def recent_files(self, limit=None):
+        """最近读取过的文件名，最近的在前"""
+        with self._lock:
+            names = list(reversed(self._recent))
+        return names if limit is None else names[:limit]
+
+    def add_listener(self, callback):
+        """
+        注册数据变化回调 callback(dataset, new_rows)
+        每次读取到新数据后在数据集锁内调用一次，dataset.last_ingest 表示读取方式
+        """
+        self._listeners.append(callback)
+
+    def get(self, filename, filepath):
+        """获取最新的数据集，必要时增量或全量读取文件"""
+        with self._lock:
+            dataset = self._datasets.get(filename)
+            if dataset is None or dataset.filepath != filepath:
+                dataset = Dataset(filename, filepath, cache_path=self.cache_path(filename),
+                                  thin_seconds=self.thin_seconds, thin_meters=self.thin_meters)
+                self._datasets[filename] = dataset
+            self._datasets.move_to_end(filename)
+
+        with dataset.lock:
+            try:
+                new_rows = dataset.refresh()
+            except Exception:
+                # 读取失败时丢弃缓存，下次请求重新全量读取
+                with self._lock:
+                    if self._datasets.get(filename) is dataset:
+                        del self._datasets[filename]
+                raise
+
+            self._touch_recent(filename)
+            if new_rows is not None:
+                self._record_span(dataset)
+                self._evict(filename)
+            registry.inc('ship_dataset_cache_total', result=dataset.last_ingest if new_rows is not None else 'hit')
+            if new_rows is not None:
+                for callback in self._listeners:
+                    try:
+                        callback(dataset, new_rows)
+                    except Exception as e:
+                        logger.warning("数据变化回调执行失败: %s", e)
+        return dataset
+
+    def _evict(self, keep):
+        """超出数量或内存上限时从最久未用的开始丢弃，刚获取的数据集 keep 总是保留"""
+        with self._lock:
+            total = sum(dataset.memory_bytes for dataset in self._datasets.values())
+            for filename in list(self._datasets):
+                over_count = self.max_datasets and len(self._datasets) > self.max_datasets
+                over_bytes = self.max_bytes and total > self.max_bytes
+                if not over_count and not over_bytes:
+                    break
+                if filename == keep:
+                    continue
+                dataset = self._datasets.pop(filename)
+                total -= dataset.memory_bytes
+                registry.inc('ship_dataset_evictions_total', reason='count' if over_count else 'bytes')
+                logger.info("数据集缓存超出上限，丢弃最久未用的 %s", filename)
+
+    def stats(self):
+        """已缓存数据集的数量、行数、船只数和数据占用内存（不含字符串内容）"""
+        with self._lock:
+            datasets = list(self._datasets.values())
+        result = {'datasets': 0, 'rows': 0, 'ships': 0, 'bytes': 0, 'loading': 0}
+        for dataset in datasets:
+            # 正在读取的数据集不等待，只计数，避免健康检查和指标输出被长时间的读取阻塞
+            if not dataset.lock.acquire(blocking=False):
+                result['loading'] += 1
+                continue
+            try:
+                if not dataset.loaded:
+                    continue
+                frame = dataset.frame
+                result['datasets'] += 1
+                result['rows'] += len(frame)
+                result['ships'] += len(dataset.ships)
+                result['bytes'] += int(frame.memory_usage(index=True, deep=False).sum())
+            finally:
+                dataset.lock.release()
+        return result
+
+    def discard(self, filename):
+        with self._lock:
+            self._datasets.pop(filename, None)
+            if self._recent.pop(filename, None) is not None:
+                self._save_recent()
+            if self._spans.pop(filename, None) is not None:
+                self._save_record(SPANS_FILENAME, '时间范围记录', self._spans)
+
+    def clear(self, remove_cache=False):
+        """清空内存中的数据集，remove_cache 为True时同时删除磁盘上的转换缓存和最近使用记录"""
+        with self._lock:
+            self._datasets.clear()
+            if remove_cache and self._recent:
+                self._recent.clear()
+                self._save_recent()
+            if remove_cache and self._spans:
+                self._spans.clear()
+                self._save_record(SPANS_FILENAME, '时间范围记录', self._spans)
+        if remove_cache and self.cache_dir and os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(CACHE_SUFFIX):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError as e:
+                        logger.warning("删除缓存 %s 失败: %s", name, e)
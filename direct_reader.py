@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地文件直接读取
+对允许目录中的CSV/TXT文件做内存映射，建立一次行偏移索引并缓存，
+按行范围只解析需要的字节，无需把大文件复制到上传目录
+"""
+
+import io
+import os
+import mmap
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from column_mapping import resolve_mapping, read_csv_mapped
+
+logger = logging.getLogger('ship-direct-reader')
+
+# 建立行索引时每次扫描的字节数
+SCAN_CHUNK_BYTES = 64 * 1024 * 1024
+
+# 用于判断文件是否只是追加写入的头部指纹长度
+HEAD_DIGEST_BYTES = 64 * 1024
+
+# 内存映射读取支持的编码（换行符为单字节），utf-16文件需要整体读取
+DIRECT_ENCODINGS = ['utf-8-sig', 'utf-8', 'gbk', 'latin-1']
+
+UTF16_BOMS = (b'\xff\xfe', b'\xfe\xff')
+
+
+class DirectReadError(Exception):
+    """直接读取失败时抛出，携带返回给客户端的错误信息和状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+    def to_dict(self):
+        return {'error': self.message}
+
+
+def scan_line_starts(buffer, start, end):
+    """返回 [start, end) 范围内每个换行符之后的偏移"""
+    results = []
+    position = start
+    while position < end:
+        count = min(SCAN_CHUNK_BYTES, end - position)
+        chunk = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=position)
+        results.append(np.flatnonzero(chunk == 10) + (position + 1))
+        # 释放对内存映射的引用，否则映射无法关闭
+        del chunk
+        position += count
+    if not results:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate(results).astype(np.int64)
+
+
+class LineIndex:
+    """
+    文件的行偏移索引
+    starts[i] 为第i行（第0行是表头）的起始偏移，starts[-1] 为最后一个完整行的结束位置
+    """
+
+    def __init__(self, size, mtime_ns, head_digest, starts):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.head_digest = head_digest
+        self.starts = starts
+
+    @property
+    def line_count(self):
+        return len(self.starts) - 1
+
+    @property
+    def row_count(self):
+        """数据行数（不含表头）"""
+        return max(self.line_count - 1, 0)
+
+
+class DirectFileReader:
+    """只读取允许目录中的文件，行偏移索引按 文件路径 缓存，文件追加后只扫描新增部分"""
+
+    def __init__(self, allowed_dirs, max_indexes=16):
+        self.allowed_dirs = [os.path.realpath(path) for path in allowed_dirs if path]
+        self.max_indexes = max_indexes
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+
+    @property
+    def enabled(self):
+        return bool(self.allowed_dirs)
+
+    def resolve(self, file_path):
+        """返回文件的真实路径，不在允许目录中时抛出DirectReadError"""
+        real_path = os.path.realpath(file_path)
+        for allowed in self.allowed_dirs:
+            if os.path.commonpath([real_path, allowed]) == allowed:
+                return real_path
+        raise DirectReadError('文件不在允许读取的目录中', 403)
+
+    def _head_digest(self, mm, size):
+        return hashlib.md5(mm[:min(size, HEAD_DIGEST_BYTES)]).hexdigest()
+
+    def _line_index(self, real_path, mm, stat):
+        """获取行索引：文件未变化时直接使用缓存，只追加时扫描新增部分，否则重建"""
+        with self._lock:
+            cached = self._indexes.get(real_path)
+            if cached is not None:
+                self._indexes.move_to_end(real_path)
+        if cached is not None and cached.size == stat.st_size and cached.mtime_ns == stat.st_mtime_ns:
+            return cached
+
+        head_digest = self._head_digest(mm, stat.st_size)
+        if cached is not None and stat.st_size > cached.size and head_digest == cached.head_digest:
+            scan_from = int(cached.starts[-1])
+            starts = np.concatenate([cached.starts, scan_line_starts(mm, scan_from, stat.st_size)])
+            logger.debug("文件 %s 追加了 %d 字节，只扫描新增部分", real_path, stat.st_size - cached.size)
+        else:
+            starts = np.concatenate([np.zeros(1, dtype=np.int64), scan_line_starts(mm, 0, stat.st_size)])
+            logger.debug("建立文件 %s 的行索引", real_path)
+
+        # 缓存只保留以换行结尾的部分，追加时从这里继续扫描；
+        # 文件末尾没有换行时，本次读取把最后一行也视为完整行
+        cached_index = LineIndex(stat.st_size, stat.st_mtime_ns, head_digest, starts)
+        if starts[-1] < stat.st_size:
+            starts = np.append(starts, np.int64(stat.st_size))
+        index = LineIndex(stat.st_size, stat.st_mtime_ns, head_digest, starts)
+        with self._lock:
+            self._indexes[real_path] = cached_index
+            self._indexes.move_to_end(real_path)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return index
+
+    def read(self, file_path, start_row=0, max_rows=None):
+        """
+        读取第 start_row 行起最多 max_rows 行数据（行号不含表头）
+        返回 (DataFrame, 字段映射, 文件信息)；utf-16文件无法按字节切分，返回None由调用方整体读取
+        """
+        if max_rows is not None and max_rows <= 0:
+            raise DirectReadError('max_rows必须是正整数')
+        real_path = self.resolve(file_path)
+        stat = os.stat(real_path)
+        if stat.st_size == 0:
+            raise DirectReadError('文件为空')
+
+        with open(real_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:2] in UTF16_BOMS:
+                return None
+            index = self._line_index(real_path, mm, stat)
+            if index.line_count < 1:
+                raise DirectReadError('文件为空')
+
+            start_row = min(max(start_row, 0), index.row_count)
+            end_row = index.row_count if max_rows is None else min(index.row_count, start_row + max_rows)
+            header = mm[int(index.starts[0]):int(index.starts[1])]
+            # 只复制需要的行
+            body = mm[int(index.starts[1 + start_row]):int(index.starts[1 + end_row])]
+
+        if not header.endswith(b'\n'):
+            header += b'\n'
+        df, encoding, columns, mapping = self._parse(header, body)
+        info = {
+            'path': file_path,
+            'encoding': encoding,
+            'columns': columns,
+            'rows': len(df),
+            'total_rows': index.row_count,
+            'start_row': start_row,
+            'next_row': end_row if end_row < index.row_count else None,
+            'mode': 'mmap'
+        }
+        return df, mapping, info
+
+    def _parse(self, header, body):
+        """按编码顺序解析表头，能找到经纬度字段时只解析需要的列"""
+        fallback = None
+        for encoding in DIRECT_ENCODINGS:
+            try:
+                columns = list(pd.read_csv(io.BytesIO(header), encoding=encoding, nrows=0).columns)
+                mapping = resolve_mapping(columns)
+                if not mapping.has_coordinates:
+                    fallback = fallback or columns
+                    continue
+                df = read_csv_mapped(io.BytesIO(header + body), encoding, mapping)
+                return df, encoding, columns, mapping
+            except UnicodeDecodeError:
+                continue
+            except pd.errors.EmptyDataError:
+                raise DirectReadError('文件为空')
+        if fallback is not None:
+            raise DirectReadError(f"CSV文件缺少必要的坐标列，可用列: {fallback}")
+        raise DirectReadError('无法解析CSV文件，尝试了多种编码')
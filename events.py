@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+航行事件检测
+在按船只、时间排序后拼接的全部轨迹数组上一次性向量化检测停泊/靠港、
+位置跳变（相邻两点之间不可能达到的航速）和AIS信号中断；
+数据量较大时可按船只切分到进程池并行计算
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from lazy_imports import lazy_import
+from kinematics import KM_PER_NAUTICAL_MILE, haversine_km
+
+np = lazy_import('numpy', globals(), 'np')
+
+logger = logging.getLogger('ship-events')
+
+# 支持的事件类型
+EVENT_TYPES = ['stop', 'jump', 'gap']
+
+# 默认检测参数：
+# stop_speed 停泊航速上限(节)，按 STOP_WINDOW_SECONDS 时间窗口内的位移计算，避免定位抖动的影响；
+# stop_seconds 最短停泊时间(秒)，stop_radius_km 停泊点偏离中心的最大距离(km)
+# jump_speed 视为位置跳变的航速(节)，jump_min_km 跳变的最小距离(km)，用于忽略定位抖动
+# gap_seconds 视为信号中断的相邻报告间隔(秒)
+DEFAULT_EVENT_PARAMS = {
+    'stop_speed': 1.0,
+    'stop_seconds': 1800.0,
+    'stop_radius_km': 1.0,
+    'jump_speed': 50.0,
+    'jump_min_km': 1.0,
+    'gap_seconds': 3600.0,
+}
+
+# 判断是否静止时比较的时间窗口(秒)：每个点与窗口结束处的点之间的平均航速低于 stop_speed 即视为静止
+STOP_WINDOW_SECONDS = 600.0
+
+# 各事件结果中表示点下标的字段，按船只切分并行计算后需要加上分片的起始位置
+INDEX_FIELDS = {'stop': ['start', 'end'], 'jump': ['index'], 'gap': ['index']}
+
+# 并行计算的进程数，0或1时在当前进程计算；点数少于 PARALLEL_MIN_POINTS 时也不拆分
+EVENT_WORKERS = int(os.environ.get('EVENT_WORKERS', '0') or 0)
+PARALLEL_MIN_POINTS = 500000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor(workers):
+    """
+    进程池在首次使用时创建并复用；使用spawn避免在多线程的服务进程中fork
+    子进程只需要本模块（detect_chunk 及其依赖都没有导入时的副作用），但spawn会以 __mp_main__
+    重新导入启动脚本，因此启动脚本的后台任务（如启动预热）只能在 __main__ 分支中启动
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _segments(lon, lat, seconds, starts):
+    """每个点与船内上一点的距离(km)和时间间隔(秒)，每条船第一个点没有上一点"""
+    first = np.zeros(len(lon), dtype=bool)
+    first[starts] = True
+    prev_lon = np.roll(lon, 1)
+    prev_lat = np.roll(lat, 1)
+    distance = haversine_km(prev_lon, prev_lat, lon, lat)
+    distance[first] = 0.0
+    dt = seconds - np.roll(seconds, 1)
+    dt[first] = np.nan
+    return first, distance, dt
+
+
+def _run_points(first_point, lengths):
+    """把若干 [起点, 起点+长度) 的点区间展开为下标数组"""
+    total = int(lengths.sum())
+    offsets = np.cumsum(lengths) - lengths
+    return np.arange(total) - np.repeat(offsets - first_point, lengths)
+
+
+def _window_ends(seconds, starts, window):
+    """每个点所在船内第一个时间不早于 该点时间+window 的点，没有时取船内最后一个点"""
+    count = len(seconds)
+    counts = np.diff(np.append(starts, count))
+    ship = np.repeat(np.arange(len(starts)), counts)
+    ship_end = np.repeat(starts + counts - 1, counts)
+    # 船只序号作为高位拼成整体递增的键，缺失的时间排在船内最后
+    relative = seconds - np.nanmin(seconds)
+    span = np.nanmax(relative) + 2 * window + 2
+    keys = ship * span + np.where(np.isnan(relative), span - 1, relative)
+    return np.minimum(np.searchsorted(keys, keys + window, side='left'), ship_end)
+
+
+def _detect_stops(lon, lat, seconds, starts, first, params):
+    """在时间窗口内几乎没有位移的点连成的一段轨迹，停留足够久且都在中心附近时视为一次停泊"""
+    count = len(lon)
+    if count == 0 or np.isnan(seconds).all():
+        first_point = last_point = np.zeros(0, dtype=np.int64)
+    else:
+        ends = _window_ends(seconds, starts, STOP_WINDOW_SECONDS)
+        index = np.arange(count)
+        elapsed = seconds[ends] - seconds
+        displacement = haversine_km(lon, lat, lon[ends], lat[ends])
+        slow = (ends > index) & (elapsed > 0) & (displacement / KM_PER_NAUTICAL_MILE / (elapsed / 3600.0)
+                                                < params['stop_speed'])
+        # 低速窗口覆盖的点都视为静止：在窗口起点+1、终点之后-1，累加后大于0
+        marks = (np.bincount(index[slow], minlength=count + 1)
+                 - np.bincount(ends[slow] + 1, minlength=count + 1))
+        still = np.cumsum(marks[:-1]) > 0
+        last = np.zeros(count, dtype=bool)
+        last[np.append(starts[1:], count) - 1] = True
+        first_point = np.flatnonzero(still & (first | ~np.roll(still, 1)))
+        last_point = np.flatnonzero(still & (last | ~np.roll(still, -1)))
+    keep = seconds[last_point] - seconds[first_point] >= params['stop_seconds']
+    first_point, last_point = first_point[keep], last_point[keep]
+
+    lengths = last_point - first_point + 1
+    if len(lengths) == 0:
+        center_lon = center_lat = radius = np.zeros(0)
+    else:
+        points = _run_points(first_point, lengths)
+        offsets = np.cumsum(lengths) - lengths
+        center_lon = np.add.reduceat(lon[points], offsets) / lengths
+        center_lat = np.add.reduceat(lat[points], offsets) / lengths
+        spread = haversine_km(lon[points], lat[points],
+                              np.repeat(center_lon, lengths), np.repeat(center_lat, lengths))
+        radius = np.maximum.reduceat(spread, offsets)
+    keep = radius <= params['stop_radius_km']
+    return {
+        'start': first_point[keep],
+        'end': last_point[keep],
+        'duration_s': (seconds[last_point] - seconds[first_point])[keep],
+        'lon': center_lon[keep],
+        'lat': center_lat[keep],
+        'radius_km': radius[keep],
+        'points': lengths[keep],
+    }
+
+
+def _detect_jumps(lon, lat, first, distance, speed, dt, params):
+    """相邻两点的航速超过上限（或同一时间位置不同）且距离足够大时视为位置跳变"""
+    mask = (~first & ~np.isnan(dt) & (distance >= params['jump_min_km'])
+            & ((dt == 0) | (speed > params['jump_speed'])))
+    index = np.flatnonzero(mask)
+    return {
+        'index': index,
+        'from_lon': lon[index - 1],
+        'from_lat': lat[index - 1],
+        'to_lon': lon[index],
+        'to_lat': lat[index],
+        'distance_km': distance[index],
+        'speed_kn': speed[index],
+    }
+
+
+def _detect_gaps(first, distance, dt, params):
+    """相邻两次报告间隔超过阈值视为信号中断"""
+    index = np.flatnonzero(~first & (dt > params['gap_seconds']))
+    return {
+        'index': index,
+        'duration_s': dt[index],
+        'distance_km': distance[index],
+    }
+
+
+def detect_chunk(lon, lat, seconds, starts, params, types):
+    """在一段按船只、时间排序的轨迹上检测事件，下标相对于本段"""
+    first, distance, dt = _segments(lon, lat, seconds, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speed = distance / KM_PER_NAUTICAL_MILE / (dt / 3600.0)
+        results = {}
+        if 'stop' in types:
+            results['stop'] = _detect_stops(lon, lat, seconds, starts, first, params)
+        if 'jump' in types:
+            results['jump'] = _detect_jumps(lon, lat, first, distance, speed, dt, params)
+        if 'gap' in types:
+            results['gap'] = _detect_gaps(first, distance, dt, params)
+    return results
+
+
+def _discard_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def _detect_parallel(lon, lat, seconds, starts, params, types, workers):
+    """按船只边界切分后在进程池中计算，再把各段结果的点下标换算回整体位置"""
+    count = len(lon)
+    bounds = _split_points(starts, count, workers)
+    executor = _get_executor(workers)
+    futures = []
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        local_starts = starts[(starts >= begin) & (starts < end)] - begin
+        futures.append(executor.submit(detect_chunk, lon[begin:end], lat[begin:end], seconds[begin:end],
+                                       local_starts, params, types))
+    parts = [future.result() for future in futures]
+
+    results = {}
+    for event_type in types:
+        for field in INDEX_FIELDS[event_type]:
+            for begin, part in zip(bounds[:-1], parts):
+                part[event_type][field] = part[event_type][field] + begin
+        results[event_type] = {
+            field: np.concatenate([part[event_type][field] for part in parts])
+            for field in parts[0][event_type]
+        }
+    return results
+
+
+def _split_points(starts, count, parts):
+    """按点数把轨迹切分为大致相等的若干段，切分点都在船只边界上"""
+    targets = np.linspace(0, count, parts + 1)[1:-1]
+    bounds = starts[np.minimum(np.searchsorted(starts, targets), len(starts) - 1)]
+    return np.unique(np.concatenate(([0], bounds, [count])))
+
+
+def detect_events(lon, lat, seconds, starts, params=None, types=None, workers=None):
+    """
+    lon/lat/seconds 为按船只、时间排序后拼接的数组（时间为秒数，缺失为NaN），
+    starts 为每条船第一个点的下标；返回 {事件类型: {字段: 数组}}，
+    每个事件带有所属船只的序号 ship，点下标均为在拼接数组中的位置
+    """
+    params = dict(DEFAULT_EVENT_PARAMS, **(params or {}))
+    types = list(types or EVENT_TYPES)
+    workers = EVENT_WORKERS if workers is None else workers
+    starts = np.asarray(starts, dtype=np.int64)
+    count = len(lon)
+
+    results = None
+    if workers > 1 and count >= PARALLEL_MIN_POINTS and len(starts) > 1:
+        try:
+            results = _detect_parallel(lon, lat, seconds, starts, params, types, workers)
+        except BrokenProcessPool as e:
+            # 子进程异常退出时丢弃进程池，本次在当前进程计算
+            logger.warning("事件检测进程池不可用，改为在当前进程计算: %s", e)
+            _discard_executor()
+    if results is None:
+        results = detect_chunk(lon, lat, seconds, starts, params, types)
+
+    for event_type, columns in results.items():
+        anchor = columns[INDEX_FIELDS[event_type][0]]
+        columns['ship'] = np.searchsorted(starts, anchor, side='right') - 1
+    return results
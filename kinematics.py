@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+航行指标计算
+对按船只、时间排序后拼接的轨迹数组一次性向量化计算每个点相对上一点的
+大圆距离、对地航速和航向，并在长时间没有报告的位置切分航次
+"""
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy', globals(), 'np')
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_NAUTICAL_MILE = 1.852
+
+# 相邻两点的时间间隔超过该值(秒)时视为新航次
+VOYAGE_GAP_SECONDS = 6 * 3600
+
+# 计算结果在轨迹存储中的列：与上一点的距离(km)、对地航速(节)、航向(度)、航次序号
+KINEMATIC_COLUMNS = ['segment_km', 'sog', 'cog', 'voyage']
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    """两点之间的大圆距离(km)"""
+    lon1, lat1, lon2, lat2 = (np.radians(value) for value in (lon1, lat1, lon2, lat2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def initial_bearing(lon1, lat1, lon2, lat2):
+    """从点1指向点2的初始方位角，正北为0，顺时针0~360度"""
+    lon1, lat1, lon2, lat2 = (np.radians(value) for value in (lon1, lat1, lon2, lat2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+
+def empty_seed(ship_count):
+    """没有已有数据可接续时的起点：坐标和时间为NaN，航次为-1"""
+    return {
+        'lon': np.full(ship_count, np.nan),
+        'lat': np.full(ship_count, np.nan),
+        'seconds': np.full(ship_count, np.nan),
+        'voyage': np.full(ship_count, -1, dtype=np.int64)
+    }
+
+
+def track_kinematics(lon, lat, seconds, starts, seed=None, gap_seconds=VOYAGE_GAP_SECONDS):
+    """
+    lon/lat 为按船只、时间排序后拼接的坐标数组，seconds 为对应的时间戳秒数（缺失为NaN，
+    没有时间字段时为None），starts 为每条船第一个点的下标（升序，首个为0）
+    seed 为各船已有轨迹的最后一个点（见 empty_seed），用于增量计算新数据的第一个点
+    返回 (各列数组, 各船合计)：
+    新航次的第一个点以及时间缺失的点不计入距离，航速和航向为NaN
+    合计包括距离 distance_km、航行时间 moving_seconds、最大航速 max_sog 和航次数 voyage_count
+    """
+    count = len(lon)
+    starts = np.asarray(starts, dtype=np.int64)
+    if seed is None:
+        seed = empty_seed(len(starts))
+
+    prev_lon = np.empty(count)
+    prev_lat = np.empty(count)
+    prev_lon[1:], prev_lat[1:] = lon[:-1], lat[:-1]
+    prev_lon[starts], prev_lat[starts] = seed['lon'], seed['lat']
+    has_prev = np.ones(count, dtype=bool)
+    has_prev[starts] = seed['voyage'] >= 0
+
+    if seconds is not None:
+        prev_seconds = np.empty(count)
+        prev_seconds[1:] = seconds[:-1]
+        prev_seconds[starts] = seed['seconds']
+        dt = seconds - prev_seconds
+        # NaN参与比较的结果为False，时间缺失时不切分航次
+        gap = has_prev & (dt > gap_seconds)
+        linked = has_prev & ~gap & ~np.isnan(dt)
+    else:
+        dt = None
+        gap = np.zeros(count, dtype=bool)
+        linked = has_prev
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        segment = np.where(linked, haversine_km(prev_lon, prev_lat, lon, lat), 0.0)
+        cog = np.where(linked & (segment > 0), initial_bearing(prev_lon, prev_lat, lon, lat), np.nan)
+        if dt is not None:
+            moving = linked & (dt > 0)
+            sog = np.where(moving, segment / KM_PER_NAUTICAL_MILE / (dt / 3600.0), np.nan)
+            moving_seconds = np.where(moving, dt, 0.0)
+        else:
+            sog = np.full(count, np.nan)
+            moving_seconds = np.zeros(count)
+
+    # 航次序号：接续已有航次，船内每遇到一次长间隔加一
+    counts = np.diff(np.append(starts, count))
+    flags = gap.astype(np.int64)
+    cumulative = np.cumsum(flags)
+    offset = cumulative[starts] - flags[starts]
+    base = np.maximum(seed['voyage'], 0)
+    voyage = cumulative - np.repeat(offset - base, counts)
+
+    columns = {
+        'segment_km': np.round(segment, 4),
+        'sog': np.round(sog, 2),
+        'cog': np.round(cog, 1),
+        'voyage': voyage
+    }
+    if count == 0:
+        totals = {
+            'distance_km': np.zeros(0),
+            'moving_seconds': np.zeros(0),
+            'max_sog': np.zeros(0),
+            'voyage_count': np.zeros(0, dtype=np.int64)
+        }
+    else:
+        totals = {
+            'distance_km': np.add.reduceat(segment, starts),
+            'moving_seconds': np.add.reduceat(moving_seconds, starts),
+            'max_sog': np.fmax.reduceat(sog, starts),
+            'voyage_count': voyage[np.append(starts[1:], count) - 1] + 1
+        }
+    return columns, totals
+
+
+def time_seconds(values):
+    """datetime64数组转换为秒数，NaT为NaN"""
+    values = np.asarray(values, dtype='datetime64[ns]')
+    seconds = values.view(np.int64) / 1e9
+    seconds[np.isnat(values)] = np.nan
+    return seconds
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+延迟导入
+pandas/numpy 等导入较慢的依赖先以占位对象绑定到模块中，首次访问属性时才真正导入，
+健康检查等不处理数据的接口无需等待这些依赖加载；服务启动后由后台线程提前导入
+"""
+
+import threading
+import importlib
+
+_lock = threading.Lock()
+_pending = []
+
+
+class LazyModule:
+    """模块的占位对象，首次访问属性时导入真实模块，并把调用方模块中的名字替换为真实模块"""
+
+    def __init__(self, name, namespace, alias):
+        self._name = name
+        self._namespace = namespace
+        self._alias = alias
+
+    def load(self):
+        # 导入由解释器的模块锁保证只执行一次，并发访问的线程等待导入完成
+        module = importlib.import_module(self._name)
+        if self._namespace.get(self._alias) is self:
+            self._namespace[self._alias] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name, namespace, alias):
+    """返回 name 模块的占位对象，namespace 为调用方的 globals()，alias 为绑定的名字"""
+    module = LazyModule(name, namespace, alias)
+    with _lock:
+        _pending.append(module)
+    return module
+
+
+def load_all():
+    """导入所有尚未导入的延迟模块"""
+    with _lock:
+        modules = list(_pending)
+        _pending.clear()
+    for module in modules:
+        module.load()
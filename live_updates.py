@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+实时推送
+把文件追加或新上传产生的增量船位通过 Server-Sent Events 推送给订阅的客户端，
+一次读取的结果序列化一次后分发给所有订阅者
+"""
+
+import json
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger('ship-live-updates')
+
+# 订阅所有文件上传事件使用的频道
+GLOBAL_CHANNEL = '*'
+
+
+class Subscription:
+    """单个客户端的订阅，消息按顺序放入有界队列"""
+
+    def __init__(self, channel, max_queue):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=max_queue)
+        # 多个线程可能同时发布，放入和清空积压必须互斥，否则清空后放入resync前队列可能又被填满
+        self._lock = threading.Lock()
+
+    def put(self, message):
+        with self._lock:
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                # 客户端消费太慢，丢弃积压消息并通知其重新全量获取
+                while True:
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self.queue.put_nowait(format_event('resync', {'channel': self.channel}))
+
+
+def format_event(event, payload, event_id=None, dumps=json.dumps):
+    """生成一条SSE消息"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {dumps(payload)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class LiveBroker:
+    """
+    按频道（文件名）管理订阅者
+    有订阅者的文件由后台线程定期检查，检测到变化后由数据集存储的回调发布增量
+    """
+
+    def __init__(self, poll_callback, poll_interval=2.0, heartbeat_interval=15.0,
+                 max_queue=1000, dumps=json.dumps):
+        self._poll_callback = poll_callback
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.max_queue = max_queue
+        self._dumps = dumps
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._watcher = None
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel, self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+            self._ensure_watcher()
+        logger.info("新增订阅: %s，当前订阅数 %d", channel, self.subscriber_count())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return channel in self._subscribers
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, channel, event, payload, event_id=None):
+        """序列化一次后发送给该频道的所有订阅者"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        if not subscribers:
+            return 0
+        message = format_event(event, payload, event_id=event_id, dumps=self._dumps)
+        for subscription in subscribers:
+            subscription.put(message)
+        return len(subscribers)
+
+    def stream(self, subscription, initial=None):
+        """生成SSE响应内容，空闲时发送心跳保持连接"""
+        try:
+            if initial is not None:
+                yield initial
+            while True:
+                try:
+                    yield subscription.queue.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+    # ---------- 文件变化检查 ----------
+
+    def _ensure_watcher(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, name='live-file-watcher', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                # 没有订阅者时退出，下次订阅时重新启动
+                if not self._subscribers:
+                    self._watcher = None
+                    return
+                channels = [channel for channel in self._subscribers if channel != GLOBAL_CHANNEL]
+            for channel in channels:
+                try:
+                    self._poll_callback(channel)
+                except Exception as e:
+                    logger.warning("检查文件 %s 变化失败: %s", channel, e)
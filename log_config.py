@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日志配置
+统一设置日志级别，日志记录通过队列交给后台线程输出，请求线程不等待I/O；
+相同模板的日志按时间窗口限流，避免逐船、逐行日志刷屏
+
+环境变量:
+    LOG_LEVEL         日志级别，默认INFO
+    LOG_ASYNC         是否通过后台线程输出，默认true
+    LOG_RATE_LIMIT    每个时间窗口内同一模板最多输出的条数，默认20，0表示不限流
+    LOG_RATE_WINDOW   限流时间窗口(秒)，默认1
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+import logging
+import logging.handlers
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# 限流状态最多记录的模板数，超过后清空重新计数
+MAX_RATE_KEYS = 10000
+
+_configured = False
+_listener = None
+_lock = threading.Lock()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按 (logger名, 消息模板) 限流，ERROR及以上级别不受限制
+    被抑制的条数会附加在该模板下一条输出的日志后
+    """
+
+    def __init__(self, max_records=20, window=1.0):
+        super().__init__()
+        self.max_records = max_records
+        self.window = window
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def filter(self, record):
+        if self.max_records <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else id(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                if len(self._state) >= MAX_RATE_KEYS:
+                    self._state.clear()
+                state = [now, 0, 0]
+                self._state[key] = state
+            if now - state[0] >= self.window:
+                state[0] = now
+                state[1] = 0
+            if state[1] >= self.max_records:
+                state[2] += 1
+                return False
+            state[1] += 1
+            suppressed = state[2]
+            state[2] = 0
+        if suppressed and isinstance(record.msg, str):
+            record.msg = f"{record.msg} (已抑制 {suppressed} 条同类日志)"
+        return True
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+def configure_logging(level=None):
+    """
+    配置根日志，重复调用只生效一次
+    返回后台输出线程（未启用异步时为None）
+    """
+    global _configured, _listener
+    with _lock:
+        if _configured:
+            return _listener
+
+        level_name = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+        root = logging.getLogger()
+        root.setLevel(getattr(logging, level_name, logging.INFO))
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        rate_filter = RateLimitFilter(
+            max_records=int(os.environ.get('LOG_RATE_LIMIT', '20')),
+            window=float(os.environ.get('LOG_RATE_WINDOW', '1'))
+        )
+
+        if _env_bool('LOG_ASYNC', True):
+            log_queue = queue.Queue(-1)
+            queue_handler = logging.handlers.QueueHandler(log_queue)
+            # 在进入队列前限流，被抑制的日志不会被格式化
+            queue_handler.addFilter(rate_filter)
+            root.addHandler(queue_handler)
+            _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+            _listener.start()
+            atexit.register(_listener.stop)
+        else:
+            stream_handler.addFilter(rate_filter)
+            root.addHandler(stream_handler)
+
+        _configured = True
+        return _listener
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+运行指标
+记录请求和处理阶段（解析、编码尝试、标准化、分组、序列化）的耗时、缓存命中和内存占用，
+以Prometheus文本格式输出，并为每个请求生成Server-Timing响应头
+"""
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# 耗时直方图的分桶上限(秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_local = threading.local()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ''
+    parts = []
+    for name, value in key:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+class MetricsRegistry:
+    """线程安全的计数器、仪表和直方图集合"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def describe(self, name, metric_type, help_text):
+        self._types[name] = metric_type
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def add_gauge(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def get_gauge(self, name, **labels):
+        with self._lock:
+            return self._gauges.get((name, _label_key(labels)), 0)
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+                self._histograms[key] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram['buckets'][index] += 1
+
+    def add_collector(self, callback):
+        """注册在输出前调用的回调，用于刷新按需计算的仪表（内存、缓存大小等）"""
+        self._collectors.append(callback)
+
+    def render_prometheus(self):
+        """输出Prometheus文本格式"""
+        for callback in self._collectors:
+            callback(self)
+
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: {'buckets': list(value['buckets']), 'count': value['count'], 'sum': value['sum']}
+                          for key, value in self._histograms.items()}
+
+        lines = []
+        described = set()
+
+        def header(name, default_type):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {self._types.get(name, default_type)}")
+
+        for (name, key), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), value in sorted(gauges.items()):
+            header(name, 'gauge')
+            lines.append(f"{name}{_format_labels(key)} {value}")
+        for (name, key), histogram in sorted(histograms.items()):
+            header(name, 'histogram')
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                bucket_key = key + (('le', repr(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_key)} {count}")
+            lines.append(f"{name}_bucket{_format_labels(key + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+# 全局指标注册表
+registry = MetricsRegistry()
+registry.describe('ship_stage_duration_seconds', 'histogram', '数据处理各阶段耗时')
+registry.describe('ship_http_request_duration_seconds', 'histogram', '请求处理耗时')
+registry.describe('ship_http_requests_total', 'counter', '请求数')
+registry.describe('ship_http_response_bytes_total', 'counter', '响应字节数')
+registry.describe('ship_dataset_cache_total', 'counter', '数据集缓存结果：hit命中，append增量读取，full全量读取')
+registry.describe('ship_dataset_evictions_total', 'counter', '超出数据集缓存上限被丢弃的数据集数：count数量上限，bytes内存上限')
+registry.describe('ship_encoding_attempts_total', 'counter', 'CSV/TXT编码尝试次数')
+registry.describe('ship_http_requests_in_flight', 'gauge', '正在处理的请求数')
+registry.describe('process_resident_memory_bytes', 'gauge', '进程常驻内存')
+registry.describe('process_peak_resident_memory_bytes', 'gauge', '进程峰值常驻内存')
+registry.describe('process_uptime_seconds', 'gauge', '进程运行时间')
+
+
+# ---------- 单个请求的阶段耗时 ----------
+
+def begin_request():
+    """开始收集当前线程上请求的阶段耗时"""
+    _local.stages = []
+    _local.started = time.perf_counter()
+
+
+def end_request():
+    """结束收集，返回 (阶段耗时列表, 请求总耗时秒)"""
+    stages = getattr(_local, 'stages', None) or []
+    started = getattr(_local, 'started', None)
+    _local.stages = None
+    _local.started = None
+    total = time.perf_counter() - started if started is not None else 0.0
+    return stages, total
+
+
+def record_stage(name, seconds):
+    """记录一个阶段耗时，同时写入当前请求（如有）和全局直方图"""
+    registry.observe('ship_stage_duration_seconds', seconds, stage=name)
+    stages = getattr(_local, 'stages', None)
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """计时上下文：with stage('parse'): ..."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def server_timing_header(stages, total):
+    """把阶段耗时合并为Server-Timing头，同名阶段累加"""
+    merged = {}
+    for name, seconds in stages:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ', '.join(parts)
+
+
+# ---------- 内存 ----------
+
+def memory_usage():
+    """返回 (当前常驻内存字节, 峰值常驻内存字节)，无法获取时为None"""
+    current = None
+    peak = None
+    try:
+        with open('/proc/self/statm') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux单位为KB，macOS为字节
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        pass
+    return current, peak
+
+
+def _collect_process(metrics):
+    current, peak = memory_usage()
+    if current is not None:
+        metrics.set_gauge('process_resident_memory_bytes', current)
+    if peak is not None:
+        metrics.set_gauge('process_peak_resident_memory_bytes', peak)
+    metrics.set_gauge('process_uptime_seconds', round(time.time() - metrics.started_at, 3))
+
+
+registry.add_collector(_collect_process)
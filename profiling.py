@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请求性能分析
+按需用cProfile和tracemalloc记录单个请求的函数耗时和内存分配位置，
+结果写入有数量上限的目录，便于在线上定位处理缓慢的文件
+"""
+
+import io
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import logging
+from datetime import datetime
+
+logger = logging.getLogger('ship-profiling')
+
+# 报告中列出的函数和内存分配位置数量
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# tracemalloc记录的调用栈深度
+TRACEMALLOC_FRAMES = 10
+
+
+class ProfileSession:
+    """单个请求的分析会话"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.started = time.perf_counter()
+        self.started_at = datetime.now()
+
+
+class RequestProfiler:
+    """
+    请求分析器
+    enabled 为True时分析所有请求；否则只分析带 profile=1 参数且令牌正确的请求，
+    未配置令牌时不接受按请求开启
+    """
+
+    def __init__(self, output_dir, enabled=False, token='', max_profiles=50):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.token = token
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._tracing_sessions = 0
+        self._started_tracemalloc = False
+
+    def authorized(self, args, headers):
+        """未配置令牌时只有全局开启才允许访问分析结果"""
+        if not self.token:
+            return self.enabled
+        return args.get('profile_token') == self.token or headers.get('X-Profile-Token') == self.token
+
+    def wants_profile(self, args, headers):
+        if self.enabled:
+            return True
+        if not self.token or args.get('profile') not in ('1', 'true'):
+            return False
+        return self.authorized(args, headers)
+
+    def start(self):
+        session = ProfileSession()
+        with self._lock:
+            # tracemalloc是进程级的，多个并发会话共用一次开启
+            if self._tracing_sessions == 0:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    self._started_tracemalloc = True
+                elif hasattr(tracemalloc, 'reset_peak'):
+                    tracemalloc.reset_peak()
+            self._tracing_sessions += 1
+        session.profile.enable()
+        return session
+
+    def finish(self, session, meta):
+        """结束会话并写出分析结果，返回分析ID"""
+        session.profile.disable()
+        duration = time.perf_counter() - session.started
+        snapshot = None
+        peak = None
+        with self._lock:
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+            self._tracing_sessions -= 1
+            if self._tracing_sessions == 0 and self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+        endpoint = re.sub(r'[^A-Za-z0-9]+', '_', meta.get('endpoint') or 'request').strip('_') or 'request'
+        profile_id = f"{session.started_at.strftime('%Y%m%d_%H%M%S_%f')}_{endpoint}"
+        meta = dict(meta)
+        meta.update({
+            'id': profile_id,
+            'started_at': session.started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'traced_peak_bytes': peak
+        })
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        base = os.path.join(self.output_dir, profile_id)
+        session.profile.dump_stats(base + '.prof')
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(self._render_report(session.profile, snapshot, meta))
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        self._prune()
+        logger.info("已保存请求分析 %s，耗时 %s ms", profile_id, meta['duration_ms'])
+        return profile_id
+
+    def _render_report(self, profile, snapshot, meta):
+        out = io.StringIO()
+        out.write(f"请求: {meta.get('method')} {meta.get('path')}\n")
+        out.write(f"状态: {meta.get('status')}，耗时: {meta['duration_ms']} ms，"
+                  f"tracemalloc峰值: {meta['traced_peak_bytes']} 字节\n\n")
+        out.write(f"===== 累计耗时最高的 {TOP_FUNCTIONS} 个函数 =====\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        if snapshot is not None:
+            out.write(f"\n===== 内存分配最多的 {TOP_ALLOCATIONS} 个位置 =====\n")
+            out.write("（tracemalloc为进程级，并发请求的分配也会计入）\n")
+            snapshot = snapshot.filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ))
+            for index, statistic in enumerate(snapshot.statistics('lineno')[:TOP_ALLOCATIONS], 1):
+                out.write(f"{index:>3}. {statistic}\n")
+        return out.getvalue()
+
+    def _prune(self):
+        """只保留最新的 max_profiles 份分析结果"""
+        profiles = self.list_profiles()
+        for meta in profiles[self.max_profiles:]:
+            for ext in ('.prof', '.txt', '.json'):
+                try:
+                    os.remove(os.path.join(self.output_dir, meta['id'] + ext))
+                except OSError:
+                    pass
+
+    def list_profiles(self):
+        """按时间倒序列出已保存的分析结果"""
+        if not os.path.isdir(self.output_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.output_dir, name), encoding='utf-8') as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        profiles.sort(key=lambda meta: meta.get('id', ''), reverse=True)
+        return profiles
+
+    def profile_path(self, profile_id, ext):
+        """返回分析文件路径，ID不合法或文件不存在时返回None"""
+        if not re.fullmatch(r'[A-Za-z0-9_]+', profile_id or ''):
+            return None
+        path = os.path.join(self.output_dir, profile_id + ext)
+        return path if os.path.exists(path) else None
@@ -9,20 +9,21 @@ import os
 import sys
 import logging
 import time
-from wsgiref.simple_server import make_server
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer
 import werkzeug.serving
+from log_config import configure_logging
 
-# 配置详细日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# 配置日志：级别由 LOG_LEVEL 控制，通过后台线程异步输出
+configure_logging()
 
 logger = logging.getLogger('ship-visualizer-server-stable')
 
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """每个请求一个线程，实时推送的长连接不会阻塞其他请求"""
+    daemon_threads = True
+
 def run_stable_server():
     """使用wsgiref服务器稳定运行Flask应用"""
     try:
@@ -32,7 +33,7 @@ def run_stable_server():
         
         # 导入Flask应用
         logger.info("正在导入Flask应用...")
-        from app import app
+        from app import app, start_warmup
         
         # 配置应用
         app.config['DEBUG'] = False
@@ -46,8 +47,11 @@ def run_stable_server():
         logger.info("服务地址: http://0.0.0.0:5000")
         logger.info("=== 按 Ctrl+C 停止服务 ===  ")
         
-        # 使用wsgiref简单服务器
-        server = make_server('0.0.0.0', 5000, app)
+        # 后台预热最近使用的数据集
+        start_warmup()
+        
+        # 使用多线程的wsgiref服务器
+        server = make_server('0.0.0.0', 5000, app, server_class=ThreadingWSGIServer)
         server.serve_forever()
         
     except ImportError as e:
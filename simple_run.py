@@ -4,8 +4,9 @@
 简单启动脚本
 """
 
-from app import app
+from app import app, start_warmup
 
 if __name__ == '__main__':
+    start_warmup()
     # 关闭调试模式和自动重载以提高稳定性
     app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
\ No newline at end of file
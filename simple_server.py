@@ -12,12 +12,12 @@ import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS  # 添加CORS支持
 import logging
+from log_config import configure_logging
+from column_mapping import resolve_mapping, read_csv_header, read_csv_mapped
+from direct_reader import DirectFileReader, DirectReadError
 
-# 配置日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志：级别由 LOG_LEVEL 控制，通过后台线程异步输出
+configure_logging()
 logger = logging.getLogger('simple-server')
 
 # 创建Flask应用
@@ -27,10 +27,15 @@ CORS(app)  # 启用CORS，允许跨域请求
 # 配置
 app.config['DEBUG'] = True
 
+# 允许直接读取的目录，多个目录用系统路径分隔符分隔；
+# 配置后只能读取这些目录中的文件，并通过内存映射按行范围读取
+READ_FILE_ALLOWED_DIRS = [path for path in os.environ.get('READ_FILE_ALLOWED_DIRS', '').split(os.pathsep) if path]
+direct_reader = DirectFileReader(READ_FILE_ALLOWED_DIRS)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查接口"""
-    logger.info("接收到健康检查请求")
+    logger.debug("接收到健康检查请求")
     return jsonify({
         "status": "healthy",
         "message": "简化版船舶可视化后端服务运行正常",
@@ -50,64 +55,74 @@ def extract_ship_id(name):
         return f"SHIP_{name[:10].upper().replace(' ', '_')}"
     return f"SHIP_{hash(str(name)) % 10000}"
 
-def process_csv_data(df):
-    """处理CSV数据生成轨迹信息"""
+# 每条轨迹最多返回的点数
+MAX_TRACK_POINTS = 1000
+
+def build_points(lat, lon, times, rows):
+    """按行号从数组中取出轨迹点"""
+    return [
+        {'lat': point_lat, 'lng': point_lon, 'time': str(point_time)}
+        for point_lat, point_lon, point_time in zip(lat[rows].tolist(), lon[rows].tolist(), times[rows])
+    ]
+
+def process_csv_data(df, mapping=None):
+    """处理CSV数据生成轨迹信息，mapping 为表头解析出的字段映射"""
     try:
-        logger.info(f"开始处理CSV数据，共{len(df)}行")
+        logger.debug("开始处理CSV数据，共%d行", len(df))
         
         # 确保数据有必要的列
-        required_columns = ['Latitude', 'Longitude', 'MMSI', 'BaseDateTime']
-        available_columns = [col for col in required_columns if col in df.columns]
+        if mapping is None:
+            mapping = resolve_mapping(df.columns)
+        if not mapping.has_coordinates:
+            raise ValueError(f"CSV文件缺少必要的坐标列，可用列: {list(df.columns)}")
         
-        if len(available_columns) < 2:
-            raise ValueError(f"CSV文件缺少必要的坐标列，可用列: {available_columns}")
+        # 统一为标准字段名
+        df = df.rename(columns=mapping.rename)
+        df['lat'] = pd.to_numeric(df['lat'], errors='coerce')
+        df['lon'] = pd.to_numeric(df['lon'], errors='coerce')
         
         # 清理数据
-        df = df.dropna(subset=['Latitude', 'Longitude'])
-        df = df[df['Latitude'].between(-90, 90) & df['Longitude'].between(-180, 180)]
+        df = df.dropna(subset=['lat', 'lon'])
+        df = df[df['lat'].between(-90, 90) & df['lon'].between(-180, 180)]
         
         if len(df) == 0:
             raise ValueError("没有有效的坐标数据")
         
-        # 生成轨迹数据
+        # 生成轨迹数据：先按船舶分组得到行号，只为前 MAX_TRACK_POINTS 个点生成输出
         trajectories = []
+        lat = df['lat'].to_numpy(dtype='float64')
+        lon = df['lon'].to_numpy(dtype='float64')
+        if 'postime' in df.columns:
+            times = df['postime'].to_numpy(dtype=object)
+        else:
+            times = np.full(len(df), str(pd.Timestamp.now()), dtype=object)
         
         # 如果有MMSI列，按船舶分组
-        if 'MMSI' in df.columns:
-            for mmsi, group in df.groupby('MMSI'):
-                ship_id = extract_ship_id(mmsi)
-                points = []
-                for _, row in group.iterrows():
-                    point = {
-                        'lat': float(row['Latitude']),
-                        'lng': float(row['Longitude']),
-                        'time': str(row.get('BaseDateTime', pd.Timestamp.now()))
-                    }
-                    points.append(point)
-                
-                if len(points) > 1:  # 只有多点才能形成轨迹
+        if 'mmsi' in df.columns:
+            codes, ship_names = pd.factorize(df['mmsi'], sort=True)
+            order = np.argsort(codes, kind='stable')
+            counts = np.bincount(codes[codes >= 0], minlength=len(ship_names))
+            # 缺失MMSI(-1)排在最前面，跳过这些行
+            start = int((codes < 0).sum())
+            for code, mmsi in enumerate(ship_names):
+                count = int(counts[code])
+                rows = order[start:start + min(count, MAX_TRACK_POINTS)]
+                start += count
+                if count > 1:  # 只有多点才能形成轨迹
                     trajectories.append({
-                        'id': ship_id,
+                        'id': extract_ship_id(mmsi),
                         'name': f"Ship {mmsi}",
-                        'points': points[:1000],  # 限制点数
-                        'point_count': len(points)
+                        'points': build_points(lat, lon, times, rows),
+                        'point_count': count
                     })
         else:
             # 否则作为单条轨迹处理
-            points = []
-            for _, row in df.iterrows():
-                point = {
-                    'lat': float(row['Latitude']),
-                    'lng': float(row['Longitude']),
-                    'time': str(row.get('BaseDateTime', pd.Timestamp.now()))
-                }
-                points.append(point)
-            
+            rows = np.arange(min(len(df), MAX_TRACK_POINTS))
             trajectories.append({
                 'id': 'SINGLE_TRACK',
                 'name': 'Single Ship Track',
-                'points': points[:1000],
-                'point_count': len(points)
+                'points': build_points(lat, lon, times, rows),
+                'point_count': len(df)
             })
         
         statistics = {
@@ -116,29 +131,35 @@ def process_csv_data(df):
             'total_points': sum(t['point_count'] for t in trajectories)
         }
         
-        logger.info(f"数据处理完成，生成{len(trajectories)}条轨迹")
+        logger.info("数据处理完成，共%d行，生成%d条轨迹", len(df), len(trajectories))
         return trajectories, statistics
         
     except Exception as e:
-        logger.error(f"处理CSV数据时出错: {str(e)}")
+        logger.error("处理CSV数据时出错: %s", e)
         raise
 
 @app.route('/api/read-file', methods=['POST'])
 def read_file():
     """直接读取CSV文件"""
     try:
-        logger.info("接收到读取文件请求")
         
         # 检查请求格式
         if not request.is_json:
             logger.error("请求不是JSON格式")
             return jsonify({"error": "请求必须是JSON格式"}), 400
             
-        # 获取文件路径
+        # 获取文件路径和可选的行范围（仅直接读取模式）
         data = request.json
         file_path = data.get('file_path', '')
+        try:
+            start_row = int(data.get('start_row') or 0)
+            max_rows = int(data['max_rows']) if data.get('max_rows') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "start_row和max_rows必须是整数"}), 400
+        if max_rows is not None and max_rows <= 0:
+            return jsonify({"error": "max_rows必须是正整数"}), 400
         
-        logger.info(f"请求读取文件: {file_path}")
+        logger.info("请求读取文件: %s", file_path)
         
         # 验证文件路径
         if not file_path:
@@ -146,6 +167,13 @@ def read_file():
             
         if not file_path.endswith(('.csv', '.txt')):
             return jsonify({"error": "只支持CSV和TXT文件"}), 400
+        
+        # 配置了允许目录时先检查路径，避免泄露目录外文件是否存在
+        if direct_reader.enabled:
+            try:
+                direct_reader.resolve(file_path)
+            except DirectReadError as e:
+                return jsonify(e.to_dict()), e.status
             
         # 检查文件是否存在
         if not os.path.exists(file_path):
@@ -155,30 +183,61 @@ def read_file():
         if not os.access(file_path, os.R_OK):
             return jsonify({"error": f"无权限读取文件: {file_path}"}), 403
         
-        # 尝试多种编码读取文件
+        # 直接读取模式：内存映射并按行索引只解析需要的行
+        if direct_reader.enabled:
+            try:
+                result = direct_reader.read(file_path, start_row, max_rows)
+            except DirectReadError as e:
+                return jsonify(e.to_dict()), e.status
+            # utf-16文件无法按字节切分，继续走下面的整体读取
+            if result is not None:
+                df, mapping, file_info = result
+                if len(df) == 0:
+                    # start_row 已超过文件末尾，返回空的一页
+                    return jsonify({
+                        "trajectories": [],
+                        "statistics": {'total_records': 0, 'ship_count': 0, 'total_points': 0},
+                        "file_info": file_info
+                    })
+                trajectories, statistics = process_csv_data(df, mapping)
+                return jsonify({
+                    "trajectories": trajectories,
+                    "statistics": statistics,
+                    "file_info": file_info
+                })
+        
+        # 尝试多种编码，先只解析表头，能找到经纬度字段时才读取需要的列
         encodings = ['utf-8', 'gbk', 'latin-1', 'utf-16']
         df = None
         used_encoding = None
+        header = None
+        mapping = None
         
         for encoding in encodings:
             try:
-                logger.info(f"尝试用{encoding}编码读取文件")
-                df = pd.read_csv(file_path, encoding=encoding)
+                header = read_csv_header(file_path, encoding)
+                mapping = resolve_mapping(header)
+                if not mapping.has_coordinates:
+                    logger.debug("%s编码的表头中没有经纬度字段，尝试下一种", encoding)
+                    continue
+                df = read_csv_mapped(file_path, encoding, mapping)
                 used_encoding = encoding
-                logger.info(f"成功以{encoding}编码读取文件，共{len(df)}行")
+                logger.debug("成功以%s编码读取文件，共%d行", encoding, len(df))
                 break
             except UnicodeDecodeError:
-                logger.warning(f"{encoding}编码读取失败，尝试下一种")
+                logger.debug("%s编码读取失败，尝试下一种", encoding)
                 continue
             except Exception as e:
-                logger.warning(f"读取文件时出错({encoding}): {str(e)}")
+                logger.warning("读取文件时出错(%s): %s", encoding, e)
                 continue
         
         if df is None:
+            if mapping is not None and not mapping.has_coordinates:
+                return jsonify({"error": f"CSV文件缺少必要的坐标列，可用列: {header}"}), 400
             return jsonify({"error": "无法解析CSV文件，尝试了多种编码"}), 400
         
         # 处理数据
-        trajectories, statistics = process_csv_data(df)
+        trajectories, statistics = process_csv_data(df, mapping)
         
         # 返回结果
         return jsonify({
@@ -188,12 +247,12 @@ def read_file():
                 "path": file_path,
                 "encoding": used_encoding,
                 "rows": len(df),
-                "columns": list(df.columns)
+                "columns": header
             }
         })
         
     except Exception as e:
-        logger.error(f"读取文件错误: {str(e)}", exc_info=True)
+        logger.error("读取文件错误: %s", e, exc_info=True)
         return jsonify({"error": f"读取文件失败: {str(e)}"}), 500
 
 if __name__ == '__main__':
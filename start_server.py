@@ -10,15 +10,10 @@ import sys
 import logging
 import time
 from datetime import datetime
+from log_config import configure_logging
 
-# 配置详细日志
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler()
-    ]
-)
+# 配置日志：级别由 LOG_LEVEL 控制，通过后台线程异步输出
+configure_logging()
 
 logger = logging.getLogger('ship-visualizer-server')
 
@@ -31,7 +26,7 @@ def start_server():
         
         # 导入Flask应用
         logger.info("正在导入Flask应用...")
-        from app import app
+        from app import app, start_warmup
         
         # 配置应用 - 关闭调试模式以提高稳定性
         app.config['DEBUG'] = False
@@ -46,6 +41,9 @@ def start_server():
         logger.info("调试模式: 已禁用")
         logger.info("=== 按 Ctrl+C 停止服务 ===  ")
         
+        # 后台预热最近使用的数据集
+        start_warmup()
+        
         # 启动Flask服务，关闭调试模式并禁用自动重载以提高稳定性
         app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
         
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试公共设置：使用临时上传目录和独立的数据集缓存，关闭启动预热"""
+
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('STARTUP_WARMUP', 'False')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from data_store import DatasetStore  # noqa: E402
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """每个测试使用空的上传目录和数据集缓存"""
+    folder = tmp_path / 'uploads'
+    folder.mkdir()
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(folder))
+    monkeypatch.setattr(app_module, 'dataset_store', DatasetStore())
+    return folder
+
+
+@pytest.fixture
+def client(upload_dir):
+    return app_module.app.test_client()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""增量同步和轨迹点分页游标：格式错误返回400，属于旧的全量读取时重新同步"""
+
+import pytest
+
+from data_store import encode_page_cursor
+
+HEADER = 'mmsi,lon,lat,postime\n'
+
+
+def write_points(path, count, mmsi=100):
+    path.write_text(HEADER + ''.join(f'{mmsi},120.{minute:02d},30.0,2024-01-01 00:{minute:02d}:00\n'
+                                     for minute in range(count)))
+
+
+@pytest.mark.parametrize('cursor', ['garbage', 'abc.def'])
+def test_malformed_delta_cursor(client, upload_dir, cursor):
+    write_points(upload_dir / 'live.csv', 3)
+    response = client.get(f'/api/data/live.csv/delta?cursor={cursor}')
+    assert response.status_code == 400
+    assert response.get_json()['cursor'] == cursor
+
+
+# 不是base64的JSON、元素个数不对、行号不是整数、时间超出范围
+@pytest.mark.parametrize('cursor', ['garbage', encode_page_cursor(['a']), encode_page_cursor([None, 'b']),
+                                    encode_page_cursor([1e300, 1])])
+def test_malformed_points_cursor(client, upload_dir, cursor):
+    write_points(upload_dir / 'live.csv', 3)
+    response = client.get(f'/api/data/live.csv/ship/100/points?cursor={cursor}')
+    assert response.status_code == 400
+
+
+def test_delta_cursor_follows_appends_and_resyncs_after_rewrite(client, upload_dir):
+    path = upload_dir / 'live.csv'
+    write_points(path, 3)
+    first = client.get('/api/data/live.csv/delta').get_json()
+    assert first['new_points'] == 3 and not first['reset']
+
+    with open(path, 'a') as f:
+        f.write('100,120.10,30.0,2024-01-01 00:10:00\n')
+    second = client.get(f"/api/data/live.csv/delta?cursor={first['cursor']}").get_json()
+    assert second['new_points'] == 1 and not second['reset']
+
+    # 文件被改写后旧游标属于上一次全量读取，从头返回并标记重新同步
+    write_points(path, 2, mmsi=200)
+    resync = client.get(f"/api/data/live.csv/delta?cursor={second['cursor']}").get_json()
+    assert resync['reset']
+    assert resync['new_points'] == 2
+    assert list(resync['ship_groups']) == ['200']
+
+    # 行号超出已读取范围的游标同样重新同步
+    generation = resync['cursor'].rsplit('.', 1)[0]
+    assert client.get(f'/api/data/live.csv/delta?cursor={generation}.99').get_json()['reset']
+
+
+def test_points_cursor_pages_through_track(client, upload_dir):
+    write_points(upload_dir / 'live.csv', 5)
+    seen = []
+    cursor = ''
+    while True:
+        page = client.get(f'/api/data/live.csv/ship/100/points?limit=2&cursor={cursor}').get_json()
+        seen.extend(point['lon'] for point in page['data'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [120.0, 120.01, 120.02, 120.03, 120.04]
@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""热力图按时间分桶：带时区数据按数据自身时区分桶并标注"""
+
+from data_store import Dataset
+
+
+def test_time_bucket_uses_dataset_offset(tmp_path):
+    path = tmp_path / 'aware.csv'
+    path.write_text('mmsi,lon,lat,postime\n'
+                    '100,120.0,30.0,2024-01-01T07:30:00+08:00\n'
+                    '100,120.0,30.0,2024-01-01T08:30:00+08:00\n')
+    dataset = Dataset('aware.csv', str(path))
+    dataset.refresh()
+    # 按UTC分桶时两点会落在前后两天
+    cells = dataset.heatmap(1.0, time_bucket='day')['cells']
+    assert cells['time'] == ['2024-01-01T00:00:00+08:00']
+    assert cells['count'] == [2]
+    hours = dataset.heatmap(1.0, time_bucket='hour')['cells']['time']
+    assert hours == ['2024-01-01T07:00:00+08:00', '2024-01-01T08:00:00+08:00']
+    assert dataset.summary()['global_time_range']['start_time'] == '2024-01-01T07:30:00+08:00'
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""追加读取：与全量读取结果一致、未写完的最后一行、文件被截断或改写、迟到的重复点"""
+
+import os
+import time
+
+from data_store import Dataset, OUTPUT_COLUMNS
+
+HEADER = 'mmsi,lon,lat,postime\n'
+
+
+def lines(rows):
+    return ''.join(f"{mmsi},{lon},{lat},{time}\n" for mmsi, lon, lat, time in rows)
+
+
+def point(mmsi, minute):
+    return (mmsi, 120.0 + minute / 100, 30.0 + minute / 100, f'2024-01-01 00:{minute:02d}:00')
+
+
+def append(path, text):
+    with open(path, 'a') as f:
+        f.write(text)
+
+
+def tracks(dataset):
+    return {mmsi_id: ship[OUTPUT_COLUMNS].reset_index(drop=True).to_dict('list')
+            for mmsi_id, ship in dataset.ships.items()}
+
+
+def load(path):
+    dataset = Dataset(os.path.basename(path), str(path))
+    dataset.refresh()
+    return dataset
+
+
+def test_appends_match_full_read(tmp_path):
+    path = tmp_path / 'live.csv'
+    path.write_text(HEADER + lines([point(100, 0), point(200, 1)]))
+    dataset = load(path)
+    # 时间乱序到达、新船只加入
+    for chunk in ([point(100, 5), point(300, 2)], [point(200, 3), point(100, 4)], [point(300, 9)]):
+        append(path, lines(chunk))
+        assert dataset.refresh() is not None
+        assert dataset.last_ingest == 'append'
+
+    fresh = load(path)
+    assert fresh.last_ingest == 'full'
+    assert tracks(dataset) == tracks(fresh)
+    assert dataset.ship_stats == fresh.ship_stats
+    assert dataset.raw_rows == fresh.raw_rows
+
+
+def test_partial_trailing_line_waits_for_newline(tmp_path):
+    path = tmp_path / 'live.csv'
+    path.write_text(HEADER + lines([point(100, 0)]) + '100,120.07,30.0')
+    dataset = load(path)
+    # 刚写入的文件最后一行没有换行，写入方可能还没写完
+    assert len(dataset.frame) == 1
+
+    append(path, '7,2024-01-01 00:07:30\n')
+    new_rows = dataset.refresh()
+    assert dataset.last_ingest == 'append'
+    assert len(new_rows) == 1
+    assert new_rows['lat'].iloc[0] == 30.07
+    assert str(new_rows['postime'].iloc[0]) == '2024-01-01 00:07:30'
+
+
+def test_settled_file_without_trailing_newline_is_read_whole(tmp_path):
+    path = tmp_path / 'static.csv'
+    path.write_text(HEADER + lines([point(100, 0)]) + '100,120.1,30.1,2024-01-01 00:10:00')
+    settled = time.time() - 60
+    os.utime(path, (settled, settled))
+    assert len(load(path).frame) == 2
+
+
+def test_truncated_file_forces_full_reload(tmp_path):
+    path = tmp_path / 'live.csv'
+    path.write_text(HEADER + lines([point(100, minute) for minute in range(5)]))
+    dataset = load(path)
+    generation = dataset.generation
+
+    path.write_text(HEADER + lines([point(100, 0)]))
+    dataset.refresh()
+    assert dataset.last_ingest == 'full'
+    assert dataset.generation != generation
+    assert len(dataset.frame) == 1
+
+
+def test_rewritten_file_forces_full_reload(tmp_path):
+    path = tmp_path / 'live.csv'
+    path.write_text(HEADER + lines([point(100, 0), point(100, 1)]))
+    dataset = load(path)
+    generation = dataset.generation
+
+    # 文件变长但开头的内容变了，不能当作追加
+    path.write_text(HEADER + lines([point(200, 0), point(200, 1), point(200, 2)]))
+    dataset.refresh()
+    assert dataset.last_ingest == 'full'
+    assert dataset.generation != generation
+    assert list(dataset.ships) == ['200']
+
+
+def test_late_duplicates_are_dropped(tmp_path):
+    path = tmp_path / 'live.csv'
+    path.write_text(HEADER + lines([point(100, minute) for minute in range(0, 10, 2)] + [point(200, 5)]))
+    dataset = load(path)
+
+    # 重发的旧点（含本批内部的重复）被丢弃，同一时间不同位置的点和新点保留
+    moved = (100, 121.0, 31.0, '2024-01-01 00:04:00')
+    append(path, lines([point(100, 4), point(100, 4), point(200, 5), moved, point(100, 3), point(100, 12)]))
+    new_rows = dataset.refresh()
+    assert dataset.last_ingest == 'append'
+    assert len(new_rows) == 3
+    assert dataset.duplicate_rows == 3
+    assert len(dataset.ships['100']) == 8
+    assert len(dataset.ships['200']) == 1
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""跨文件轨迹查询：带时区数据的时间范围筛选和合并"""
+
+HEADER = 'mmsi,lon,lat,postime\n'
+
+
+def write_csv(folder, name, rows):
+    (folder / name).write_text(HEADER + ''.join(f"{mmsi},{lon},{lat},{time}\n" for mmsi, lon, lat, time in rows))
+
+
+def track_times(response, mmsi='100'):
+    assert response.status_code == 200, response.get_json()
+    return [point['postime'] for point in response.get_json()['ship_groups'][mmsi]['data']]
+
+
+def test_time_range_on_tz_aware_file(client, upload_dir):
+    write_csv(upload_dir, 'aware.csv', [
+        (100, 120.0, 30.0, '2024-01-01T08:00:00+08:00'),
+        (100, 120.1, 30.1, '2024-01-01T09:00:00+08:00'),
+        (100, 120.2, 30.2, '2024-01-01T10:00:00+08:00'),
+    ])
+    # 不带时区的边界按UTC比较：01:00Z 即 09:00+08:00
+    naive = client.get('/api/query/tracks?files=aware.csv&start_time=2024-01-01T01:00:00')
+    assert len(track_times(naive)) == 2
+    aware = client.get('/api/query/tracks?files=aware.csv'
+                       '&start_time=2024-01-01T09:00:00%2B08:00&end_time=2024-01-01T09:30:00%2B08:00')
+    assert len(track_times(aware)) == 1
+    outside = client.get('/api/query/tracks?files=aware.csv&start_time=2024-01-02T00:00:00')
+    assert outside.status_code == 200
+    assert outside.get_json()['ship_groups'] == {}
+
+
+def test_merge_tz_aware_and_naive_files(client, upload_dir):
+    write_csv(upload_dir, 'aware.csv', [
+        (100, 120.0, 30.0, '2024-01-01T08:00:00+08:00'),
+        (100, 120.2, 30.2, '2024-01-01T10:00:00+08:00'),
+    ])
+    write_csv(upload_dir, 'naive.csv', [
+        (100, 120.1, 30.1, '2024-01-01 01:00:00'),
+        (100, 120.3, 30.3, '2024-01-01 03:00:00'),
+    ])
+    times = track_times(client.get('/api/query/tracks?files=aware.csv,naive.csv'))
+    # 带时区的文件转换为UTC后与不带时区的文件按时间交错合并
+    assert times == [f'Mon, 01 Jan 2024 0{hour}:00:00 GMT' for hour in range(4)]
+
+
+def test_catalog_query_skips_files_outside_recorded_span(client, upload_dir, monkeypatch):
+    import app as app_module
+    write_csv(upload_dir, 'day1.csv', [(100, 120.0, 30.0, '2024-01-01 01:00:00')])
+    write_csv(upload_dir, 'day2.csv', [(100, 120.1, 30.1, '2024-01-02 01:00:00')])
+    assert len(track_times(client.get('/api/query/tracks'))) == 2
+    # 已读取过的文件按记录的时间范围排除，不计入文件数上限，也不再读取
+    monkeypatch.setattr(app_module, 'MAX_QUERY_FILES', 1)
+    monkeypatch.setattr(app_module.dataset_store, 'get', None)
+    response = client.get('/api/query/tracks?start_time=2024-01-03T00:00:00')
+    assert response.status_code == 200
+    assert response.get_json()['ship_groups'] == {}
+    assert client.get('/api/query/tracks').status_code == 400
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""最近使用记录：每次读取都更新顺序，预热后顺序不变"""
+
+import json
+
+import app as app_module
+from data_store import DatasetStore, RECENT_FILENAME
+
+
+def write_files(folder, names):
+    for name in names:
+        (folder / name).write_text('mmsi,lon,lat,postime\n100,120.0,30.0,2024-01-01 00:00:00\n')
+
+
+def test_every_get_updates_order(tmp_path):
+    write_files(tmp_path, ['a.csv', 'b.csv'])
+    store = DatasetStore(cache_dir=str(tmp_path / 'cache'))
+    for name in ['a.csv', 'b.csv', 'a.csv']:
+        store.get(name, str(tmp_path / name))
+    assert store.recent_files() == ['a.csv', 'b.csv']
+    # 新记录的文件立即写盘，已记录文件的顺序变化按间隔写盘
+    saved = json.loads((tmp_path / 'cache' / RECENT_FILENAME).read_text())
+    assert set(saved) == {'a.csv', 'b.csv'}
+
+
+def test_warm_up_keeps_order(tmp_path, upload_dir, monkeypatch):
+    names = ['a.csv', 'b.csv', 'c.csv']
+    write_files(upload_dir, names)
+    cache_dir = str(tmp_path / 'cache')
+    store = DatasetStore(cache_dir=cache_dir)
+    for name in names:
+        store.get(name, str(upload_dir / name))
+    assert store.recent_files() == ['c.csv', 'b.csv', 'a.csv']
+
+    restarted = DatasetStore(cache_dir=cache_dir)
+    monkeypatch.setattr(app_module, 'dataset_store', restarted)
+    monkeypatch.setattr(app_module, 'warmup_state', dict(app_module.warmup_state, loaded=0, failed=0))
+    app_module._warm_up()
+    assert restarted.recent_files() == ['c.csv', 'b.csv', 'a.csv']
+    assert list(restarted._datasets) == ['a.csv', 'b.csv', 'c.csv']
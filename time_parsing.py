@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+时间字段解析
+在少量样本上识别时间格式（固定格式字符串或秒/毫秒时间戳），
+再用识别出的格式对整列做向量化解析，避免pandas逐个元素推断格式
+"""
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy', globals(), 'np')
+pd = lazy_import('pandas', globals(), 'pd')
+
+# 识别格式时使用的样本数
+SAMPLE_SIZE = 200
+
+# 候选格式，按顺序尝试；月/日在前与pandas默认的解析方式一致
+TIME_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d %H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%S.%f',
+    '%Y-%m-%dT%H:%M:%SZ',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+    '%Y-%m-%d %H:%M',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d %H:%M',
+    '%Y%m%d%H%M%S',
+    '%m/%d/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%d/%m/%Y %H:%M',
+    '%Y-%m-%d',
+    '%Y/%m/%d',
+]
+
+# 特殊格式标记
+FORMAT_DATETIME = 'datetime'      # 已是时间类型（如Excel单元格）
+FORMAT_EPOCH_S = 'epoch_s'        # 秒级时间戳
+FORMAT_EPOCH_MS = 'epoch_ms'      # 毫秒级时间戳
+FORMAT_INFER = 'infer'            # 无法识别，交给pandas逐个推断
+
+
+# 时间戳单位对应的纳秒倍数
+EPOCH_SCALES = {FORMAT_EPOCH_S: 10 ** 9, FORMAT_EPOCH_MS: 10 ** 6}
+
+# datetime64[ns]能表示的最大纳秒数
+MAX_EPOCH_NS = 9.2e18
+
+
+def _epoch_to_datetime(series, scale):
+    """
+    秒/毫秒时间戳直接换算为int64纳秒，超出范围或无法解析的为NaT
+    整数值按整数相乘，浮点相乘会丢失精度（如 ...123 毫秒变为 .123000064 秒），只有带小数的值按浮点换算
+    """
+    values = pd.to_numeric(series, errors='coerce')
+    result = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+    limit = MAX_EPOCH_NS / scale
+    if values.dtype.kind in 'iu':
+        numbers = values.to_numpy(dtype='int64')
+        valid = np.abs(numbers) < limit
+        result[valid] = (numbers[valid] * scale).view('datetime64[ns]')
+        return pd.Series(result, index=series.index)
+
+    numbers = values.to_numpy(dtype='float64')
+    valid = np.isfinite(numbers) & (np.abs(numbers) < limit)
+    integral = valid & (numbers == np.floor(numbers))
+    fractional = valid & ~integral
+    result[integral] = (numbers[integral].astype('int64') * scale).view('datetime64[ns]')
+    result[fractional] = np.round(numbers[fractional] * scale).astype('int64').view('datetime64[ns]')
+    return pd.Series(result, index=series.index)
+
+
+def _compact_to_datetime(series):
+    """20240101120000 形式的整数按位拆分后组装，避免先转成字符串"""
+    values = pd.to_numeric(series, errors='coerce')
+    parts = pd.DataFrame({
+        'year': values // 10 ** 10,
+        'month': values // 10 ** 8 % 100,
+        'day': values // 10 ** 6 % 100,
+        'hour': values // 10 ** 4 % 100,
+        'minute': values // 100 % 100,
+        'second': values % 100,
+    })
+    return pd.to_datetime(parts, errors='coerce')
+
+
+def _epoch_format(sample):
+    """按数值位数区分秒、毫秒时间戳和 20240101120000 形式的紧凑格式"""
+    values = pd.to_numeric(sample, errors='coerce').dropna()
+    if len(values) == 0 or len(values) < len(sample):
+        return None
+    magnitude = values.abs().median()
+    if 1e8 <= magnitude < 1e11:
+        return FORMAT_EPOCH_S
+    if 1e11 <= magnitude < 1e13:
+        return FORMAT_EPOCH_MS
+    if 1e13 <= magnitude < 1e14:
+        return '%Y%m%d%H%M%S'
+    return None
+
+
+def _matches(sample, time_format):
+    if time_format in (FORMAT_EPOCH_S, FORMAT_EPOCH_MS):
+        return _epoch_format(sample) == time_format
+    if time_format in (FORMAT_DATETIME, FORMAT_INFER):
+        return False
+    try:
+        if pd.api.types.is_numeric_dtype(sample):
+            sample = sample.astype('Int64').astype(str)
+        return pd.to_datetime(sample, format=time_format, errors='coerce').notna().all()
+    except (TypeError, ValueError):
+        return False
+
+
+def detect_time_format(series, preferred=None):
+    """
+    在前 SAMPLE_SIZE 个非空值上识别时间格式，返回格式字符串或特殊格式标记
+    preferred 为之前识别出的格式，样本符合时直接沿用
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return FORMAT_DATETIME
+    sample = series.dropna().head(SAMPLE_SIZE)
+    if len(sample) == 0:
+        return FORMAT_INFER
+    if preferred is not None and _matches(sample, preferred):
+        return preferred
+    if pd.api.types.is_numeric_dtype(sample):
+        return _epoch_format(sample) or FORMAT_INFER
+
+    sample = sample.astype(str).str.strip()
+    if sample.str.fullmatch(r'\d+(\.\d+)?').all():
+        epoch_format = _epoch_format(sample)
+        if epoch_format is not None:
+            return epoch_format
+    for time_format in TIME_FORMATS:
+        parsed = pd.to_datetime(sample, format=time_format, errors='coerce')
+        if parsed.notna().all():
+            return time_format
+    return FORMAT_INFER
+
+
+def parse_times(series, time_format):
+    """
+    按识别出的格式向量化解析整列，结果为datetime64[ns]（内部即int64纳秒时间戳）
+    个别不符合该格式的值再交给pandas推断，无法解析的为NaT
+    """
+    if time_format == FORMAT_DATETIME:
+        return pd.to_datetime(series, errors='coerce')
+    if time_format in EPOCH_SCALES:
+        return _epoch_to_datetime(series, EPOCH_SCALES[time_format])
+    if time_format == FORMAT_INFER:
+        return pd.to_datetime(series, errors='coerce')
+    if time_format == '%Y%m%d%H%M%S' and pd.api.types.is_numeric_dtype(series):
+        return _compact_to_datetime(series)
+
+    parsed = pd.to_datetime(series, format=time_format, errors='coerce')
+    missed = parsed.isna() & series.notna()
+    if missed.any():
+        parsed[missed] = pd.to_datetime(series[missed], errors='coerce')
+    return parsed